@@ -47,14 +47,32 @@ from .arduino_grove_ear_hr import Grove_EarHR
 from .arduino_grove_finger_hr import Grove_FingerHR
 from .arduino_grove_haptic_motor import Grove_HapticMotor
 from .arduino_grove_th02 import Grove_TH02
+from .arduino_mailbox import Mailbox
+from .arduino_calibration import WheelCalibration
+from .arduino_calibration import MagnetometerCalibration
 from .arduino_automoto import Automoto
 from .arduino_linetracker import LT_sen
 from .arduino_gesture import Gesture_sen
 from .arduino_run_linetracker import Run_LT
+from .arduino_lt_controller import LineFollower
 from .arduino_run_usranger import Run_usranger
+from .arduino_range import RangeSampler
 from .arduino_run_gesture import Run_gesture
+from .arduino_gesture_events import Gesture
+from .arduino_gesture_events import GestureEvents
 from .arduino_10DOF_IMU import TenDOF_IMU
+from .arduino_10DOF_IMU import IMUSample
 from .arduino_run_IMU import RUN_IMU
+from .arduino_sampler import IMUSampler
+from .arduino_car import Car
+from .arduino_scheduler import PollScheduler
+from .arduino_odometry import Odometry
+from .arduino_ahrs import Madgwick
+from .arduino_telemetry import TelemetryRecorder
+from .arduino_telemetry import TelemetryReader
+from .arduino_async import AsyncDriver
+from .arduino_simulator import CarSimulator
+from .arduino_replay import ReplayBackend
 
 
 __author__ = "Graham Schelle, Yun Rock Qu"
@@ -28,8 +28,13 @@
 #   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-import math
-from . import Arduino
+import time
+import numpy as np
+from .arduino_codec import reg2float
+from .arduino_codec import reg2int
+from .arduino_mailbox import open_mailbox
+from .arduino_calibration import MagnetometerCalibration
+from .arduino_calibration import collect_compass
 
 
 __author__ = "Junhong Lin"
@@ -45,51 +50,213 @@ GET_TEMPERATURE = 0xB
 GET_PRESSURE = 0xD
 RESET = 0xF
 
+'''
+The commands read one after another by `snapshot()`, together with the
+number of mailbox words each of them returns (18 words in total).
+'''
+SNAPSHOT_COMMANDS = [(GET_AXIS_DATA, 9), (GET_EUL_DATA, 3), (GET_QUA_DATA, 4),
+                     (GET_TEMPERATURE, 1), (GET_PRESSURE, 1)]
 
-def _reg2float(reg):
-    """Converts 32-bit register value to floats in Python.
+
+def _degrees(y, x, ndigits):
+    angle = np.degrees(np.arctan2(y, x))
+    angle = np.where(y < 0, angle + 360, angle)
+    if ndigits is not None:
+        angle = np.round(angle, ndigits)
+    return angle
+
+
+def _calibrated(axis, calibration):
+    if calibration is None:
+        return np.asarray(axis, dtype=np.float64)
+    return calibration.apply_axis(axis)
+
+
+def headings(axis, ndigits=None, calibration=None):
+    """Computes the headings of a batch of `get_axis` readings.
 
     Parameters
     ----------
-    reg: int
-        A 32-bit register value read from the mailbox.
+    axis : numpy.ndarray
+        An N x 9 array of accelerometer, gyroscope and magnetometer data,
+        e.g. the "axis" field of an IMUSampler window, or a single reading.
+    ndigits : int
+        Number of decimals to round to; `None` keeps full precision.
+    calibration : MagnetometerCalibration
+        The correction of the compass readings, if any.
 
     Returns
     -------
-    float
-        A float number translated from the register value.
+    numpy.ndarray
+        The angles deviated from the X-axis, toward the positive Y-axis,
+        in degrees in [0, 360).
 
     """
-    if reg == 0:
-        return 0.0
-    sign = (reg & 0x80000000) >> 31 & 0x01
-    exp = ((reg & 0x7f800000) >> 23) - 127
-    if exp == 0:
-        man = (reg & 0x007fffff) / pow(2, 23)
-    else:
-        man = 1 + (reg & 0x007fffff) / pow(2, 23)
-    result = pow(2, exp) * man * ((sign * -2) + 1)
-    return float("{0:.2f}".format(result))
+    axis = _calibrated(axis, calibration)
+    return _degrees(axis[..., 7], axis[..., 6], ndigits)
+
 
+def tilt_headings(axis, ndigits=None, calibration=None):
+    """Computes the tilt compensated headings of a batch of readings.
 
-def _reg2int(reg):
-    """Converts 32-bit register value to signed integer in Python.
+    The pitch and roll are derived from the accelerometer, in g. Readings
+    out of the range of the arcsine, e.g. under acceleration, are clamped
+    to a pitch or roll of 90 degrees instead of failing.
 
     Parameters
     ----------
-    reg: int
-        A 32-bit register value read from the mailbox.
+    axis : numpy.ndarray
+        An N x 9 array of accelerometer, gyroscope and magnetometer data,
+        or a single reading.
+    ndigits : int
+        Number of decimals to round to; `None` keeps full precision.
+    calibration : MagnetometerCalibration
+        The correction of the compass readings, if any.
 
     Returns
     -------
-    int
-        A signed integer translated from the register value.
+    numpy.ndarray
+        The tilt compensated headings in degrees in [0, 360).
+
+    """
+    axis = _calibrated(axis, calibration)
+    ax, ay = axis[..., 0], axis[..., 1]
+    mx, my, mz = axis[..., 6], axis[..., 7], axis[..., 8]
+    pitch = np.arcsin(np.clip(-ax, -1.0, 1.0))
+    cos_pitch = np.cos(pitch)
+    sin_pitch = np.sin(pitch)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sin_roll = np.nan_to_num(np.clip(ay / cos_pitch, -1.0, 1.0))
+    cos_roll = np.sqrt(1.0 - sin_roll * sin_roll)
+    xh = mx * cos_pitch + mz * sin_pitch
+    yh = mx * sin_roll * sin_pitch + my * cos_roll - \
+        mz * sin_roll * cos_pitch
+    return _degrees(yh, xh, ndigits)
+
+
+def _heading(axis, calibration=None):
+    """Computes the heading from the get_axis data."""
+    return float(headings(axis, 2, calibration))
+
+
+def _tilt_heading(axis, calibration=None):
+    """Computes the tilt compensated heading from the get_axis data."""
+    return float(tilt_headings(axis, 2, calibration))
+
+
+def _atm(pressure):
+    """Converts the pressure in Pa to relative atmosphere."""
+    return float("{0:.2f}".format(pressure / 101325))
+
+
+def _altitude(pressure):
+    """Converts the pressure in Pa to altitude in meters."""
+    a = pressure / 101325
+    b = 1 / 5.255
+    c = 1 - pow(a, b)
+    altitude = 44300 * c
+    return float("{0:.2f}".format(altitude))
+
+
+def _read_snapshot(mailbox, ndigits, page=None, calibration=None):
+    """Reads all the sensor words and decodes them as one block."""
+    regs = []
+    with mailbox.transaction(page=page):
+        for command, num_words in SNAPSHOT_COMMANDS:
+            data = mailbox.transact(command, num_words=num_words)
+            regs += data if num_words > 1 else [data]
+    timestamp = time.monotonic()
+    values = reg2float(regs[:17], ndigits)
+    return IMUSample(values[0:9], values[9:12], values[12:16], values[16],
+                     reg2int(regs[17]), timestamp, calibration)
+
+
+class IMUSample(object):
+    """This class holds one reading of every sensor on the 10DOF IMU.
+
+    The derived quantities (heading, tilt heading, atm and altitude) are
+    only computed when they are first accessed, and then cached.
+
+    Attributes
+    ----------
+    axis : list
+        The acceleration, gyro and compass data, as returned by `get_axis`.
+    eul : list
+        The euler angle data, as returned by `get_eul`.
+    qua : list
+        The quaternion data, as returned by `get_qua`.
+    temperature : float
+        The temperature in degree C.
+    pressure : int
+        The pressure in Pa.
+    timestamp : float
+        The `time.monotonic()` value when the sample was read.
+    calibration : MagnetometerCalibration
+        The correction of the compass readings used by the headings.
 
     """
-    result = -(reg >> 31 & 0x1) * (1 << 31)
-    for i in range(31):
-        result += (reg >> i & 0x1) * (1 << i)
-    return result
+    def __init__(self, axis, eul, qua, temperature, pressure, timestamp,
+                 calibration=None):
+        """Return a new instance of an IMU sample object.
+
+        Parameters
+        ----------
+        axis : list
+            The 9 values of the accelerometer, gyroscope and magnetometer.
+        eul : list
+            The 3 euler angles.
+        qua : list
+            The 4 quaternion values.
+        temperature : float
+            The temperature in degree C.
+        pressure : int
+            The pressure in Pa.
+        timestamp : float
+            The `time.monotonic()` value when the sample was read.
+        calibration : MagnetometerCalibration
+            The correction of the compass readings, if any.
+
+        """
+        self.axis = axis
+        self.eul = eul
+        self.qua = qua
+        self.temperature = temperature
+        self.pressure = pressure
+        self.timestamp = timestamp
+        self.calibration = calibration
+        self._derived = {}
+
+    def _get_derived(self, name, function, *args):
+        if name not in self._derived:
+            self._derived[name] = function(*args)
+        return self._derived[name]
+
+    @property
+    def heading(self):
+        """The angle deviated from the X-axis, toward the positive Y-axis."""
+        return self._get_derived("heading", _heading, self.axis,
+                                 self.calibration)
+
+    @property
+    def tilt_heading(self):
+        """The tilt heading value."""
+        return self._get_derived("tilt_heading", _tilt_heading, self.axis,
+                                 self.calibration)
+
+    @property
+    def atm(self):
+        """The pressure in relative atmosphere."""
+        return self._get_derived("atm", _atm, self.pressure)
+
+    @property
+    def altitude(self):
+        """The altitude value."""
+        return self._get_derived("altitude", _altitude, self.pressure)
+
+    def __repr__(self):
+        return "IMUSample(axis={}, eul={}, qua={}, temperature={}, " \
+               "pressure={})".format(self.axis, self.eul, self.qua,
+                                     self.temperature, self.pressure)
 
 
 class TenDOF_IMU(object):
@@ -99,6 +266,13 @@ class TenDOF_IMU(object):
     ----------
     microblaze : Arduino
         Microblaze processor instance used by this module.
+    mailbox : Mailbox
+        Serialized access to the mailbox of the Microblaze.
+    ndigits : int
+        Number of decimals the readings are rounded to; set it to `None`
+        to get the full single precision from the sensor.
+    mag_calibration : MagnetometerCalibration
+        The correction of the compass applied by the headings, or None.
         
     """
     def __init__(self, mb_info, channel):
@@ -112,10 +286,13 @@ class TenDOF_IMU(object):
 
         """
 
-        self.microblaze = Arduino(mb_info, ARDUINO_10DOF_IMU_PROGRAM)
-        self.microblaze.write_mailbox(0, channel)
-        self.microblaze.write_blocking_command(CONFIG_IOP_SWITCH)
-        data = self.microblaze.read_mailbox(0, 3)
+        self.ndigits = 2
+        self.mag_calibration = None
+        self.mailbox = open_mailbox(mb_info, ARDUINO_10DOF_IMU_PROGRAM,
+                                    name=type(self).__name__)
+        self.microblaze = self.mailbox.microblaze
+        data = self.mailbox.configure(CONFIG_IOP_SWITCH, channel, 3,
+                                      valid=all)
         
         if not data[0]:
             raise ValueError("I2C Multiplexer failed.")
@@ -134,7 +311,23 @@ class TenDOF_IMU(object):
         None
         
         """
-        self.microblaze.write_blocking_command(RESET)
+        self.mailbox.transact(RESET)
+
+    def snapshot(self):
+        """Read every sensor on the IMU in one go.
+
+        All the sensor words are read back-to-back and decoded as one
+        block; the heading, tilt heading, atm and altitude of the returned
+        sample are derived from it without any further mailbox access.
+
+        Returns
+        -------
+        IMUSample
+            The axis, euler, quaternion, temperature and pressure data.
+
+        """
+        return _read_snapshot(self.mailbox, self.ndigits, None,
+                              self.mag_calibration)
         
     def get_axis(self):
         """Get the data from the accelerometer, gyroscope and magnetometer.
@@ -147,10 +340,8 @@ class TenDOF_IMU(object):
             A list of the compass data along X-axis, Y-axis, and Z-axis.
         
         """
-        self.microblaze.write_blocking_command(GET_AXIS_DATA)
-        data = self.microblaze.read_mailbox(0, 9)
-        [ax, ay, az, gx, gy, gz, mx, my, mz] = [_reg2float(i) for i in data]
-        return [ax, ay, az, gx, gy, gz, mx, my, mz]
+        data = self.mailbox.transact(GET_AXIS_DATA, num_words=9)
+        return reg2float(data, self.ndigits)
         """return [float("{0:.2f}".format(ax / 16384)),
                 float("{0:.2f}".format(ay / 16384)),
                 float("{0:.2f}".format(az / 16384))]
@@ -165,10 +356,8 @@ class TenDOF_IMU(object):
             A list of the euler angle data.
         
         """
-        self.microblaze.write_blocking_command(GET_EUL_DATA)
-        data = self.microblaze.read_mailbox(0, 3)
-        [head, roll, pitch] = [_reg2float(i) for i in data]
-        return [head, roll, pitch]
+        data = self.mailbox.transact(GET_EUL_DATA, num_words=3)
+        return reg2float(data, self.ndigits)
         """return [float("{0:.2f}".format(gx * 250 / 32768)),
                 float("{0:.2f}".format(gy * 250 / 32768)),
                 float("{0:.2f}".format(gz * 250 / 32768))]
@@ -183,15 +372,39 @@ class TenDOF_IMU(object):
             A list of the quaternion data.
         
         """
-        self.microblaze.write_blocking_command(GET_QUA_DATA)
-        data = self.microblaze.read_mailbox(0, 4)
-        [w, x, y, z] = [_reg2float(i) for i in data]
-        return [w, x, y, z]
+        data = self.mailbox.transact(GET_QUA_DATA, num_words=4)
+        return reg2float(data, self.ndigits)
         """return [float("{0:.2f}".format(mx * 1200 / 4096)),
                 float("{0:.2f}".format(my * 1200 / 4096)),
                 float("{0:.2f}".format(mz * 1200 / 4096))]
         """
 
+    def calibrate_magnetometer(self, duration=20.0, rate=50, planar=False):
+        """Calibrate the compass with a rotation sweep.
+
+        The IMU should be turned by hand through as many orientations as
+        possible during the sweep.
+
+        Parameters
+        ----------
+        duration : float
+            Time of the sweep in seconds.
+        rate : float
+            Sampling rate in Hz.
+        planar : bool
+            Whether the IMU is only turned around its Z-axis.
+
+        Returns
+        -------
+        MagnetometerCalibration
+            The fitted calibration, now used by the headings; it can be
+            saved and restored with `load`.
+
+        """
+        samples = collect_compass(self, duration, rate)
+        self.mag_calibration = MagnetometerCalibration.fit(samples, planar)
+        return self.mag_calibration
+
     def get_heading(self):
         """Get the value of the heading.
         
@@ -201,11 +414,7 @@ class TenDOF_IMU(object):
             The angle deviated from the X-axis, toward the positive Y-axis.
         
         """
-        [_, _, _, _, _, _, mx, my, _] = self.get_axis()
-        heading = 180 * math.atan2(my, mx) / math.pi
-        if heading < 0:
-            heading += 360
-        return float("{0:.2f}".format(heading))
+        return _heading(self.get_axis(), self.mag_calibration)
 
     def get_tilt_heading(self):
         """Get the value of the tilt heading.
@@ -216,23 +425,7 @@ class TenDOF_IMU(object):
             The tilt heading value.
         
         """
-        [ax, ay, _, _, _, _, mx, my, mz] = self.get_axis()
-
-        try:
-            pitch = math.asin(-ax)
-            roll = math.asin(ay / math.cos(pitch))
-        except ZeroDivisionError:
-            raise RuntimeError("Value out of range or device not connected.")
-
-        xh = mx * math.cos(pitch) + mz * math.sin(pitch)
-        yh = mx * math.sin(roll) * math.sin(pitch) + \
-            my * math.cos(roll) - mz * math.sin(roll) * math.cos(pitch)
-        _ = -mx * math.cos(roll) * math.sin(pitch) + \
-            my * math.sin(roll) + mz * math.cos(roll) * math.cos(pitch)
-        tilt_heading = 180 * math.atan2(yh, xh) / math.pi
-        if yh < 0:
-            tilt_heading += 360
-        return float("{0:.2f}".format(tilt_heading))
+        return _tilt_heading(self.get_axis(), self.mag_calibration)
         
     def get_temperature(self):
         """Get the current temperature in degree C.
@@ -243,9 +436,8 @@ class TenDOF_IMU(object):
             The temperature value.
         
         """
-        self.microblaze.write_blocking_command(GET_TEMPERATURE)
-        value = self.microblaze.read_mailbox(0)
-        return _reg2float(value)
+        value = self.mailbox.transact(GET_TEMPERATURE, num_words=1)
+        return reg2float(value, self.ndigits)
         
     def get_pressure(self):
         """Get the current pressure in Pa.
@@ -256,9 +448,8 @@ class TenDOF_IMU(object):
             The pressure value.
         
         """
-        self.microblaze.write_blocking_command(GET_PRESSURE)
-        value = self.microblaze.read_mailbox(0)
-        return _reg2int(value)
+        value = self.mailbox.transact(GET_PRESSURE, num_words=1)
+        return reg2int(value)
         
     def get_atm(self):
         """Get the current pressure in relative atmosphere.
@@ -269,7 +460,7 @@ class TenDOF_IMU(object):
             The related atmosphere.
         
         """
-        return float("{0:.2f}".format(self.get_pressure() / 101325))
+        return _atm(self.get_pressure())
         
     def get_altitude(self):
         """Get the current altitude.
@@ -280,9 +471,4 @@ class TenDOF_IMU(object):
             The altitude value.
         
         """
-        pressure = self.get_pressure()
-        a = pressure / 101325
-        b = 1 / 5.255
-        c = 1 - pow(a, b)
-        altitude = 44300 * c
-        return float("{0:.2f}".format(altitude))
+        return _altitude(self.get_pressure())
@@ -0,0 +1,334 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import math
+import time
+import numpy as np
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+The Madgwick filter estimates the orientation from the accelerometer,
+gyroscope and magnetometer values of `get_axis`: the gyroscope rates are
+integrated, and a gradient descent step of size `beta` pulls the result
+toward the orientation in which gravity and the magnetic field point
+where the accelerometer and the magnetometer measured them. Without
+magnetometer data the step only corrects the roll and pitch.
+
+The quaternions are [w, x, y, z] and rotate the car frame into the world
+frame, like `get_qua`, so that `arduino_odometry.quat_yaw` gives the
+heading from magnetic north.
+
+The update below only uses arithmetic, so that it runs on floats for a
+single stream and on arrays for many streams at once.
+'''
+DEG = math.pi / 180
+
+
+def _inv_sqrt(x):
+    return 1.0 / math.sqrt(x) if x > 0 else 0.0
+
+
+def _inv_sqrt_array(x):
+    return np.where(x > 0, 1.0 / np.sqrt(np.where(x > 0, x, 1.0)), 0.0)
+
+
+def _madgwick(q0, q1, q2, q3, ax, ay, az, gx, gy, gz, mx, my, mz, beta,
+              dt, sqrt, inv_sqrt):
+    q_dot0 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+    q_dot1 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+    q_dot2 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+    q_dot3 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+    norm = ax * ax + ay * ay + az * az
+    valid = norm > 0
+    r = inv_sqrt(norm)
+    ax, ay, az = ax * r, ay * r, az * r
+    r = inv_sqrt(mx * mx + my * my + mz * mz)
+    mx, my, mz = mx * r, my * r, mz * r
+
+    q0q0, q0q1, q0q2, q0q3 = q0 * q0, q0 * q1, q0 * q2, q0 * q3
+    q1q1, q1q2, q1q3 = q1 * q1, q1 * q2, q1 * q3
+    q2q2, q2q3, q3q3 = q2 * q2, q2 * q3, q3 * q3
+    _2q0mx, _2q0my, _2q0mz = 2 * q0 * mx, 2 * q0 * my, 2 * q0 * mz
+    _2q1mx = 2 * q1 * mx
+    _2q0, _2q1, _2q2, _2q3 = 2 * q0, 2 * q1, 2 * q2, 2 * q3
+
+    # Direction of the magnetic field in the world frame.
+    hx = mx * q0q0 - _2q0my * q3 + _2q0mz * q2 + mx * q1q1 + \
+        _2q1 * my * q2 + _2q1 * mz * q3 - mx * q2q2 - mx * q3q3
+    hy = _2q0mx * q3 + my * q0q0 - _2q0mz * q1 + _2q1mx * q2 - \
+        my * q1q1 + my * q2q2 + _2q2 * mz * q3 - my * q3q3
+    _2bx = sqrt(hx * hx + hy * hy)
+    _2bz = -_2q0mx * q2 + _2q0my * q1 + mz * q0q0 + _2q1mx * q3 - \
+        mz * q1q1 + _2q2 * my * q3 - mz * q2q2 + mz * q3q3
+    _4bx, _4bz = 2 * _2bx, 2 * _2bz
+
+    # Errors of the predicted gravity and magnetic field directions.
+    fx = 2 * q1q3 - 2 * q0q2 - ax
+    fy = 2 * q0q1 + 2 * q2q3 - ay
+    fz = 1 - 2 * q1q1 - 2 * q2q2 - az
+    bx = _2bx * (0.5 - q2q2 - q3q3) + _2bz * (q1q3 - q0q2) - mx
+    by = _2bx * (q1q2 - q0q3) + _2bz * (q0q1 + q2q3) - my
+    bz = _2bx * (q0q2 + q1q3) + _2bz * (0.5 - q1q1 - q2q2) - mz
+
+    # Gradient of the errors.
+    s0 = -_2q2 * fx + _2q1 * fy - _2bz * q2 * bx + \
+        (-_2bx * q3 + _2bz * q1) * by + _2bx * q2 * bz
+    s1 = _2q3 * fx + _2q0 * fy - 4 * q1 * fz + _2bz * q3 * bx + \
+        (_2bx * q2 + _2bz * q0) * by + (_2bx * q3 - _4bz * q1) * bz
+    s2 = -_2q0 * fx + _2q3 * fy - 4 * q2 * fz + \
+        (-_4bx * q2 - _2bz * q0) * bx + (_2bx * q1 + _2bz * q3) * by + \
+        (_2bx * q0 - _4bz * q2) * bz
+    s3 = _2q1 * fx + _2q2 * fy + (-_4bx * q3 + _2bz * q1) * bx + \
+        (-_2bx * q0 + _2bz * q2) * by + _2bx * q1 * bz
+    r = inv_sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3) * beta * valid
+
+    q0 = q0 + (q_dot0 - s0 * r) * dt
+    q1 = q1 + (q_dot1 - s1 * r) * dt
+    q2 = q2 + (q_dot2 - s2 * r) * dt
+    q3 = q3 + (q_dot3 - s3 * r) * dt
+    r = inv_sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+    return q0 * r, q1 * r, q2 * r, q3 * r
+
+
+class Madgwick(object):
+    """This class fuses the get_axis data into an orientation.
+
+    It runs the Madgwick AHRS filter on the raw accelerometer, gyroscope
+    and magnetometer values, so that the orientation is updated with a
+    single mailbox read per sample and can be tuned with `beta`, instead
+    of reading the quaternion computed by the firmware.
+
+    Samples are fed one at a time with `update` or `poll`, or a whole log
+    at once with `batch`. Several independent streams, e.g. the same log
+    filtered with different gains, can be filtered together: with
+    `streams` set, the samples and the quaternions get a leading streams
+    axis and every step is computed with NumPy over all of them.
+
+    Attributes
+    ----------
+    beta : float/numpy.ndarray
+        Gain of the correction, in rad/s; larger values trust the
+        accelerometer and the magnetometer more than the gyroscope.
+    period : float
+        Default time between two samples, in seconds.
+    gyro_scale : float
+        Factor converting the gyroscope values into rad/s.
+    streams : int
+        Number of streams filtered together, or None for a single one.
+    q : numpy.ndarray
+        The current orientation, of shape (4,) or (streams, 4).
+    timestamp : float
+        The timestamp of the last sample, or None.
+
+    """
+    def __init__(self, beta=0.1, rate=100, gyro_scale=DEG, streams=None):
+        """Return a new instance of a Madgwick filter object.
+
+        Parameters
+        ----------
+        beta : float/list
+            Gain of the correction, in rad/s; one per stream if needed.
+        rate : float
+            Sampling rate in Hz used when no timestamp is given.
+        gyro_scale : float
+            Factor converting the gyroscope values into rad/s; the IMU
+            reports them in deg/s.
+        streams : int
+            Number of streams filtered together.
+
+        """
+        if rate <= 0:
+            raise ValueError("sampling rate should be positive.")
+        self.beta = beta if streams is None \
+            else np.broadcast_to(np.asarray(beta, dtype=np.float64),
+                                 (streams,))
+        self.period = 1.0 / rate
+        self.gyro_scale = gyro_scale
+        self.streams = streams
+        self.reset()
+
+    def reset(self, q=None):
+        """Set the orientation.
+
+        Parameters
+        ----------
+        q : list
+            The orientation to start from; the identity by default.
+
+        Returns
+        -------
+        None
+
+        """
+        if q is None:
+            q = [1.0, 0.0, 0.0, 0.0]
+        shape = (4,) if self.streams is None else (self.streams, 4)
+        self.q = np.array(np.broadcast_to(np.asarray(q, dtype=np.float64),
+                                          shape))
+        self.timestamp = None
+
+    def update(self, axis, timestamp=None, dt=None):
+        """Update the orientation with one sample.
+
+        Parameters
+        ----------
+        axis : list
+            The 9 values of `get_axis`, or one set per stream.
+        timestamp : float
+            When the sample was taken, in seconds; the time step is the
+            time since the previous sample.
+        dt : float
+            The time step, in seconds; `period` when neither the time
+            step nor the timestamps are given.
+
+        Returns
+        -------
+        numpy.ndarray
+            The orientation quaternion.
+
+        """
+        if dt is None:
+            if timestamp is not None and self.timestamp is not None:
+                dt = timestamp - self.timestamp
+            else:
+                dt = self.period
+        if timestamp is not None:
+            self.timestamp = timestamp
+        if self.streams is None:
+            a = [float(v) for v in axis]
+            q = _madgwick(*self.q.tolist(), a[0], a[1], a[2],
+                          a[3] * self.gyro_scale, a[4] * self.gyro_scale,
+                          a[5] * self.gyro_scale, a[6], a[7], a[8],
+                          self.beta, dt, math.sqrt, _inv_sqrt)
+        else:
+            a = np.asarray(axis, dtype=np.float64).T
+            q = _madgwick(*self.q.T, a[0], a[1], a[2],
+                          a[3] * self.gyro_scale, a[4] * self.gyro_scale,
+                          a[5] * self.gyro_scale, a[6], a[7], a[8],
+                          self.beta, dt, np.sqrt, _inv_sqrt_array)
+        self.q = np.stack(q, axis=-1)
+        return self.q
+
+    def poll(self, imu):
+        """Read the raw data of an IMU and update the orientation.
+
+        The compass readings are corrected with the `mag_calibration` of
+        the IMU, if any.
+
+        Parameters
+        ----------
+        imu : TenDOF_IMU/RUN_IMU
+            The IMU driver.
+
+        Returns
+        -------
+        numpy.ndarray
+            The orientation quaternion.
+
+        """
+        axis = imu.get_axis()
+        timestamp = time.monotonic()
+        calibration = getattr(imu, "mag_calibration", None)
+        if calibration is not None:
+            axis = calibration.apply_axis(axis)
+        return self.update(axis, timestamp)
+
+    def batch(self, axis, timestamps=None, calibration=None):
+        """Filter a log of samples.
+
+        The filter continues from its current orientation, which is left
+        at the one of the last sample. Like `poll`, pass the
+        `mag_calibration` of the IMU the log was read from, so that the
+        compass readings are corrected; raw readings are filtered as they
+        are otherwise.
+
+        Parameters
+        ----------
+        axis : numpy.ndarray
+            The N samples of `get_axis`, of shape (N, 9), or
+            (N, streams, 9) when filtering several streams.
+        timestamps : numpy.ndarray
+            The N timestamps of the samples, in seconds; the samples are
+            `period` apart when not given.
+        calibration : MagnetometerCalibration
+            The calibration of the compass readings, if any.
+
+        Returns
+        -------
+        numpy.ndarray
+            The orientation after each sample, of shape (N, 4) or
+            (N, streams, 4).
+
+        """
+        axis = np.asarray(axis, dtype=np.float64)
+        count = len(axis)
+        if not count:
+            if self.streams is None:
+                return np.empty((0, 4))
+            return np.empty((0, self.streams, 4))
+        if calibration is not None:
+            axis = calibration.apply_axis(axis)
+        if timestamps is None:
+            dts = np.full(count, self.period)
+        else:
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            previous = self.timestamp if self.timestamp is not None \
+                else timestamps[0] - self.period
+            dts = np.diff(timestamps, prepend=previous)
+            self.timestamp = float(timestamps[-1])
+        result = np.empty(axis.shape[:-1] + (4,))
+        if self.streams is None:
+            gyro = axis[:, 3:6] * self.gyro_scale
+            q = self.q.tolist()
+            beta = self.beta
+            for i, (a, g, dt) in enumerate(zip(axis.tolist(), gyro.tolist(),
+                                               dts.tolist())):
+                q = _madgwick(q[0], q[1], q[2], q[3], a[0], a[1], a[2],
+                              g[0], g[1], g[2], a[6], a[7], a[8], beta, dt,
+                              math.sqrt, _inv_sqrt)
+                result[i] = q
+        else:
+            columns = np.moveaxis(axis, -1, 1)
+            q = tuple(self.q.T)
+            for i in range(count):
+                a = columns[i]
+                q = _madgwick(*q, a[0], a[1], a[2], a[3] * self.gyro_scale,
+                              a[4] * self.gyro_scale, a[5] * self.gyro_scale,
+                              a[6], a[7], a[8], self.beta, dts[i], np.sqrt,
+                              _inv_sqrt_array)
+                result[i] = np.stack(q, axis=-1)
+        self.q = result[-1].copy()
+        return result
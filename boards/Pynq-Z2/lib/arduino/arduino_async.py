@@ -0,0 +1,167 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+__author__ = "zou cong"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+class AsyncDriver(object):
+    """This class exposes a driver to asyncio.
+
+    Every method of the wrapped driver is available as a coroutine, e.g.
+    `await car.move("FORWARD", 50)`. The blocking mailbox commands run on
+    a single worker thread owned by this object, so the event loop never
+    blocks on the Microblaze and the commands reach the mailbox in the
+    order they were awaited.
+
+    Attributes
+    ----------
+    driver : object
+        The wrapped driver, e.g. an Automoto or a Run_LT instance.
+    executor : Executor
+        The executor running the mailbox commands.
+
+    """
+    def __init__(self, driver, executor=None):
+        """Return a new instance of an asyncio driver object.
+
+        Parameters
+        ----------
+        driver : object
+            The driver to wrap.
+        executor : Executor
+            The executor running the mailbox commands; a single worker
+            thread is created when none is given.
+
+        """
+        self.driver = driver
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+
+    def __getattr__(self, name):
+        attr = getattr(self.driver, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.call(attr, *args, **kwargs)
+        return method
+
+    async def call(self, function, *args, **kwargs):
+        """Run a blocking function on the mailbox executor.
+
+        Parameters
+        ----------
+        function : callable
+            The function to run, typically a method of the driver.
+
+        Returns
+        -------
+        object
+            The return value of the function.
+
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(function, *args, **kwargs))
+
+    async def stream(self, name, period, *args):
+        """Call a getter of the driver periodically.
+
+        The calls are scheduled on fixed deadlines, so the time spent in
+        the mailbox does not add up to the period.
+
+        Parameters
+        ----------
+        name : str
+            The name of the getter, e.g. "read_lt_data".
+        period : float
+            The period of the calls in seconds.
+
+        Returns
+        -------
+        async_generator
+            An asynchronous iterator over the values returned.
+
+        """
+        getter = getattr(self.driver, name)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            yield await self.call(getter, *args)
+            deadline += period
+            delay = deadline - loop.time()
+            if delay < 0:
+                deadline = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def stream_lt(self, period=0.01):
+        """Stream the line tracker data, see `read_lt_data`."""
+        return self.stream("read_lt_data", period)
+
+    def stream_distance(self, period=0.06):
+        """Stream the ultrasonic ranger distance, see `get_distance`."""
+        return self.stream("get_distance", period)
+
+    def stream_gesture(self, period=0.05):
+        """Stream the gesture sensor data, see `read_gesture`."""
+        return self.stream("read_gesture", period)
+
+    def stream_axis(self, period=0.01):
+        """Stream the IMU axis data, see `get_axis`."""
+        return self.stream("get_axis", period)
+
+    def stream_qua(self, period=0.01):
+        """Stream the IMU quaternion data, see `get_qua`."""
+        return self.stream("get_qua", period)
+
+    def close(self):
+        """Shut the mailbox executor down.
+
+        Returns
+        -------
+        None
+
+        """
+        self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
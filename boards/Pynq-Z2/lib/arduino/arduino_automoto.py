@@ -28,10 +28,11 @@
 #   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-from . import Arduino
 from . import MOTOR_DIRECTION
 from . import TIMER
 from . import MOTOR_PINS
+from .arduino_mailbox import open_mailbox
+from .arduino_motor import MotorMixin
 
 
 __author__ = "zou cong"
@@ -61,26 +62,7 @@ PINS[4:8] is to set the pin to control the direction of motor
 PINS[8:12] is to set the pins to record the velocity
 '''
 
-def _reg2int(reg):
-    """Converts 32-bit register value to signed integer in Python.
-
-    Parameters
-    ----------
-    reg: int
-        A 32-bit register value read from the mailbox.
-
-    Returns
-    -------
-    int
-        A signed integer translated from the register value.
-
-    """
-    result = -(reg >> 31 & 0x1) * (1 << 31)
-    for i in range(31):
-        result += (reg >> i & 0x1) * (1 << i)
-    return result
-
-class Automoto(object):
+class Automoto(MotorMixin):
     """This class controls the Automoto. 
     
     Each automoto has five io control the power and direction of motor
@@ -90,6 +72,8 @@ class Automoto(object):
     ----------
     microblaze : Arduino
         Microblaze processor instance used by this module.
+    mailbox : Mailbox
+        Serialized access to the mailbox of the Microblaze.
         
     """
     def __init__(self, mb_info, pin = MOTOR_PINS):
@@ -110,9 +94,10 @@ class Automoto(object):
         if int(max(pin)) > 19 or int(min(pin)) < 0:
             raise ValueError("the value of pin should not be bigger than 19 or smaller than 0")
 
-        self.microblaze = Arduino(mb_info, ARDUINO_AUTOMOTO_PROGRAM)
-        self.microblaze.write_mailbox(0, pin)
-        self.microblaze.write_blocking_command(CONFIG_IOP_SWITCH)
+        self.mailbox = open_mailbox(mb_info, ARDUINO_AUTOMOTO_PROGRAM,
+                                    name=type(self).__name__)
+        self.microblaze = self.mailbox.microblaze
+        self.mailbox.configure(CONFIG_IOP_SWITCH, pin)
 
     def stop(self):
         """stop the car
@@ -122,7 +107,7 @@ class Automoto(object):
         None
 
         """
-        self.microblaze.write_blocking_command(STOP)
+        self._stop_motors(STOP)
 
     def move(self, instruction, speed = 50):
         """control the car to move
@@ -143,8 +128,7 @@ class Automoto(object):
             raise ValueError("velocity should be in the range from 0 to 100")
         data_in.append(MOTOR_DIRECTION[instruction])
         data_in.append(speed)
-        self.microblaze.write_mailbox(0, data_in)
-        self.microblaze.write_blocking_command(MOVE)
+        self._motor_command(MOVE, data_in)
 
     def distance(self, opt = 0, which = 1):
         """
@@ -158,7 +142,4 @@ class Automoto(object):
         -------
         distance of the whole car
         """
-        self.microblaze.write_mailbox(0, [opt, which])
-        self.microblaze.write_blocking_command(DISTANCE)
-        value = _reg2int(self.microblaze.read_mailbox(0))
-        return value * (0.08*3.14159/2.0/1920.0)
+        return self._read_ticks(opt, which) * self.calibration.factor(which)
@@ -0,0 +1,331 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import numpy as np
+from .arduino_codec import float2reg
+from .arduino_codec import int2reg
+from .arduino_codec import reg2float
+from .arduino_codec import reg2int
+from .arduino_simulator import CarSimulator
+from .arduino_automoto import Automoto
+from .arduino_run_linetracker import Run_LT
+from .arduino_run_usranger import Run_usranger
+from .arduino_10DOF_IMU import TenDOF_IMU
+from .arduino_run_IMU import RUN_IMU
+from .arduino_ahrs import Madgwick
+from .arduino_motor import MotorMixin
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+Benchmarks of the driver hot paths, run against CarSimulator so that they
+need no board:
+
+ * decode: register decoding throughput, in words per second.
+ * operations: time and mailbox round-trips of each driver operation.
+ * loops: frequency of the line tracker and ultrasonic ranger control
+   loops of the notebooks, without their sleeps.
+ * ahrs: throughput of the Madgwick filter, in samples per second.
+
+The moves of the operations alternate between two commands, so that they
+reach the Microblaze; `move_repeat` measures a move dropped as identical
+to the one in effect. The motor commands sent and coalesced per call are
+reported next to the round-trips.
+
+The results are printed as JSON, to be stored and compared over time:
+
+    python3 -m pynq.lib.arduino.arduino_benchmark --latency 0.0002
+'''
+
+
+def _timeit(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_decode(repeat=10000):
+    """Measure the throughput of the register decoders.
+
+    Parameters
+    ----------
+    repeat : int
+        Number of blocks decoded per measurement.
+
+    Returns
+    -------
+    dict
+        Words decoded per second, for each decoder and block size.
+
+    """
+    results = {}
+    for size in (1, 9, 64):
+        floats = float2reg(np.linspace(-100, 100, size).tolist())
+        ints = int2reg(np.arange(-size, size, 2).tolist())
+        results["reg2float_{}".format(size)] = \
+            size / _timeit(lambda: reg2float(floats), repeat)
+        results["reg2int_{}".format(size)] = \
+            size / _timeit(lambda: reg2int(ints), repeat)
+    return results
+
+
+def _operations(sim):
+    imu = TenDOF_IMU({}, 1)
+    run_imu = RUN_IMU({}, 1)
+    run_lt = Run_LT({})
+    run_us = Run_usranger({})
+    motor = Automoto({})
+    motor_moves = itertools.cycle([("FORWARD", 50), ("BACKWARD", 40)])
+    run_imu_moves = itertools.cycle([("FORWARD", 50), ("BACKWARD", 40)])
+    return {
+        "Automoto.move": (motor, lambda: motor.move(*next(motor_moves))),
+        "Automoto.move_repeat": (motor, lambda: motor.move("LEFT_R", 30)),
+        "Automoto.stop": (motor, motor.stop),
+        "Automoto.distance": (motor, lambda: motor.distance(0, 1)),
+        "Run_LT.read_lt_data": (run_lt, run_lt.read_lt_data),
+        "Run_usranger.get_distance": (run_us, run_us.get_distance),
+        "TenDOF_IMU.get_axis": (imu, imu.get_axis),
+        "TenDOF_IMU.get_heading": (imu, imu.get_heading),
+        "TenDOF_IMU.snapshot": (imu, imu.snapshot),
+        "RUN_IMU.get_axis": (run_imu, run_imu.get_axis),
+        "RUN_IMU.move": (run_imu,
+                         lambda: run_imu.move(*next(run_imu_moves))),
+        "RUN_IMU.get_qua+distance": (run_imu,
+                                     lambda: (run_imu.get_qua(),
+                                              run_imu.distance(0, 1))),
+        "RUN_IMU.batch": (run_imu, lambda: run_imu.batch(
+            [("get_qua",), ("distance", 0, 1), ("distance", 0, 2),
+             ("distance", 1, 1), ("distance", 1, 2)]))}
+
+
+def _moves(driver):
+    if not isinstance(driver, MotorMixin):
+        return 0, 0
+    return driver.motor_sent, driver.motor_coalesced
+
+
+def _count(sim, driver, function):
+    commands = sum(sim.commands.values())
+    sent, coalesced = _moves(driver)
+    result = function()
+    after = _moves(driver)
+    counts = {"round_trips": sum(sim.commands.values()) - commands}
+    if isinstance(driver, MotorMixin):
+        counts["moves_sent"] = after[0] - sent
+        counts["moves_coalesced"] = after[1] - coalesced
+    return result, counts
+
+
+def bench_operations(sim, repeat=1000):
+    """Measure the cost of each driver operation.
+
+    Parameters
+    ----------
+    sim : CarSimulator
+        The installed simulator.
+    repeat : int
+        Number of calls per operation.
+
+    Returns
+    -------
+    dict
+        For each operation, the mean time per call in seconds, the number
+        of mailbox commands per call and, for the car drivers, the motor
+        commands sent and coalesced per call.
+
+    """
+    results = {}
+    for name, (driver, operation) in _operations(sim).items():
+        operation()
+        seconds, counts = _count(sim, driver,
+                                 lambda: _timeit(operation, repeat))
+        results[name] = {"seconds": seconds}
+        for key, count in counts.items():
+            results[name][key] = count / repeat
+    return results
+
+
+def _line_tracker_loop(run_lt):
+    data = run_lt.read_lt_data()
+    if data[2] > 0.65 and data[3] < 0.65:
+        run_lt.move("LEFT_S")
+    elif data[3] > 0.65 and data[2] < 0.65:
+        run_lt.move("RIGHT_S")
+    else:
+        run_lt.move("FORWARD")
+
+
+def _ranger_loop(run_us):
+    data = sum(run_us.get_distance() for _ in range(3)) / 3
+    if data < 50:
+        run_us.move("RIGHT_R")
+    else:
+        run_us.move("FORWARD", 50)
+
+
+def bench_loops(sim, duration=1.0):
+    """Measure the frequency of the notebook control loops.
+
+    Parameters
+    ----------
+    sim : CarSimulator
+        The installed simulator.
+    duration : float
+        Time each loop runs for, in seconds.
+
+    Returns
+    -------
+    dict
+        For each loop, its frequency in Hz, and the mailbox round-trips
+        and the motor commands sent and coalesced per iteration.
+
+    """
+    loops = {"line_tracker": (_line_tracker_loop, Run_LT({})),
+             "usranger": (_ranger_loop, Run_usranger({}))}
+    results = {}
+    for name, (loop, driver) in loops.items():
+        def iterate():
+            iterations = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < duration:
+                loop(driver)
+                iterations += 1
+            return iterations, time.perf_counter() - start
+        (iterations, elapsed), counts = _count(sim, driver, iterate)
+        driver.stop()
+        results[name] = {"hz": iterations / elapsed}
+        for key, count in counts.items():
+            results[name][key] = count / iterations
+    return results
+
+
+def bench_ahrs(sim, samples=10000, streams=64):
+    """Measure the throughput of the Madgwick filter.
+
+    Parameters
+    ----------
+    sim : CarSimulator
+        The simulator the IMU samples are read from.
+    samples : int
+        Number of samples filtered per measurement.
+    streams : int
+        Number of streams of the multi-stream batch.
+
+    Returns
+    -------
+    dict
+        Samples filtered per second: one at a time, as a single stream
+        batch and as a multi-stream batch.
+
+    """
+    imu = TenDOF_IMU({}, 0)
+    sim.set_wheels(-40, 40)
+    axis = np.array([imu.get_axis() for _ in range(100)])
+    sim.set_wheels(0, 0)
+    log = np.resize(axis, (samples, 9))
+    ahrs = Madgwick()
+    start = time.perf_counter()
+    for sample in log:
+        ahrs.update(sample)
+    update = samples / (time.perf_counter() - start)
+    start = time.perf_counter()
+    Madgwick().batch(log)
+    batch = samples / (time.perf_counter() - start)
+    logs = np.resize(axis, (samples // streams, streams, 9))
+    start = time.perf_counter()
+    Madgwick(streams=streams).batch(logs)
+    multi = logs.shape[0] * streams / (time.perf_counter() - start)
+    return {"update": update, "batch": batch,
+            "batch_{}_streams".format(streams): multi}
+
+
+def run(latency=0.0, repeat=1000, duration=1.0):
+    """Run all the benchmarks.
+
+    Parameters
+    ----------
+    latency : float/dict
+        Latency of the simulated mailbox commands, see `CarSimulator`.
+    repeat : int
+        Number of calls per operation.
+    duration : float
+        Time each control loop runs for, in seconds.
+
+    Returns
+    -------
+    dict
+        The results, with the configuration they were measured with.
+
+    """
+    with CarSimulator(latency=latency) as sim:
+        results = {"time": time.time(),
+                   "python": platform.python_version(),
+                   "numpy": np.__version__,
+                   "latency": latency,
+                   "decode": bench_decode(repeat * 10),
+                   "operations": bench_operations(sim, repeat),
+                   "loops": bench_loops(sim, duration),
+                   "ahrs": bench_ahrs(sim, repeat * 10)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the PYNQ-Car drivers on a simulated mailbox.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="latency of every mailbox command, in seconds")
+    parser.add_argument("--repeat", type=int, default=1000,
+                        help="number of calls per operation")
+    parser.add_argument("--duration", type=float, default=1.0,
+                        help="duration of each control loop, in seconds")
+    parser.add_argument("--output", help="write the JSON results to a file")
+    args = parser.parse_args(argv)
+    results = run(args.latency, args.repeat, args.duration)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import json
+import math
+import time
+import numpy as np
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+class _Calibration(object):
+    """Base of the calibrations saved as JSON.
+
+    Subclasses implement `to_dict`, returning the arguments of their
+    constructor.
+
+    """
+    def save(self, path):
+        """Save the calibration to a JSON file.
+
+        Parameters
+        ----------
+        path : str
+            The file to write.
+
+        Returns
+        -------
+        None
+
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Load a calibration saved with `save`.
+
+        Parameters
+        ----------
+        path : str
+            The file to read.
+
+        Returns
+        -------
+        _Calibration
+            The calibration.
+
+        """
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + ", ".join(
+            "{}={}".format(k, v) for k, v in self.to_dict().items()) + ")"
+
+
+class WheelCalibration(_Calibration):
+    """This class converts the wheel encoder ticks into distances.
+
+    The meters per tick of each wheel are computed once, when the
+    calibration is created, so that a conversion is a single multiply.
+    The calibration is not meant to be modified; `replace` and `fit`
+    return new ones.
+
+    Attributes
+    ----------
+    diameter : float
+        Diameter of the wheels in meters.
+    ticks_per_revolution : float
+        Encoder ticks per revolution of a wheel.
+    left_scale, right_scale : float
+        Correction of the distance covered by the left and right wheels,
+        e.g. for worn tyres.
+    track_width : float
+        Distance between the left and right wheels in meters.
+    left, right : float
+        Meters per tick of the left and right wheels.
+    mean : float
+        Meters per tick of the average of both wheels.
+
+    """
+    def __init__(self, diameter=0.08, ticks_per_revolution=3840,
+                 left_scale=1.0, right_scale=1.0, track_width=0.15):
+        """Return a new instance of a wheel calibration object.
+
+        The defaults match the wheels and encoders of the PYNQ-Car.
+
+        Parameters
+        ----------
+        diameter : float
+            Diameter of the wheels in meters.
+        ticks_per_revolution : float
+            Encoder ticks per revolution of a wheel.
+        left_scale, right_scale : float
+            Correction of the distance covered by each side.
+        track_width : float
+            Distance between the left and right wheels in meters.
+
+        """
+        if diameter <= 0 or ticks_per_revolution <= 0 or track_width <= 0:
+            raise ValueError("wheel dimensions should be positive.")
+        self.diameter = float(diameter)
+        self.ticks_per_revolution = float(ticks_per_revolution)
+        self.left_scale = float(left_scale)
+        self.right_scale = float(right_scale)
+        self.track_width = float(track_width)
+        nominal = math.pi * diameter / ticks_per_revolution
+        self.left = nominal * left_scale
+        self.right = nominal * right_scale
+        self.mean = (self.left + self.right) / 2
+        self._factors = {1: self.left, 2: self.right}
+
+    def factor(self, which=0):
+        """Get the meters per tick of a wheel.
+
+        Parameters
+        ----------
+        which : int
+            1 for the left wheel, 2 for the right one, anything else for
+            their average, as in `distance`.
+
+        Returns
+        -------
+        float
+            The meters per tick.
+
+        """
+        return self._factors.get(which, self.mean)
+
+    def to_meters(self, left, right):
+        """Convert tick counts to distances.
+
+        Parameters
+        ----------
+        left, right : int/numpy.ndarray
+            Ticks of the left and right wheels.
+
+        Returns
+        -------
+        tuple
+            The distances covered by the left and right wheels in meters.
+
+        """
+        return left * self.left, right * self.right
+
+    def replace(self, **kwargs):
+        """Get a copy of this calibration with some parameters changed.
+
+        Returns
+        -------
+        WheelCalibration
+            The new calibration.
+
+        """
+        params = self.to_dict()
+        params.update(kwargs)
+        return WheelCalibration(**params)
+
+    def fit(self, straight, distance, spin=None, angle=None):
+        """Fit the calibration to a straight run and a spin.
+
+        The scale of each wheel is fitted so that both cover the measured
+        distance of a straight run; the track width is then fitted so
+        that the wheel distances of a spin in place match its angle.
+
+        Parameters
+        ----------
+        straight : list
+            The left and right ticks logged during the straight run, as
+            a (left, right) pair or an array of such pairs, e.g. the
+            `read_odometry_delta` readings.
+        distance : float
+            The distance actually covered by the straight run, in meters.
+        spin : list
+            The left and right ticks logged during the spin.
+        angle : float
+            The angle the car turned by during the spin, in radians,
+            counter-clockwise positive; e.g. from the unwrapped IMU yaw.
+
+        Returns
+        -------
+        WheelCalibration
+            The fitted calibration.
+
+        """
+        left, right = np.reshape(straight, (-1, 2)).sum(axis=0)
+        if left == 0 or right == 0:
+            raise ValueError("both wheels should move in the straight run.")
+        nominal = math.pi * self.diameter / self.ticks_per_revolution
+        params = {"left_scale": distance / (left * nominal),
+                  "right_scale": distance / (right * nominal)}
+        if spin is not None:
+            if not angle:
+                raise ValueError("the angle of the spin is needed.")
+            left, right = np.reshape(spin, (-1, 2)).sum(axis=0)
+            arc = right * nominal * params["right_scale"] - \
+                left * nominal * params["left_scale"]
+            params["track_width"] = arc / angle
+        return self.replace(**params)
+
+    def to_dict(self):
+        """Get the parameters of the calibration.
+
+        Returns
+        -------
+        dict
+            The arguments to create the same calibration.
+
+        """
+        return {"diameter": self.diameter,
+                "ticks_per_revolution": self.ticks_per_revolution,
+                "left_scale": self.left_scale,
+                "right_scale": self.right_scale,
+                "track_width": self.track_width}
+
+
+class MagnetometerCalibration(_Calibration):
+    """This class corrects the hard and soft iron errors of the compass.
+
+    The motors and the chassis shift the magnetic field measured on the
+    car (hard iron) and distort it (soft iron), so that a full rotation
+    draws an offset ellipsoid instead of a sphere centered on zero. The
+    correction maps the ellipsoid back onto a sphere:
+    `corrected = matrix . (raw - offset)`. It is precomputed as one
+    matrix product and one subtraction, on one sample or a whole array.
+
+    Attributes
+    ----------
+    offset : numpy.ndarray
+        The hard iron offset, in the units of the compass.
+    matrix : numpy.ndarray
+        The 3 x 3 soft iron correction.
+
+    """
+    def __init__(self, offset=(0.0, 0.0, 0.0), matrix=None):
+        """Return a new instance of a magnetometer calibration object.
+
+        Parameters
+        ----------
+        offset : list
+            The hard iron offset of the X, Y and Z axes.
+        matrix : list
+            The 3 x 3 soft iron correction; the identity by default.
+
+        """
+        self.offset = np.array(offset, dtype=np.float64).reshape(3)
+        self.matrix = np.eye(3) if matrix is None else \
+            np.array(matrix, dtype=np.float64).reshape(3, 3)
+        self._transform = np.ascontiguousarray(self.matrix.T)
+        self._bias = self.offset.dot(self._transform)
+
+    def apply(self, mag):
+        """Correct magnetometer readings.
+
+        Parameters
+        ----------
+        mag : numpy.ndarray
+            The X, Y and Z readings, of shape (3,) or (N, 3).
+
+        Returns
+        -------
+        numpy.ndarray
+            The corrected readings.
+
+        """
+        return np.dot(mag, self._transform) - self._bias
+
+    def apply_axis(self, axis):
+        """Correct the magnetometer readings of `get_axis` data.
+
+        Parameters
+        ----------
+        axis : numpy.ndarray
+            The 9 values of `get_axis`, of shape (9,) or (N, 9).
+
+        Returns
+        -------
+        numpy.ndarray
+            A copy of the data with the compass values corrected.
+
+        """
+        axis = np.array(axis, dtype=np.float64)
+        axis[..., 6:9] = self.apply(axis[..., 6:9])
+        return axis
+
+    @classmethod
+    def fit(cls, samples, planar=False):
+        """Fit the calibration to readings taken while rotating the IMU.
+
+        An ellipsoid is fitted to the readings by linear least squares;
+        the correction maps it onto the sphere of the same volume, so that
+        the corrected field keeps its magnitude. A car turning on the
+        floor only sweeps the horizontal plane: with `planar`, an ellipse
+        is fitted to the X and Y readings and Z is left uncorrected.
+
+        Parameters
+        ----------
+        samples : numpy.ndarray
+            The readings, as an N x 3 array of compass values or an N x 9
+            array of `get_axis` data.
+        planar : bool
+            Whether the IMU only rotated around its Z-axis.
+
+        Returns
+        -------
+        MagnetometerCalibration
+            The fitted calibration.
+
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if samples.ndim != 2 or samples.shape[1] not in (3, 9):
+            raise ValueError("samples should be an N x 3 or N x 9 array.")
+        mag = samples[:, -3:] if samples.shape[1] == 9 else samples
+        size = 2 if planar else 3
+        mag = mag[:, :size]
+        # Quadric terms: squares, cross products, then linear terms.
+        rows, cols = np.triu_indices(size)
+        design = mag[:, rows] * mag[:, cols] * np.where(rows == cols, 1, 2)
+        design = np.hstack([design, 2 * mag])
+        if len(mag) < design.shape[1]:
+            raise ValueError("at least {} samples are needed."
+                             .format(design.shape[1]))
+        params = np.linalg.lstsq(design, np.ones(len(mag)), rcond=None)[0]
+        quadric = np.zeros((size, size))
+        quadric[rows, cols] = params[:len(rows)]
+        quadric[cols, rows] = params[:len(rows)]
+        try:
+            center = -np.linalg.solve(quadric, params[len(rows):])
+        except np.linalg.LinAlgError:
+            center = None
+        if center is not None:
+            quadric /= 1 + center.dot(quadric).dot(center)
+        values, vectors = np.linalg.eigh(quadric)
+        if center is None or not np.all(values > 0):
+            raise ValueError("the samples do not cover enough orientations.")
+        radius = np.prod(values) ** (-0.5 / size)
+        correction = radius * (vectors * np.sqrt(values)).dot(vectors.T)
+        offset = np.zeros(3)
+        offset[:size] = center
+        matrix = np.eye(3)
+        matrix[:size, :size] = correction
+        return cls(offset, matrix)
+
+    def to_dict(self):
+        """Get the parameters of the calibration.
+
+        Returns
+        -------
+        dict
+            The arguments to create the same calibration.
+
+        """
+        return {"offset": self.offset.tolist(),
+                "matrix": self.matrix.tolist()}
+
+
+def collect_compass(imu, duration=20.0, rate=50, car=None, speed=40):
+    """Read the IMU during a rotation sweep, to fit the compass.
+
+    Parameters
+    ----------
+    imu : TenDOF_IMU/RUN_IMU
+        The IMU to read.
+    duration : float
+        Time of the sweep in seconds; the IMU should be turned through as
+        many orientations as possible in the meantime, or the car spun.
+    rate : float
+        Sampling rate in Hz.
+    car : object
+        A driver of the motors to spin the car in place with, e.g. the
+        RUN_IMU itself; None to turn the IMU by hand.
+    speed : int
+        The speed of the spin.
+
+    Returns
+    -------
+    numpy.ndarray
+        The N x 9 `get_axis` readings.
+
+    """
+    samples = []
+    if car is not None:
+        car.move("LEFT_R", speed)
+    try:
+        deadline = start = time.monotonic()
+        while deadline - start < duration:
+            samples.append(imu.get_axis())
+            deadline += 1.0 / rate
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    finally:
+        if car is not None:
+            car.stop()
+    return np.array(samples, dtype=np.float64)
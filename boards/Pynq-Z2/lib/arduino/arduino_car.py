@@ -0,0 +1,185 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import time
+from . import MOTOR_PINS
+from .arduino_automoto import Automoto
+from .arduino_linetracker import LT_sen
+from .arduino_gesture import Gesture_sen
+from .arduino_run_linetracker import Run_LT
+from .arduino_run_usranger import Run_usranger
+from .arduino_run_gesture import Run_gesture
+from .arduino_10DOF_IMU import TenDOF_IMU
+from .arduino_run_IMU import RUN_IMU
+from .arduino_run_IMU import METHOD_PAGES
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+The devices driven by each Microblaze program, with the driver that loads
+it. There is a single Arduino IOP, so a set of devices can only be used
+together when one program drives all of them.
+'''
+CAR_PROGRAMS = [
+    (frozenset(["motors"]),
+     lambda mb_info, channel, pin: Automoto(mb_info, pin)),
+    (frozenset(["line_tracker"]),
+     lambda mb_info, channel, pin: LT_sen(mb_info)),
+    (frozenset(["gesture"]),
+     lambda mb_info, channel, pin: Gesture_sen(mb_info, channel)),
+    (frozenset(["imu"]),
+     lambda mb_info, channel, pin: TenDOF_IMU(mb_info, channel)),
+    (frozenset(["motors", "line_tracker"]),
+     lambda mb_info, channel, pin: Run_LT(mb_info, pin=pin)),
+    (frozenset(["motors", "ranger"]),
+     lambda mb_info, channel, pin: Run_usranger(mb_info, pin)),
+    (frozenset(["motors", "gesture"]),
+     lambda mb_info, channel, pin: Run_gesture(mb_info, channel, pin)),
+    (frozenset(["motors", "imu"]),
+     lambda mb_info, channel, pin: RUN_IMU(mb_info, channel, pin))]
+
+'''
+The readings taken from each device on every tick, by name: the driver
+method and its arguments.
+'''
+DEVICE_READS = {
+    "motors": {"odometry": ("read_odometry_delta",)},
+    "line_tracker": {"line": ("read_lt_data",)},
+    "ranger": {"range": ("get_distance",)},
+    "gesture": {"gesture": ("read_gesture",)},
+    "imu": {"axis": ("get_axis",), "qua": ("get_qua",)}}
+
+
+class Car(object):
+    """This class drives a set of devices through one Microblaze program.
+
+    The program driving the requested devices is selected from
+    CAR_PROGRAMS and loaded through its driver; the methods of the driver,
+    e.g. `move` or `get_qua`, are available on the car. `tick` takes the
+    readings of all the devices in one mailbox transaction, so that a
+    control loop gets a consistent set of readings once per period. On
+    paged programs the reads are ordered by METHOD_PAGES, starting with
+    the page selected, so that each page is selected at most once.
+
+    Attributes
+    ----------
+    driver : object
+        The driver of the program, e.g. a RUN_IMU instance.
+    devices : frozenset
+        The devices requested.
+    reads : dict
+        The readings taken by `tick`: the driver method and its arguments,
+        by name.
+
+    """
+    def __init__(self, mb_info, devices=("motors",), channel=0,
+                 pin=MOTOR_PINS, reads=None):
+        """Return a new instance of a car object.
+
+        Parameters
+        ----------
+        mb_info : dict
+            A dictionary storing Microblaze information, such as the
+            IP name and the reset name.
+        devices : list
+            The devices to use, among "motors", "line_tracker", "ranger",
+            "gesture" and "imu".
+        channel : int
+            The I2C multiplexer channel of the gesture sensor or the IMU.
+        pin : list
+            The 12 pins of the motors.
+        reads : dict
+            The readings taken by `tick`, replacing the DEVICE_READS of
+            the devices, e.g. `{"eul": ("get_eul",)}`.
+
+        """
+        devices = frozenset(devices)
+        unknown = devices - set(DEVICE_READS)
+        if unknown:
+            raise ValueError("unknown devices: {}.".format(
+                ", ".join(sorted(unknown))))
+        programs = [(program, factory) for program, factory in CAR_PROGRAMS
+                    if devices <= program]
+        if not programs:
+            raise ValueError(
+                "no program drives {} together; the programs drive {}."
+                .format(", ".join(sorted(devices)), "; ".join(
+                    ", ".join(sorted(p)) for p, _ in CAR_PROGRAMS)))
+        program, factory = min(programs, key=lambda p: len(p[0]))
+        self.devices = devices
+        self.driver = factory(mb_info, channel, pin)
+        if reads is None:
+            reads = {}
+            for device in sorted(devices):
+                reads.update(DEVICE_READS[device])
+        for name, request in reads.items():
+            if not callable(getattr(self.driver, request[0], None)):
+                raise ValueError("{} cannot be read from {}.".format(
+                    request[0], type(self.driver).__name__))
+        self.reads = dict(reads)
+
+    def __getattr__(self, name):
+        if name == "driver":
+            raise AttributeError(name)
+        return getattr(self.driver, name)
+
+    def tick(self):
+        """Take all the readings in one mailbox transaction.
+
+        Returns
+        -------
+        dict
+            The readings by name, and their `time.monotonic()` timestamp
+            under "timestamp".
+
+        """
+        batch = getattr(self.driver, "batch", None)
+        with self.driver.mailbox.transaction():
+            names = sorted(self.reads)
+            if batch is not None:
+                page = self.driver.page
+                pages = {name: METHOD_PAGES.get(self.reads[name][0], page)
+                         for name in names}
+                names.sort(key=lambda name: (pages[name] != page,
+                                             pages[name]))
+            requests = [self.reads[name] for name in names]
+            timestamp = time.monotonic()
+            if batch is not None:
+                values = batch(requests)
+            else:
+                values = [getattr(self.driver, request[0])(*request[1:])
+                          for request in requests]
+        readings = dict(zip(names, values))
+        readings["timestamp"] = timestamp
+        return readings
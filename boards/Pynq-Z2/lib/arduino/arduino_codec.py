@@ -0,0 +1,180 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import struct
+import numpy as np
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+The Microblaze programs return their results as raw 32-bit mailbox words:
+IEEE-754 single precision for sensor readings, two's complement for
+counters. The helpers below decode a whole mailbox block in one step by
+reinterpreting the words through a NumPy view instead of rebuilding every
+value bit by bit. A single register, e.g. a temperature, is decoded with
+struct, which costs far less than building an array.
+'''
+_WORD = struct.Struct("<I")
+_FLOAT = struct.Struct("<f")
+_INT = struct.Struct("<i")
+
+
+def words(regs):
+    """Converts mailbox register values to an array of 32-bit words.
+
+    Parameters
+    ----------
+    regs: int/list
+        One or more 32-bit register values read from the mailbox.
+
+    Returns
+    -------
+    numpy.ndarray
+        A 1-D array of dtype uint32.
+
+    """
+    return np.atleast_1d(np.asarray(regs, dtype=np.int64)).astype(np.uint32)
+
+
+def regs2array(regs, ndigits=None):
+    """Converts a block of 32-bit register values to a float array.
+
+    Parameters
+    ----------
+    regs: int/list
+        One or more 32-bit register values read from the mailbox.
+    ndigits: int
+        Number of decimals to round to; `None` keeps full precision.
+
+    Returns
+    -------
+    numpy.ndarray
+        A 1-D array of dtype float64.
+
+    """
+    values = words(regs).view(np.float32).astype(np.float64)
+    if ndigits is not None:
+        values = np.round(values, ndigits)
+    return values
+
+
+def reg2float(regs, ndigits=2):
+    """Converts 32-bit register values to floats in Python.
+
+    The default rounding to 2 decimals matches what the drivers have
+    always returned; pass `ndigits=None` for full single precision.
+
+    Parameters
+    ----------
+    regs: int/list
+        A 32-bit register value, or a list of them, read from the mailbox.
+    ndigits: int
+        Number of decimals to round to; `None` keeps full precision.
+
+    Returns
+    -------
+    float/list
+        A float number, or a list of them, translated from the registers.
+
+    """
+    if isinstance(regs, (int, np.integer)):
+        value = _FLOAT.unpack(_WORD.pack(int(regs) & 0xFFFFFFFF))[0]
+        return value if ndigits is None else round(value, ndigits)
+    values = regs2array(regs, ndigits).tolist()
+    if isinstance(regs, list):
+        return values
+    return values[0]
+
+
+def reg2int(regs):
+    """Converts 32-bit register values to signed integers in Python.
+
+    Parameters
+    ----------
+    regs: int/list
+        A 32-bit register value, or a list of them, read from the mailbox.
+
+    Returns
+    -------
+    int/list
+        A signed integer, or a list of them, translated from the registers.
+
+    """
+    if isinstance(regs, (int, np.integer)):
+        return _INT.unpack(_WORD.pack(int(regs) & 0xFFFFFFFF))[0]
+    values = words(regs).view(np.int32).tolist()
+    if isinstance(regs, list):
+        return values
+    return values[0]
+
+
+def float2reg(values):
+    """Converts floats to 32-bit register values, as the Microblaze does.
+
+    Parameters
+    ----------
+    values: float/list
+        A float number, or a list of them.
+
+    Returns
+    -------
+    int/list
+        A 32-bit register value, or a list of them.
+
+    """
+    regs = np.atleast_1d(np.asarray(values, dtype=np.float32))
+    regs = regs.view(np.uint32).tolist()
+    if isinstance(values, list):
+        return regs
+    return regs[0]
+
+
+def int2reg(values):
+    """Converts signed integers to 32-bit register values.
+
+    Parameters
+    ----------
+    values: int/list
+        A signed integer, or a list of them.
+
+    Returns
+    -------
+    int/list
+        A 32-bit register value, or a list of them.
+
+    """
+    regs = (np.atleast_1d(np.asarray(values, dtype=np.int64)) &
+            0xFFFFFFFF).tolist()
+    if isinstance(values, list):
+        return regs
+    return regs[0]
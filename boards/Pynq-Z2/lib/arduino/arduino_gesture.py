@@ -27,8 +27,9 @@
 #   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
 #   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from . import Arduino
 from . import GESTURE_DICT
+from .arduino_mailbox import open_mailbox
+from .arduino_gesture_events import GestureEvents
 
 __author__ = "zou cong"
 __copyright__ = "Copyright 2019, Xilinx"
@@ -52,6 +53,8 @@ class Gesture_sen(object):
     ----------
     microblaze : Arduino
         Microblaze processor instance used by this module.
+    mailbox : Mailbox
+        Serialized access to the mailbox of the Microblaze.
         
     """
     def __init__(self, mb_info, channel):
@@ -64,10 +67,11 @@ class Gesture_sen(object):
             IP name and the reset name.
 
         """
-        self.microblaze = Arduino(mb_info,ARDUINO_GESTURE_PROGRAM)
-        self.microblaze.write_mailbox(0, channel)
-        self.microblaze.write_blocking_command(CONFIG_IOP_SWITCH)
-        data = self.microblaze.read_mailbox(0, 2)
+        self.mailbox = open_mailbox(mb_info, ARDUINO_GESTURE_PROGRAM,
+                                    name=type(self).__name__)
+        self.microblaze = self.mailbox.microblaze
+        data = self.mailbox.configure(CONFIG_IOP_SWITCH, channel, 2,
+                                      valid=all)
         
         if not data[0]:
             raise ValueError("chip initialization failed.")
@@ -85,11 +89,29 @@ class Gesture_sen(object):
             A list of the data read from gesture sensor.
         
         """
-        self.microblaze.write_blocking_command(READ_GESTURE)
-        data = self.microblaze.read_mailbox(0, 2)
+        data = self.mailbox.transact(READ_GESTURE, num_words=2)
         if data[0]:
             if data[1] in GESTURE_DICT.keys():
                 return GESTURE_DICT[data[1]]
+
+    def gesture_events(self, rate=20, debounce=0.3):
+        """Get the gestures as events instead of polling them.
+
+        Parameters
+        ----------
+        rate : float
+            Polling rate of the sensor in Hz.
+        debounce : float
+            Time in seconds during which a repeated gesture is dropped.
+
+        Returns
+        -------
+        GestureEvents
+            The event source, to be started with `start()` or a `with`
+            block.
+
+        """
+        return GestureEvents(self, rate, debounce)
             
         
         
@@ -0,0 +1,276 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import asyncio
+import collections
+import threading
+import time
+from enum import IntEnum
+from .arduino_sampler import PeriodicWorker
+
+
+__author__ = "zou cong"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+class Gesture(IntEnum):
+    """The gestures of the gesture sensor, with the codes of GESTURE_DICT.
+    """
+    NONE = 0
+    LEFT = 1
+    RIGHT = 2
+    UP = 3
+    DOWN = 4
+    NEAR = 5
+    FAR = 6
+    ALL = 7
+
+
+'''
+A gesture event: the gesture and the `time.monotonic()` time it was read.
+'''
+GestureEvent = collections.namedtuple("GestureEvent", ["gesture", "timestamp"])
+
+'''
+The moves of the gesture notebook: the car backs away from a hand moving
+up, comes closer to a hand moving down, and turns away from a hand
+moving sideways. Any other gesture stops the car.
+'''
+GESTURE_MOVES = {Gesture.UP: "BACKWARD", Gesture.DOWN: "FORWARD",
+                 Gesture.LEFT: "RIGHT_R", Gesture.RIGHT: "LEFT_R"}
+
+
+class GestureEvents(PeriodicWorker):
+    """This class turns the gesture sensor readings into events.
+
+    The sensor is polled on a background thread and every gesture read
+    becomes a `GestureEvent`, delivered to the callbacks registered with
+    `subscribe` or `on`, and to the asynchronous iterators of `stream`.
+    The sensor reports a gesture for a while after it was made: the same
+    gesture read again within `debounce` seconds of the previous one is
+    dropped.
+
+    Callbacks run on the polling thread and should return quickly.
+
+    Attributes
+    ----------
+    sensor : Gesture_sen/Run_gesture
+        The driver being polled.
+    period : float
+        Polling period in seconds.
+    debounce : float
+        Time in seconds during which a repeated gesture is dropped.
+    events : int
+        Number of events delivered.
+    bounces : int
+        Number of repeated gestures dropped.
+    overruns : int
+        Number of periods missed because polling took too long.
+    error : Exception
+        The exception that stopped the polling thread, if any.
+
+    """
+    def __init__(self, sensor, rate=20, debounce=0.3):
+        """Return a new instance of a gesture event source object.
+
+        Parameters
+        ----------
+        sensor : Gesture_sen/Run_gesture
+            The driver to poll.
+        rate : float
+            Polling rate in Hz.
+        debounce : float
+            Time in seconds during which a repeated gesture is dropped.
+
+        """
+        if rate <= 0:
+            raise ValueError("polling rate should be positive.")
+        PeriodicWorker.__init__(self, 1.0 / rate)
+        self.sensor = sensor
+        self.debounce = debounce
+        self.events = 0
+        self.bounces = 0
+        self._callbacks = []
+        self._last = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, gestures=None):
+        """Call a function on every event.
+
+        Parameters
+        ----------
+        callback : callable
+            Called with the `GestureEvent`.
+        gestures : list
+            Only call it for these gestures; all of them by default.
+
+        Returns
+        -------
+        callable
+            The callback, so that it can be unsubscribed.
+
+        """
+        if gestures is not None:
+            gestures = frozenset(Gesture(g) for g in gestures)
+        with self._lock:
+            self._callbacks = self._callbacks + [(callback, gestures)]
+        return callback
+
+    def unsubscribe(self, callback):
+        """Stop calling a function subscribed before.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._lock:
+            self._callbacks = [(c, g) for c, g in self._callbacks
+                               if c is not callback]
+
+    def on(self, *gestures):
+        """Decorator subscribing a function to some gestures.
+
+        e.g. `@events.on(Gesture.UP, Gesture.DOWN)`.
+
+        """
+        def decorator(callback):
+            return self.subscribe(callback, gestures or None)
+        return decorator
+
+    def bind_moves(self, car, moves=None, speed=50, hold=2.0):
+        """Drive a car with the gestures.
+
+        Parameters
+        ----------
+        car : Run_gesture
+            The car to drive, which can be the polled driver.
+        moves : dict
+            The direction of `car.move` by gesture; the other gestures
+            stop the car. GESTURE_MOVES by default.
+        speed : int
+            The speed of the moves.
+        hold : float
+            Time in seconds after which the car stops unless another
+            gesture was made; None keeps moving.
+
+        Returns
+        -------
+        callable
+            The callback driving the car, so that it can be unsubscribed.
+
+        """
+        moves = dict(GESTURE_MOVES if moves is None else moves)
+        timers = []
+
+        def drive(event):
+            while timers:
+                timers.pop().cancel()
+            direction = moves.get(event.gesture)
+            if direction is None:
+                car.stop()
+                return
+            car.move(direction, speed)
+            if hold is not None:
+                timer = threading.Timer(hold, car.stop)
+                timer.daemon = True
+                timers.append(timer)
+                timer.start()
+        return self.subscribe(drive)
+
+    async def stream(self, maxsize=0):
+        """Iterate over the events from asyncio.
+
+        e.g. `async for event in events.stream():`; the events are queued
+        from the moment the iteration starts.
+
+        Parameters
+        ----------
+        maxsize : int
+            Number of events queued before the oldest are dropped; 0 does
+            not limit the queue.
+
+        Returns
+        -------
+        async_generator
+            An asynchronous iterator over the `GestureEvent`.
+
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def put(event):
+            if maxsize and queue.qsize() >= maxsize:
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+        callback = self.subscribe(
+            lambda event: loop.call_soon_threadsafe(put, event))
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(callback)
+
+    def __aiter__(self):
+        return self.stream()
+
+    def poll(self):
+        """Read the sensor once and deliver the event, if any.
+
+        Returns
+        -------
+        GestureEvent
+            The event delivered, or None.
+
+        """
+        name = self.sensor.read_gesture()
+        now = time.monotonic()
+        if name is None or name == Gesture.NONE.name:
+            return None
+        gesture = Gesture[name]
+        if self._last is not None and self._last.gesture == gesture and \
+                now - self._last.timestamp < self.debounce:
+            self.bounces += 1
+            self._last = GestureEvent(gesture, now)
+            return None
+        event = self._last = GestureEvent(gesture, now)
+        self.events += 1
+        for callback, gestures in self._callbacks:
+            if gestures is None or gesture in gestures:
+                callback(event)
+        return event
+
+    def _begin(self):
+        self._last = None
+
+    def _tick(self):
+        self.poll()
@@ -0,0 +1,184 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import math
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+class LatencyHistogram(object):
+    """This class records a latency distribution with bounded error.
+
+    Like an HDR histogram, the buckets are linear within each power of two
+    and their width doubles from one power of two to the next, so that
+    any latency, from nanoseconds to seconds, is kept with the same
+    relative precision in a few hundred counters at most. Recording is a
+    dictionary update; no sample is stored.
+
+    Attributes
+    ----------
+    bits : int
+        Number of bits of precision kept for each value.
+    count : int
+        Number of values recorded.
+    total : int
+        Sum of the values recorded, in nanoseconds.
+    min, max : int
+        Smallest and largest values recorded, in nanoseconds.
+
+    """
+    def __init__(self, bits=5):
+        """Return a new instance of a latency histogram object.
+
+        Parameters
+        ----------
+        bits : int
+            Number of bits of precision; the relative error of the
+            percentiles is at most 2 ** (1 - bits).
+
+        """
+        if bits < 1:
+            raise ValueError("the histogram needs at least 1 bit.")
+        self.bits = bits
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._half = 1 << (bits - 1)
+        self._counts = {}
+
+    def record(self, value):
+        """Record a latency.
+
+        Parameters
+        ----------
+        value : int
+            The latency in nanoseconds.
+
+        Returns
+        -------
+        None
+
+        """
+        value = max(int(value), 0)
+        shift = max(value.bit_length() - self.bits, 0)
+        index = shift * self._half + (value >> shift)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def _bucket(self, index):
+        if index < 2 * self._half:
+            return index, 1
+        shift = index // self._half - 1
+        return (index - shift * self._half) << shift, 1 << shift
+
+    def percentile(self, percent):
+        """Get a percentile of the recorded latencies.
+
+        Parameters
+        ----------
+        percent : float
+            The percentile, from 0 to 100.
+
+        Returns
+        -------
+        float
+            The latency in nanoseconds, or None when nothing was recorded.
+
+        """
+        if not self.count:
+            return None
+        rank = max(int(math.ceil(percent / 100.0 * self.count)), 1)
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                low, width = self._bucket(index)
+                value = low + (width - 1) / 2.0
+                return float(min(max(value, self.min), self.max))
+        return float(self.max)
+
+    def merge(self, other):
+        """Add the values recorded by another histogram to this one.
+
+        Parameters
+        ----------
+        other : LatencyHistogram
+            A histogram with the same precision.
+
+        Returns
+        -------
+        None
+
+        """
+        if other.bits != self.bits:
+            raise ValueError("histograms have different precisions.")
+        for index, count in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self, percents=(50, 90, 99, 99.9)):
+        """Summarize the recorded latencies in seconds.
+
+        Parameters
+        ----------
+        percents : list
+            The percentiles to report.
+
+        Returns
+        -------
+        dict
+            The count, and the mean, min, max and percentiles in seconds,
+            e.g. {"count": 10, "mean": 0.0001, ..., "p99": 0.0003}.
+
+        """
+        result = {"count": self.count}
+        if not self.count:
+            return result
+        result["mean"] = self.total / self.count * 1e-9
+        result["min"] = self.min * 1e-9
+        result["max"] = self.max * 1e-9
+        for percent in percents:
+            key = "p{}".format(percent).replace(".", "_")
+            result[key] = self.percentile(percent) * 1e-9
+        return result
@@ -0,0 +1,288 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import time
+from .arduino_sampler import PeriodicWorker
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+class LineFollower(PeriodicWorker):
+    """This class follows a line with a PID controller on a Run_LT car.
+
+    The error is the difference between the left and right analog line
+    tracker readings, positive when the line is under the left sensor.
+    The PID output, from -1 to 1, is turned into a move: forward within
+    the dead band, steering towards the line, or rotating for large
+    errors, at a speed reduced as the turn sharpens. The speed is
+    quantized and a move is only sent when it differs from the last one,
+    so that a steady course costs a single mailbox read per period.
+
+    The loop runs on fixed deadlines; `rate` is the measured frequency.
+
+    Attributes
+    ----------
+    car : Run_LT
+        The car being driven.
+    period : float
+        Control period in seconds.
+    kp, ki, kd : float
+        The gains of the PID controller.
+    speed : int
+        Speed on straight lines, from 0 to 100.
+    command : tuple
+        The last move sent, as (direction, speed), or None.
+    iterations : int
+        Number of control periods run.
+    moves : int
+        Number of move or stop commands sent.
+    overruns : int
+        Number of periods missed because a step took too long.
+    rate : float
+        The measured loop frequency in Hz.
+    finished : bool
+        Whether both sensors saw the line, which marks the terminal.
+    error : Exception
+        The exception that stopped the control thread, if any.
+
+    """
+    def __init__(self, car, rate=100, kp=1.5, ki=0.0, kd=0.05, speed=50,
+                 deadband=0.1, rotate=0.8, slowdown=0.5, speed_step=5,
+                 threshold=0.65):
+        """Return a new instance of a line follower object.
+
+        Parameters
+        ----------
+        car : Run_LT
+            The car to drive.
+        rate : float
+            Control rate in Hz.
+        kp, ki, kd : float
+            The gains of the PID controller.
+        speed : int
+            Speed on straight lines, from 0 to 100.
+        deadband : float
+            Output below which the car goes straight.
+        rotate : float
+            Output above which the car rotates instead of steering.
+        slowdown : float
+            Fraction of the speed dropped at full output.
+        speed_step : int
+            Quantum of the speed sent to the car.
+        threshold : float
+            Analog reading above which a sensor sees the line; the car
+            stops when both do.
+
+        """
+        if rate <= 0:
+            raise ValueError("control rate should be positive.")
+        if speed not in range(101):
+            raise ValueError("velocity should be in the range from 0 to 100")
+        PeriodicWorker.__init__(self, 1.0 / rate)
+        self.car = car
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.speed = speed
+        self.deadband = deadband
+        self.rotate = rotate
+        self.slowdown = slowdown
+        self.speed_step = speed_step
+        self.threshold = threshold
+        self.command = None
+        self.iterations = 0
+        self.moves = 0
+        self.rate = 0.0
+        self.finished = False
+        self._integral = 0.0
+        self._last_error = None
+        self._last_time = None
+        self._duration = None
+
+    def reset(self):
+        """Clear the state of the PID controller.
+
+        Returns
+        -------
+        None
+
+        """
+        self._integral = 0.0
+        self._last_error = None
+        self._last_time = None
+        self.finished = False
+
+    def output(self, error, dt):
+        """Update the PID controller with a new error.
+
+        Parameters
+        ----------
+        error : float
+            Left minus right analog reading.
+        dt : float
+            Time since the previous error, in seconds.
+
+        Returns
+        -------
+        float
+            The controller output, from -1 (right) to 1 (left).
+
+        """
+        derivative = 0.0
+        if self._last_error is not None and dt > 0:
+            derivative = (error - self._last_error) / dt
+        self._last_error = error
+        output = self.kp * error + self.kd * derivative
+        if self.ki:
+            integral = self._integral + error * dt
+            unsaturated = output + self.ki * integral
+            if -1.0 <= unsaturated <= 1.0:
+                self._integral = integral
+            output += self.ki * self._integral
+        return min(max(output, -1.0), 1.0)
+
+    def motion(self, output):
+        """Turn a controller output into a move of the car.
+
+        Parameters
+        ----------
+        output : float
+            The controller output, from -1 (right) to 1 (left).
+
+        Returns
+        -------
+        tuple
+            The direction and speed of the move.
+
+        """
+        magnitude = abs(output)
+        if magnitude < self.deadband:
+            return "FORWARD", self._quantize(self.speed)
+        speed = self._quantize(self.speed * (1 - self.slowdown * magnitude))
+        if magnitude < self.rotate:
+            return ("LEFT_S" if output > 0 else "RIGHT_S"), speed
+        return ("LEFT_R" if output > 0 else "RIGHT_R"), speed
+
+    def _quantize(self, speed):
+        speed = int(round(speed / self.speed_step)) * self.speed_step
+        return min(max(speed, 0), 100)
+
+    def step(self):
+        """Run one control period: read the sensors and steer the car.
+
+        Returns
+        -------
+        tuple
+            The move in effect, as (direction, speed), or None once the
+            terminal is reached.
+
+        """
+        now = time.monotonic()
+        dt = now - self._last_time if self._last_time is not None else 0.0
+        self._last_time = now
+        _, _, left, right = self.car.read_lt_data()
+        self.iterations += 1
+        if left > self.threshold and right > self.threshold:
+            self.finished = True
+            self.halt()
+            return None
+        command = self.motion(self.output(left - right, dt))
+        if command != self.command:
+            self.car.move(*command)
+            self.command = command
+            self.moves += 1
+        return command
+
+    def halt(self):
+        """Stop the car.
+
+        Returns
+        -------
+        None
+
+        """
+        self.car.stop()
+        self.command = None
+        self.moves += 1
+
+    def run(self, duration=None):
+        """Follow the line until the terminal, or for a given time.
+
+        Parameters
+        ----------
+        duration : float
+            Maximum time to run for in seconds; no limit by default.
+
+        Returns
+        -------
+        None
+
+        """
+        if self.running:
+            raise RuntimeError("LineFollower is already running.")
+        self._duration = duration
+        self._running.set()
+        self._loop()
+
+    def start(self, duration=None):
+        """Follow the line on a background thread.
+
+        Parameters
+        ----------
+        duration : float
+            Maximum time to run for in seconds; no limit by default.
+
+        Returns
+        -------
+        None
+
+        """
+        self._duration = duration
+        PeriodicWorker.start(self)
+
+    def _begin(self):
+        self.reset()
+        self._started = time.monotonic()
+        self._first = self.iterations
+
+    def _tick(self):
+        if self.step() is None:
+            return False
+        elapsed = time.monotonic() - self._started
+        if self._duration is not None and elapsed >= self._duration:
+            return False
+        self.rate = (self.iterations - self._first) / elapsed
+
+    def _end(self):
+        if self.command is not None:
+            self.halt()
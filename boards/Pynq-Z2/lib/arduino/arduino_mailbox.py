@@ -0,0 +1,737 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import copy
+import heapq
+import itertools
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from . import Arduino
+from .arduino_histogram import LatencyHistogram
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+Priorities of the mailbox transactions; lower values are served first.
+Motor commands go ahead of any sensor read waiting for the mailbox.
+'''
+PRIORITY_MOTOR = 0
+PRIORITY_SENSOR = 10
+
+'''
+Commands understood by each Microblaze program, by page. Programs that
+drive a single device only have page 0; arduino_run_IMU.bin selects the
+IMU (page 0) or the automoto (page 1) with the PAGE command.
+They name the commands in the mailbox statistics.
+'''
+PAGE = 0xF
+MOTOR_COMMANDS = {0x1: "CONFIG_IOP_SWITCH", 0x3: "STOP", 0x5: "MOVE",
+                  0x7: "DISTANCE"}
+IMU_COMMANDS = {0x1: "CONFIG_IOP_SWITCH", 0x3: "GET_AXIS_DATA",
+                0x5: "GET_EUL_DATA", 0x7: "GET_QUA_DATA",
+                0xB: "GET_TEMPERATURE", 0xD: "GET_PRESSURE"}
+PROGRAM_COMMANDS = {
+    "arduino_4wdmoto.bin": {0: {**MOTOR_COMMANDS, 0x9: "PWM_CONTROL"}},
+    "arduino_run_linetracker.bin":
+        {0: {**MOTOR_COMMANDS, 0x9: "READ_LT_DATA"}},
+    "arduino_run_usranger.bin":
+        {0: {**MOTOR_COMMANDS, 0x9: "PWM_CONTROL", 0xB: "GET_DISTANCE"}},
+    "arduino_run_gesture.bin":
+        {0: {**MOTOR_COMMANDS, 0x9: "READ_GESTURE"}},
+    "arduino_linetracker.bin":
+        {0: {0x1: "CONFIG_IOP_SWITCH", 0x3: "READ_LT_DATA"}},
+    "arduino_gesture.bin":
+        {0: {0x1: "CONFIG_IOP_SWITCH", 0x3: "READ_GESTURE"}},
+    "arduino_10DOF_IMU.bin": {0: {**IMU_COMMANDS, 0xF: "RESET"}},
+    "arduino_run_IMU.bin": {0: IMU_COMMANDS, 1: MOTOR_COMMANDS}}
+
+'''
+The programs running on the Microblazes, and the configuration commands
+they executed, are kept in STATE_PATH so that a new Python process can
+reattach to them instead of reloading them. STATE_DIR is private to the
+user: the state is only used when the directory and the file belong to
+the user and cannot be written by anybody else, and the file is replaced
+atomically rather than written through a path that could be a link.
+'''
+STATE_DIR = os.path.join(tempfile.gettempdir(),
+                         "pynq_arduino_{}".format(os.getuid()))
+STATE_PATH = os.path.join(STATE_DIR, "state.json")
+
+_backend = None
+_mailboxes = {}
+_mailboxes_lock = threading.Lock()
+_instrumented = False
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def set_backend(backend):
+    """Select what the drivers run their Microblaze programs on.
+
+    Parameters
+    ----------
+    backend : callable
+        Called as `backend(mb_info, program)` in place of `Arduino`; it
+        must return an object with the `write_mailbox`, `read_mailbox` and
+        `write_blocking_command` methods of `Arduino`. `None` restores
+        the Arduino Microblaze.
+
+    Returns
+    -------
+    callable
+        The backend that was selected before.
+
+    """
+    global _backend
+    previous = _backend
+    _backend = backend
+    return previous
+
+
+def open_mailbox(mb_info, program, page_command=None, name=None,
+                 reload=False):
+    """Load a Microblaze program and return its mailbox.
+
+    When the program is already running on the Microblaze, it is not
+    loaded again: in this process, the drivers get a share of the mailbox
+    it was opened with, as long as the PL still reports the program
+    running with the same bitstream; in a new process, the Microblaze is
+    reattached if the program recorded in STATE_PATH is still the one
+    running according to the PL. In both cases the configuration commands
+    executed through `Mailbox.configure` are remembered. When the PL
+    state changed, e.g. after the overlay was downloaded again, the
+    program is loaded and configured from scratch.
+
+    Parameters
+    ----------
+    mb_info : dict
+        A dictionary storing Microblaze information, such as the
+        IP name and the reset name.
+    program : str
+        The Microblaze program to load.
+    page_command : int
+        The command selecting the device, for paged programs.
+    name : str
+        The name of the driver, used in the mailbox statistics.
+    reload : bool
+        Whether to load the program even when it is already running.
+
+    Returns
+    -------
+    Mailbox
+        The mailbox of the Microblaze running the program.
+
+    """
+    key = (_backend, mb_info.get("ip_name"))
+    program_name = os.path.basename(program)
+    with _mailboxes_lock:
+        mailbox = _mailboxes.pop(key, None)
+        stale = False
+        if mailbox is not None and _backend is None:
+            stale = _pl_state(mailbox.ip_name) != mailbox.pl_state
+        if stale:
+            mailbox.config = {}
+        elif not reload and mailbox is not None and \
+                mailbox.program == program_name:
+            _mailboxes[key] = mailbox
+            return mailbox.share(name)
+        commands = PROGRAM_COMMANDS.get(program_name)
+        microblaze = None
+        config = {}
+        if _backend is not None:
+            microblaze = _backend(mb_info, program)
+        elif not reload and not stale:
+            microblaze, config = _reattach(mb_info, program)
+        if microblaze is None:
+            microblaze = Arduino(mb_info, program)
+        mailbox = Mailbox(microblaze, page_command, name, commands)
+        mailbox.program = program_name
+        mailbox.config = config
+        if _backend is None:
+            mailbox.ip_name = mb_info.get("ip_name")
+            mailbox.pl_state = _pl_state(mailbox.ip_name)
+            _save_state(mailbox)
+        _mailboxes[key] = mailbox
+        return mailbox
+
+
+def clear_programs():
+    """Forget the programs running on the Microblazes.
+
+    The next drivers created load their program and configure it again.
+
+    Returns
+    -------
+    None
+
+    """
+    with _mailboxes_lock:
+        _mailboxes.clear()
+        if _state_dir():
+            try:
+                os.remove(STATE_PATH)
+            except OSError:
+                pass
+
+
+class _RunningArduino(Arduino):
+    """An Arduino created without loading its program, which is running.
+    """
+    def program(self):
+        self.state = "RUNNING"
+
+
+def _pl_state(ip_name):
+    try:
+        from pynq import PL
+        return PL.ip_dict[ip_name]["state"], PL.timestamp
+    except Exception:
+        return None, None
+
+
+class _SharedState(object):
+    """The state of a Microblaze shared by the mailboxes of its drivers.
+    """
+    def __init__(self):
+        self.page = None
+        self.config = {}
+        self.motor_key = None
+        self.motor_time = None
+        self.odometry_ticks = (0, 0)
+
+
+def _private(info, kind):
+    return kind(info.st_mode) and info.st_uid == os.getuid() and \
+        not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _state_dir():
+    try:
+        os.mkdir(STATE_DIR, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return False
+    try:
+        return _private(os.lstat(STATE_DIR), stat.S_ISDIR)
+    except OSError:
+        return False
+
+
+def _load_state():
+    if not _state_dir():
+        return {}
+    try:
+        fd = os.open(STATE_PATH, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return {}
+    with os.fdopen(fd) as f:
+        if not _private(os.fstat(fd), stat.S_ISREG):
+            return {}
+        try:
+            return json.load(f)
+        except ValueError:
+            return {}
+
+
+def _save_state(mailbox):
+    if mailbox.ip_name is None:
+        return
+    state = _load_state()
+    state[mailbox.ip_name] = {
+        "program": mailbox.program,
+        "timestamp": _pl_state(mailbox.ip_name)[1],
+        "config": [[page, command] + list(entry)
+                   for (page, command), entry in mailbox.config.items()]}
+    if not _state_dir():
+        return
+    try:
+        fd, path = tempfile.mkstemp(dir=STATE_DIR)
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(path, STATE_PATH)
+    except OSError:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _reattach(mb_info, program):
+    entry = _load_state().get(mb_info.get("ip_name"))
+    if entry is None or entry["program"] != os.path.basename(program):
+        return None, {}
+    running, timestamp = _pl_state(mb_info.get("ip_name"))
+    if running is None or timestamp != entry["timestamp"] or \
+            os.path.basename(running) != entry["program"]:
+        return None, {}
+    try:
+        microblaze = _RunningArduino(mb_info, program)
+    except Exception:
+        return None, {}
+    config = {(page, command): (data, result)
+              for page, command, data, result in entry["config"]}
+    return microblaze, config
+
+
+def enable_instrumentation():
+    """Start recording the latency of every mailbox command.
+
+    The latencies are recorded by driver and command, e.g.
+    "RUN_IMU.GET_QUA_DATA", in histograms read with `stats`. When the
+    instrumentation is disabled, which is the default, a command only
+    costs an extra test of a global flag.
+
+    Returns
+    -------
+    None
+
+    """
+    global _instrumented
+    _instrumented = True
+
+
+def disable_instrumentation():
+    """Stop recording the latency of the mailbox commands.
+
+    The statistics recorded so far are kept.
+
+    Returns
+    -------
+    None
+
+    """
+    global _instrumented
+    _instrumented = False
+
+
+def stats(reset=False):
+    """Get the latency statistics of the mailbox commands.
+
+    Parameters
+    ----------
+    reset : bool
+        Whether to clear the statistics after reading them.
+
+    Returns
+    -------
+    dict
+        For each driver and command, e.g. "Automoto.MOVE", the count and
+        the mean, min, max, p50, p90, p99 and p99_9 latencies in seconds.
+
+    """
+    global _histograms
+    with _histograms_lock:
+        histograms = _histograms
+        if reset:
+            _histograms = {}
+        return {key: histogram.summary()
+                for key, histogram in sorted(histograms.items())}
+
+
+def reset_stats():
+    """Clear the latency statistics of the mailbox commands.
+
+    Returns
+    -------
+    None
+
+    """
+    stats(reset=True)
+
+
+def _record(key, seconds):
+    with _histograms_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = LatencyHistogram()
+        histogram.record(seconds * 1e9)
+
+
+class _PriorityLock(object):
+    """Re-entrant lock handing itself to the most urgent waiter.
+
+    Waiters are served by priority, then in arrival order.
+
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._owner = None
+        self._depth = 0
+
+    def acquire(self, priority):
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return
+            entry = (priority, next(self._sequence), me)
+            heapq.heappush(self._waiters, entry)
+            while self._owner is not None or self._waiters[0] is not entry:
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self._owner = me
+            self._depth = 1
+
+    def release(self):
+        with self._cond:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._cond.notify_all()
+
+
+class Mailbox(object):
+    """This class serializes the access to the mailbox of a Microblaze.
+
+    A command is written, executed and its result read back as one atomic
+    transaction, so that several threads can share a driver without
+    interleaving their mailbox accesses. Pending motor transactions are
+    served before pending sensor reads. The drivers sharing a Microblaze
+    get their own mailbox with `share`, which has the same lock and state
+    but names their commands in the statistics.
+
+    Attributes
+    ----------
+    microblaze : Arduino
+        Microblaze processor instance the mailbox belongs to.
+    page_command : int
+        The command selecting the device on programs that drive several
+        devices through pages, or None.
+    page : int
+        The page currently selected on the Microblaze, or None.
+    name : str
+        The name of the driver using the mailbox.
+    commands : dict
+        The names of the commands of the program, by page.
+    program : str
+        The name of the program running on the Microblaze.
+    ip_name : str
+        The name of the Microblaze IP, when the program state is saved.
+    pl_state : tuple
+        The program the PL reported running on the Microblaze, and the
+        timestamp of the bitstream, when the mailbox was opened.
+    config : dict
+        The arguments and results of the configuration commands executed,
+        by page and command.
+    motor_key : tuple
+        The last motor command sent, with its arguments, by any driver.
+    motor_time : float
+        When it was sent, in `time.monotonic()` seconds.
+    odometry_ticks : tuple
+        The left and right tick counts last read by the odometry of any
+        driver.
+
+    """
+    def __init__(self, microblaze, page_command=None, name=None,
+                 commands=None):
+        """Return a new instance of a mailbox object.
+
+        Parameters
+        ----------
+        microblaze : Arduino
+            Microblaze processor instance the mailbox belongs to.
+        page_command : int
+            The command selecting the device, for paged programs.
+        name : str
+            The name of the driver, used in the mailbox statistics.
+        commands : dict
+            The names of the commands of the program, by page.
+
+        """
+        self.microblaze = microblaze
+        self.page_command = page_command
+        self.name = name if name is not None else "Mailbox"
+        self.commands = commands if commands is not None else {}
+        self.program = None
+        self.ip_name = None
+        self.pl_state = (None, None)
+        self._shared = _SharedState()
+        self._keys = {}
+        self._lock = _PriorityLock()
+
+    @property
+    def page(self):
+        """The page currently selected on the Microblaze, or None."""
+        return self._shared.page
+
+    @page.setter
+    def page(self, page):
+        self._shared.page = page
+
+    @property
+    def config(self):
+        """The configuration commands executed, by page and command."""
+        return self._shared.config
+
+    @config.setter
+    def config(self, config):
+        self._shared.config = config
+
+    @property
+    def motor_key(self):
+        """The last motor command sent, with its arguments, or None."""
+        return self._shared.motor_key
+
+    @property
+    def motor_time(self):
+        """When the last motor command was sent, or None."""
+        return self._shared.motor_time
+
+    @property
+    def odometry_ticks(self):
+        """The left and right tick counts last read by the odometry."""
+        return self._shared.odometry_ticks
+
+    @odometry_ticks.setter
+    def odometry_ticks(self, ticks):
+        self._shared.odometry_ticks = ticks
+
+    def record_motor(self, key):
+        """Record the motor command in effect on the Microblaze.
+
+        Parameters
+        ----------
+        key : tuple
+            The command and its arguments; None when the motors are in an
+            unknown state.
+
+        Returns
+        -------
+        None
+
+        """
+        self._shared.motor_key = key
+        self._shared.motor_time = time.monotonic() if key is not None \
+            else None
+
+    def share(self, name=None):
+        """Get a mailbox for another driver of the same Microblaze.
+
+        Parameters
+        ----------
+        name : str
+            The name of the driver, used in the mailbox statistics.
+
+        Returns
+        -------
+        Mailbox
+            A mailbox sharing the lock, the page and the configuration of
+            this one.
+
+        """
+        mailbox = copy.copy(self)
+        mailbox.name = name if name is not None else "Mailbox"
+        mailbox._keys = {}
+        return mailbox
+
+    @contextmanager
+    def transaction(self, priority=PRIORITY_SENSOR, page=None):
+        """Hold the mailbox for a sequence of accesses.
+
+        Transactions are re-entrant: a thread already holding the mailbox
+        can open nested transactions.
+
+        Parameters
+        ----------
+        priority : int
+            PRIORITY_MOTOR or PRIORITY_SENSOR.
+        page : int
+            The page to select before the accesses, for paged programs.
+
+        Returns
+        -------
+        Mailbox
+            This mailbox, to be used inside the `with` block.
+
+        """
+        self._lock.acquire(priority)
+        try:
+            if page is not None:
+                self.select_page(page)
+            yield self
+        finally:
+            self._lock.release()
+
+    def select_page(self, page):
+        """Select the device the following commands are sent to.
+
+        The page command is only issued when the page actually changes.
+
+        Parameters
+        ----------
+        page : int
+            The page of the device.
+
+        Returns
+        -------
+        None
+
+        """
+        if page == self.page:
+            return
+        if self.page_command is None:
+            raise ValueError("the program does not support pages.")
+        with self.transaction(PRIORITY_MOTOR):
+            self.microblaze.write_mailbox(0, page)
+            self.write_blocking_command(self.page_command)
+            self.page = page
+
+    def transact(self, command, data=None, num_words=0,
+                 priority=PRIORITY_SENSOR, page=None):
+        """Write the arguments, execute a command and read its result.
+
+        Parameters
+        ----------
+        command : int
+            The command to execute.
+        data : int/list
+            The arguments written at the start of the mailbox, if any.
+        num_words : int
+            Number of 32-bit words to read back from the mailbox.
+        priority : int
+            PRIORITY_MOTOR or PRIORITY_SENSOR.
+        page : int
+            The page to select first, for paged programs.
+
+        Returns
+        -------
+        int/list
+            The words read back, or None when `num_words` is 0.
+
+        """
+        with self.transaction(priority, page):
+            if data is not None:
+                self.microblaze.write_mailbox(0, data)
+            self.write_blocking_command(command)
+            if num_words:
+                return self.microblaze.read_mailbox(0, num_words)
+            return None
+
+    def configure(self, command, data=None, num_words=0, page=None,
+                  registers=None, valid=None):
+        """Execute a configuration command, unless it was already executed.
+
+        A command that was executed with the same arguments since the
+        program was loaded is not executed again; the result it returned
+        then is returned instead. This keeps the drivers from initializing
+        their devices again when they are created on a running program.
+
+        Parameters
+        ----------
+        command : int
+            The configuration command, e.g. CONFIG_IOP_SWITCH.
+        data : int/list
+            The arguments written at the start of the mailbox, if any.
+        num_words : int
+            Number of 32-bit words to read back from the mailbox.
+        page : int
+            The page to select first, for paged programs.
+        registers : dict
+            Other arguments to write first, by mailbox offset.
+        valid : callable
+            Called with the result; the command is executed again next
+            time when it returns False, e.g. `all` for status words.
+
+        Returns
+        -------
+        int/list
+            The words read back, or None when `num_words` is 0.
+
+        """
+        arguments = json.loads(json.dumps(
+            [data, sorted((registers or {}).items())]))
+        key = (page if page is not None else 0, command)
+        with self.transaction(PRIORITY_MOTOR):
+            entry = self.config.get(key)
+            if entry is not None and entry[0] == arguments:
+                return entry[1]
+            with self.transaction(PRIORITY_MOTOR, page):
+                for offset, value in sorted((registers or {}).items()):
+                    self.microblaze.write_mailbox(offset, value)
+                result = self.transact(command, data, num_words,
+                                       PRIORITY_MOTOR)
+            self.record_motor(None)
+            result = json.loads(json.dumps(result, default=int))
+            if valid is not None and not valid(result):
+                self.config.pop(key, None)
+                return result
+            self.config[key] = (arguments, result)
+            with _mailboxes_lock:
+                _save_state(self)
+        return result
+
+    def write_mailbox(self, data_offset, data):
+        """Write data into the mailbox; see `Arduino.write_mailbox`."""
+        self.microblaze.write_mailbox(data_offset, data)
+
+    def read_mailbox(self, data_offset, num_words=1):
+        """Read data from the mailbox; see `Arduino.read_mailbox`."""
+        return self.microblaze.read_mailbox(data_offset, num_words)
+
+    def write_blocking_command(self, command):
+        """Execute a command; see `Arduino.write_blocking_command`.
+
+        Every command of the drivers goes through this method; its latency
+        is recorded here when the instrumentation is enabled.
+
+        """
+        if not _instrumented:
+            self.microblaze.write_blocking_command(command)
+            return
+        start = time.perf_counter()
+        self.microblaze.write_blocking_command(command)
+        _record(self._key(command), time.perf_counter() - start)
+
+    def _key(self, command):
+        page = self.page if self.page is not None else 0
+        key = self._keys.get((page, command))
+        if key is None:
+            if command == self.page_command:
+                name = "PAGE"
+            else:
+                name = self.commands.get(page, {}).get(
+                    command, "0x{:X}".format(command))
+            key = self._keys[(page, command)] = \
+                "{}.{}".format(self.name, name)
+        return key
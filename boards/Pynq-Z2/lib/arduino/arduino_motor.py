@@ -0,0 +1,302 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import threading
+import time
+from .arduino_codec import int2reg
+from .arduino_codec import reg2int
+from .arduino_mailbox import PRIORITY_MOTOR
+from .arduino_calibration import WheelCalibration
+
+
+__author__ = "zou cong"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+By default the wheel speeds are approximated by the closest
+MOTOR_DIRECTION: straight when both sides are within STRAIGHT_RATIO of
+each other, steering when they turn the same way, rotating otherwise.
+
+Programs with a PWM_CONTROL command are expected to take the signed duty
+cycles of motors a, b, c and d, from -100 to 100, as four two's complement
+words, so that the four wheels are set in one mailbox write; motors a and
+b drive the right side, c and d the left side. This layout is not checked
+against the firmware, so the raw path is opt-in: set `pwm_command` to
+PWM_CONTROL on a driver once the program is known to match.
+'''
+STRAIGHT_RATIO = 0.75
+
+'''
+The DISTANCE command of the car programs returns the signed tick count
+of the left (which = 1) or right (which = 2) wheels, and clears it when
+opt = 1. Tick deltas are taken modulo 2 ** 32 like the counters.
+'''
+DISTANCE = 0x7
+
+'''
+Motor commands go through a layer that drops a command identical to the
+one in effect, and holds back commands coming faster than `max_rate`:
+the latest one held back is sent once the rate allows, unless another
+command supersedes it first. STOP is never dropped nor delayed. The
+command in effect is kept on the mailbox, so that the drivers sharing a
+Microblaze see each other's commands; configuring the program forgets it.
+'''
+
+
+def _check_speed(speed):
+    if int(speed) != speed or not -100 <= speed <= 100:
+        raise ValueError("velocity should be in the range from -100 to 100")
+    return int(speed)
+
+
+def nearest_motion(left, right):
+    """Get the MOTOR_DIRECTION move closest to a pair of wheel speeds.
+
+    Parameters
+    ----------
+    left, right : int
+        Signed speeds of the left and right wheels, from -100 to 100.
+
+    Returns
+    -------
+    tuple
+        The direction and the speed of the move, or None to stop.
+
+    """
+    speed = max(abs(left), abs(right))
+    if speed == 0:
+        return None
+    if left * right < 0:
+        return ("LEFT_R" if right > left else "RIGHT_R"), speed
+    if min(abs(left), abs(right)) >= STRAIGHT_RATIO * speed:
+        return ("FORWARD" if left + right > 0 else "BACKWARD"), speed
+    if left + right < 0:
+        return "BACKWARD", speed
+    return ("LEFT_S" if right > left else "RIGHT_S"), speed
+
+
+class MotorMixin(object):
+    """This class is the motor command layer shared by the car drivers.
+
+    It coalesces and rate limits the motor commands, and adds per-wheel
+    speed control. The driver must have a `mailbox`, and `move` and
+    `stop` methods sending their commands with `_motor_command` and
+    `_stop_motors`. The per-wheel speeds go through `move` unless
+    `pwm_command` is set to the PWM_CONTROL command of the program.
+
+    Attributes
+    ----------
+    pwm_command : int
+        The command setting the four duty cycles; None, the default, to
+        use the closest `move` instead.
+    motor_page : int
+        The page of the motors, for paged programs.
+    calibration : WheelCalibration
+        Converts the wheel ticks into distances.
+    max_rate : float
+        Maximum number of motor commands per second; None for no limit.
+    coalesce : bool
+        Whether to drop a command identical to the one in effect.
+    motor_sent : int
+        Number of motor commands sent to the Microblaze.
+    motor_coalesced : int
+        Number of motor commands dropped as identical.
+    motor_deferred : int
+        Number of motor commands held back by the rate limit.
+
+    """
+    pwm_command = None
+    motor_page = None
+    calibration = WheelCalibration()
+    max_rate = None
+    coalesce = True
+    motor_sent = 0
+    motor_coalesced = 0
+    motor_deferred = 0
+    _pending = None
+    _timer = None
+
+    def set_wheels(self, a, b, c, d):
+        """Set the signed duty cycle of each motor.
+
+        Parameters
+        ----------
+        a, b, c, d : int
+            Duty cycles of the right front, right rear, left front and
+            left rear motors, from -100 (backward) to 100 (forward).
+
+        Returns
+        -------
+        None
+
+        """
+        speeds = [_check_speed(speed) for speed in (a, b, c, d)]
+        if self.pwm_command is None:
+            self._move_nearest((speeds[2] + speeds[3]) // 2,
+                               (speeds[0] + speeds[1]) // 2)
+            return
+        self._motor_command(self.pwm_command, int2reg(speeds))
+
+    def drive(self, left, right):
+        """Set the speed of the left and right wheels.
+
+        Parameters
+        ----------
+        left, right : int
+            Signed speeds of the left and right wheels, from -100
+            (backward) to 100 (forward).
+
+        Returns
+        -------
+        None
+
+        """
+        left = _check_speed(left)
+        right = _check_speed(right)
+        if self.pwm_command is None:
+            self._move_nearest(left, right)
+            return
+        self.set_wheels(right, right, left, left)
+
+    def _move_nearest(self, left, right):
+        motion = nearest_motion(left, right)
+        if motion is None:
+            self.stop()
+        else:
+            self.move(*motion)
+
+    def flush(self):
+        """Send the motor command held back by the rate limit, if any.
+
+        Returns
+        -------
+        None
+
+        """
+        with self.mailbox.transaction(PRIORITY_MOTOR):
+            pending = self._pending
+            self._cancel_pending()
+            if pending is not None:
+                self._send_motor(*pending)
+
+    def _motor_command(self, command, data=None, page=None):
+        key = (command, None if data is None else tuple(data))
+        with self.mailbox.transaction(PRIORITY_MOTOR):
+            if self.coalesce and key == self.mailbox.motor_key:
+                self._cancel_pending()
+                self.motor_coalesced += 1
+                return
+            wait = self._motor_wait()
+            if wait > 0:
+                self._pending = (key, data, page)
+                self.motor_deferred += 1
+                if self._timer is None:
+                    self._arm_timer(wait)
+                return
+            self._cancel_pending()
+            self._send_motor(key, data, page)
+
+    def _stop_motors(self, command, page=None):
+        with self.mailbox.transaction(PRIORITY_MOTOR):
+            self._cancel_pending()
+            self._send_motor((command, None), None, page)
+
+    def _send_motor(self, key, data, page):
+        self.mailbox.transact(key[0], data, priority=PRIORITY_MOTOR,
+                              page=page)
+        self.mailbox.record_motor(key)
+        self.motor_sent += 1
+
+    def _motor_wait(self):
+        sent = self.mailbox.motor_time
+        if not self.max_rate or sent is None:
+            return 0.0
+        return sent + 1.0 / self.max_rate - time.monotonic()
+
+    def _arm_timer(self, wait):
+        self._timer = threading.Timer(wait, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_pending(self):
+        self._pending = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timer(self):
+        with self.mailbox.transaction(PRIORITY_MOTOR):
+            if threading.current_thread() is not self._timer:
+                return
+            self._timer = None
+            if self._pending is None:
+                return
+            wait = self._motor_wait()
+            if wait > 0:
+                self._arm_timer(wait)
+            else:
+                self.flush()
+
+    def read_odometry_delta(self):
+        """Get the distance covered by each wheel since the last call.
+
+        Both counters are read in one transaction and never cleared, so
+        that no tick is lost between two calls. The last counts read are
+        kept on the mailbox: the drivers sharing the Microblaze get the
+        distance since the last call by any of them, and a counter
+        cleared by `distance(1, which)` restarts from zero for all. The
+        first call gets the distance since the counters were cleared.
+
+        Returns
+        -------
+        list
+            The signed left and right tick deltas, then the same deltas
+            in meters.
+
+        """
+        with self.mailbox.transaction(page=self.motor_page):
+            ticks = (self._read_ticks(0, 1), self._read_ticks(0, 2))
+            last = self.mailbox.odometry_ticks
+            self.mailbox.odometry_ticks = ticks
+        left = reg2int(int2reg(ticks[0] - last[0]))
+        right = reg2int(int2reg(ticks[1] - last[1]))
+        return [left, right] + list(self.calibration.to_meters(left, right))
+
+    def _read_ticks(self, opt, which):
+        with self.mailbox.transaction():
+            ticks = reg2int(self.mailbox.transact(DISTANCE, [opt, which], 1,
+                                                  page=self.motor_page))
+            if opt == 1:
+                left, right = self.mailbox.odometry_ticks
+                self.mailbox.odometry_ticks = (0 if which != 2 else left,
+                                               0 if which != 1 else right)
+        return ticks
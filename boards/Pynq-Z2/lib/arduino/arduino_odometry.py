@@ -0,0 +1,313 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import time
+import numpy as np
+from .arduino_sampler import RingBuffer
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+Quaternions are [w, x, y, z] arrays as returned by `get_qua`. The helpers
+below work on the last axis, so that a whole array of samples is rotated
+in one call.
+'''
+
+
+def quat_multiply(p, q):
+    """Multiply quaternions, element-wise over the leading axes.
+
+    Parameters
+    ----------
+    p, q : numpy.ndarray
+        Quaternions of shape (..., 4).
+
+    Returns
+    -------
+    numpy.ndarray
+        The products p * q, of shape (..., 4).
+
+    """
+    p = np.asarray(p, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+    pw, px, py, pz = np.moveaxis(p, -1, 0)
+    qw, qx, qy, qz = np.moveaxis(q, -1, 0)
+    return np.stack([pw*qw - px*qx - py*qy - pz*qz,
+                     pw*qx + px*qw + py*qz - pz*qy,
+                     pw*qy - px*qz + py*qw + pz*qx,
+                     pw*qz + px*qy - py*qx + pz*qw], axis=-1)
+
+
+def quat_rotate(q, v):
+    """Rotate vectors by quaternions, element-wise over the leading axes.
+
+    This is the `qua2vec` of the trajectory notebook, for arrays.
+
+    Parameters
+    ----------
+    q : numpy.ndarray
+        Unit quaternions of shape (..., 4).
+    v : numpy.ndarray
+        Vectors of shape (..., 3).
+
+    Returns
+    -------
+    numpy.ndarray
+        The rotated vectors, of shape (..., 3).
+
+    """
+    q = np.asarray(q, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    w = q[..., :1]
+    u = q[..., 1:]
+    t = 2 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
+
+
+def quat_yaw(q):
+    """Get the heading of quaternions, in radians.
+
+    Parameters
+    ----------
+    q : numpy.ndarray
+        Unit quaternions of shape (..., 4).
+
+    Returns
+    -------
+    numpy.ndarray
+        The rotation around the Z-axis, from -pi to pi.
+
+    """
+    q = np.asarray(q, dtype=np.float64)
+    w, x, y, z = np.moveaxis(q, -1, 0)
+    return np.arctan2(2 * (w*z + x*y), 1 - 2 * (y*y + z*z))
+
+
+def _normalize(q):
+    q = np.asarray(q, dtype=np.float64)
+    norm = np.linalg.norm(q, axis=-1, keepdims=True)
+    return q / np.where(norm > 0, norm, 1)
+
+
+class Odometry(object):
+    """This class keeps the pose of the car from its wheels and its IMU.
+
+    Each update integrates the distance covered by the left and right
+    wheels along the heading given by the IMU quaternion; without an IMU,
+    the heading is integrated from the difference between the wheels.
+
+    The covariance of (x, y, heading) grows with the distance covered:
+    the wheel noise is proportional to the distance, and the heading
+    uncertainty spreads it across the direction of travel. With an IMU,
+    the heading is measured rather than integrated, so its variance
+    stays at the one of the IMU.
+
+    Poses are kept in a ring buffer of bounded size.
+
+    Attributes
+    ----------
+    car : object
+        The driver reading the wheel distances, e.g. RUN_IMU or Automoto.
+    imu : object
+        The driver reading the quaternion, e.g. RUN_IMU, or None.
+    position : numpy.ndarray
+        The position in meters, in the frame of the first update.
+    yaw : float
+        The heading in radians.
+    covariance : numpy.ndarray
+        The 3x3 covariance of x, y and the heading.
+    history : RingBuffer
+        The latest poses.
+
+    """
+    def __init__(self, car, imu=None, size=4096, track_width=None,
+                 wheel_noise=0.05, heading_noise=0.035):
+        """Return a new instance of an odometry object.
+
+        Parameters
+        ----------
+        car : object
+            The driver reading the wheel distances.
+        imu : object
+            The driver reading the quaternion; `car` itself when it has
+            a `get_qua` method, and no IMU otherwise.
+        size : int
+            Number of poses kept in the history.
+        track_width : float
+            Distance between the left and right wheels, in meters; taken
+            from the calibration of `car` by default.
+        wheel_noise : float
+            Standard deviation of the wheel distance, relative to it.
+        heading_noise : float
+            Standard deviation of the IMU heading, in radians.
+
+        """
+        if imu is None and hasattr(car, "get_qua"):
+            imu = car
+        self.car = car
+        self.imu = imu
+        if track_width is None:
+            track_width = car.calibration.track_width
+        self.track_width = track_width
+        self.wheel_noise = wheel_noise
+        self.heading_noise = heading_noise
+        dtype = [("timestamp", "f8"), ("position", "f8", (3,)),
+                 ("yaw", "f8"), ("covariance", "f8", (3, 3))]
+        self.history = RingBuffer(dtype, size)
+        self.reset()
+
+    def reset(self, position=(0.0, 0.0, 0.0), yaw=0.0):
+        """Set the pose of the car and clear its uncertainty.
+
+        Parameters
+        ----------
+        position : list
+            The position in meters.
+        yaw : float
+            The heading in radians. With an IMU, the next quaternion is
+            aligned to it, and the later headings follow the IMU.
+
+        Returns
+        -------
+        None
+
+        """
+        self.position = np.array(position, dtype=np.float64)
+        self.yaw = float(yaw)
+        self.covariance = np.zeros((3, 3))
+        self._yaw_offset = None
+
+    def pose(self):
+        """Get the current pose.
+
+        Returns
+        -------
+        tuple
+            The x and y position in meters and the heading in radians.
+
+        """
+        return float(self.position[0]), float(self.position[1]), self.yaw
+
+    def update(self, left, right, qua=None, timestamp=None):
+        """Integrate the distances covered by the wheels.
+
+        The arguments may be arrays of consecutive samples, which are
+        integrated at once.
+
+        Parameters
+        ----------
+        left, right : float/numpy.ndarray
+            Distance covered by the left and right wheels since the
+            previous update, in meters.
+        qua : list/numpy.ndarray
+            The IMU quaternion of each sample, or None.
+        timestamp : float/numpy.ndarray
+            The time of each sample; now by default.
+
+        Returns
+        -------
+        tuple
+            The new pose, see `pose`; unchanged when no sample is given.
+
+        """
+        left = np.atleast_1d(np.asarray(left, dtype=np.float64))
+        right = np.atleast_1d(np.asarray(right, dtype=np.float64))
+        d = (left + right) / 2
+        n = len(d)
+        if not n:
+            return self.pose()
+        if timestamp is None:
+            timestamp = np.full(n, time.monotonic())
+        timestamp = np.broadcast_to(np.asarray(timestamp, np.float64), (n,))
+
+        if qua is not None:
+            q = _normalize(np.reshape(qua, (n, 4)))
+            if self._yaw_offset is None:
+                yaw0 = quat_yaw(q[0])
+                self._yaw_offset = np.array([np.cos((self.yaw - yaw0) / 2),
+                                             0, 0,
+                                             np.sin((self.yaw - yaw0) / 2)])
+            q = quat_multiply(self._yaw_offset, q)
+            steps = d[:, None] * quat_rotate(q, [1.0, 0.0, 0.0])
+            yaws = quat_yaw(q)
+            yaw_var = np.full(n, self.heading_noise ** 2)
+        else:
+            turn = (right - left) / self.track_width
+            yaws = self.yaw + np.cumsum(turn)
+            mid = yaws - turn / 2
+            steps = np.stack([d * np.cos(mid), d * np.sin(mid),
+                              np.zeros(n)], axis=-1)
+            turn_var = 2 * (self.wheel_noise * np.abs(d) /
+                            self.track_width) ** 2
+            yaw_var = self.covariance[2, 2] + np.cumsum(turn_var)
+
+        positions = self.position + np.cumsum(steps, axis=0)
+        along = np.stack([np.cos(yaws), np.sin(yaws)], axis=-1)
+        across = np.stack([-along[:, 1], along[:, 0]], axis=-1)
+        d_var = (self.wheel_noise * d) ** 2
+        growth = d_var[:, None, None] * along[:, :, None] * \
+            along[:, None, :] + (d * d * yaw_var)[:, None, None] * \
+            across[:, :, None] * across[:, None, :]
+        xy = self.covariance[:2, :2] + np.cumsum(growth, axis=0)
+
+        covariances = np.zeros((n, 3, 3))
+        covariances[:, :2, :2] = xy
+        covariances[:, 2, 2] = yaw_var
+        for i in range(n):
+            self.history.append((timestamp[i], positions[i], yaws[i],
+                                 covariances[i]))
+        self.position = positions[-1]
+        self.yaw = float(yaws[-1])
+        self.covariance = covariances[-1]
+        return self.pose()
+
+    def poll(self):
+        """Read the wheels and the IMU, and update the pose.
+
+        The wheels are read with `read_odometry_delta`, so that each
+        update gets the distance covered since the previous one.
+
+        Returns
+        -------
+        tuple
+            The new pose, see `pose`.
+
+        """
+        if self.imu is self.car and hasattr(self.car, "batch"):
+            qua, (_, _, left, right) = self.car.batch(
+                [("get_qua",), ("read_odometry_delta",)])
+        else:
+            qua = self.imu.get_qua() if self.imu is not None else None
+            _, _, left, right = self.car.read_odometry_delta()
+        return self.update(left, right, qua)
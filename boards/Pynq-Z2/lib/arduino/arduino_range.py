@@ -0,0 +1,337 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import collections
+import time
+from .arduino_sampler import PeriodicWorker
+from .arduino_sampler import RingBuffer
+
+
+__author__ = "zou cong"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+The ultrasonic ranger returns distances in cm; RANGE_SENTINEL is returned
+when the sensor did not answer and needs to be rebooted. Readings outside
+the range of the sensor are dropped like the sentinel.
+'''
+RANGE_SENTINEL = 1000
+RANGE_MIN = 2
+RANGE_MAX = 400
+
+'''
+Scale of the median absolute deviation to the standard deviation of
+normally distributed readings.
+'''
+MAD_SCALE = 1.4826
+
+
+class RangeFilter(object):
+    """This class filters a stream of ultrasonic ranger readings.
+
+    Each reading goes through three stages:
+
+    1. Sentinel and out of range readings are dropped. When no valid
+       reading arrived for `timeout` seconds the distance is unknown.
+    2. Readings moving away from the filtered distance faster than
+       `max_rate` are held back, unless `confirm` of them in a row agree,
+       each within the gate step of the one before, in which case the
+       window restarts from the new distance: a real obstacle appearing
+       in front of the car is accepted after a couple of periods, a
+       single spike or scattered spikes never.
+    3. A Hampel filter replaces the readings further than `threshold`
+       scaled median absolute deviations from the median of the last
+       `window` readings by that median; the filtered distance is the
+       median of the window.
+
+    Attributes
+    ----------
+    distance : float
+        The filtered distance in cm, or None when unknown.
+    timestamp : float
+        When the last valid reading was taken.
+    samples : int
+        Number of readings filtered.
+    dropouts : int
+        Number of sentinel and out of range readings.
+    gated : int
+        Number of readings held back by the rate gate.
+    outliers : int
+        Number of readings replaced by the Hampel filter.
+
+    """
+    def __init__(self, window=5, threshold=3.0, max_rate=300.0,
+                 confirm=2, timeout=0.5):
+        """Return a new instance of a range filter object.
+
+        Parameters
+        ----------
+        window : int
+            Number of readings of the median window.
+        threshold : float
+            Outlier threshold, in scaled median absolute deviations.
+        max_rate : float
+            Largest plausible rate of change of the distance, in cm/s;
+            None disables the gate.
+        confirm : int
+            Number of consecutive gated readings accepted as a jump.
+        timeout : float
+            Age in seconds after which the distance is unknown.
+
+        """
+        if window < 1:
+            raise ValueError("window should be at least 1.")
+        if confirm < 1:
+            raise ValueError("confirm should be at least 1.")
+        self.window = window
+        self.threshold = threshold
+        self.max_rate = max_rate
+        self.confirm = confirm
+        self.timeout = timeout
+        self.reset()
+
+    def reset(self):
+        """Forget the readings filtered so far.
+
+        Returns
+        -------
+        None
+
+        """
+        self._window = collections.deque(maxlen=self.window)
+        self._jump = []
+        self._distance = None
+        self.timestamp = None
+        self.samples = 0
+        self.dropouts = 0
+        self.gated = 0
+        self.outliers = 0
+
+    @property
+    def distance(self):
+        """The filtered distance in cm, or None when unknown."""
+        if self.stale():
+            return None
+        return self._distance
+
+    def stale(self, now=None):
+        """Whether no valid reading arrived for `timeout` seconds.
+
+        Parameters
+        ----------
+        now : float
+            The current `time.monotonic()` time; read when not given.
+
+        Returns
+        -------
+        bool
+            True when the filtered distance is unknown.
+
+        """
+        if self.timestamp is None:
+            return True
+        if now is None:
+            now = time.monotonic()
+        return now - self.timestamp > self.timeout
+
+    def update(self, reading, timestamp=None):
+        """Filter a new reading of the ranger.
+
+        Parameters
+        ----------
+        reading : int
+            The distance read, in cm.
+        timestamp : float
+            When it was read, in `time.monotonic()` seconds.
+
+        Returns
+        -------
+        float
+            The filtered distance in cm, or None when unknown.
+
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.samples += 1
+        if not RANGE_MIN <= reading <= RANGE_MAX:
+            self.dropouts += 1
+            return None if self.stale(timestamp) else self._distance
+        reading = float(reading)
+        if self.stale(timestamp):
+            self._window.clear()
+            self._jump = []
+        elif self.max_rate is not None:
+            step = self.max_rate * (timestamp - self.timestamp)
+            if abs(reading - self._distance) > step:
+                self.gated += 1
+                if self._jump:
+                    last, previous = self._jump[-1]
+                    if abs(reading - previous) > \
+                            self.max_rate * (timestamp - last):
+                        self._jump = []
+                self._jump.append((timestamp, reading))
+                if len(self._jump) < self.confirm:
+                    return self._distance
+                self._window.clear()
+                self._window.extend(v for _, v in self._jump[-self.window:])
+                self._jump = []
+                return self._accept(timestamp)
+        self._jump = []
+        self._window.append(self._hampel(reading))
+        return self._accept(timestamp)
+
+    def _hampel(self, reading):
+        if len(self._window) < 3:
+            return reading
+        values = sorted(self._window)
+        median = _median(values)
+        mad = _median(sorted(abs(v - median) for v in values)) * MAD_SCALE
+        if abs(reading - median) > self.threshold * max(mad, 1.0):
+            self.outliers += 1
+            return median
+        return reading
+
+    def _accept(self, timestamp):
+        self.timestamp = timestamp
+        self._distance = _median(sorted(self._window))
+        return self._distance
+
+
+def _median(values):
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+class RangeSampler(PeriodicWorker):
+    """This class samples an ultrasonic ranger in the background.
+
+    The readings are filtered as they arrive, so that the filtered
+    distance can be queried at any time without waiting for the mailbox.
+    The raw and filtered distances are kept in a ring buffer of records
+    holding a `time.monotonic()` timestamp, the reading and the filtered
+    distance (NaN when unknown).
+
+    Attributes
+    ----------
+    ranger : Run_usranger
+        The driver being sampled.
+    period : float
+        Sampling period in seconds.
+    filter : RangeFilter
+        The filter the readings go through.
+    buffer : RingBuffer
+        The buffer the samples are written to.
+    overruns : int
+        Number of periods missed because sampling took too long.
+    error : Exception
+        The exception that stopped the sampling thread, if any.
+
+    """
+    def __init__(self, ranger, rate=16, size=256, range_filter=None):
+        """Return a new instance of a range sampler object.
+
+        Parameters
+        ----------
+        ranger : Run_usranger
+            The driver to sample.
+        rate : float
+            Sampling rate in Hz; the ranger needs about 60 ms between
+            two measurements.
+        size : int
+            Number of samples kept in the ring buffer.
+        range_filter : RangeFilter
+            The filter of the readings; a default one is created when
+            none is given.
+
+        """
+        if rate <= 0:
+            raise ValueError("sampling rate should be positive.")
+        PeriodicWorker.__init__(self, 1.0 / rate)
+        self.ranger = ranger
+        self.filter = range_filter if range_filter is not None \
+            else RangeFilter()
+        self.buffer = RingBuffer(
+            [("timestamp", "f8"), ("reading", "i4"), ("distance", "f4")],
+            size)
+
+    def sample(self):
+        """Read the ranger once and filter the reading.
+
+        Returns
+        -------
+        float
+            The filtered distance in cm, or None when unknown.
+
+        """
+        reading = self.ranger.get_distance()
+        now = time.monotonic()
+        distance = self.filter.update(reading, now)
+        self.buffer.append((now, reading,
+                            distance if distance is not None else
+                            float("nan")))
+        return distance
+
+    def nearest_obstacle(self):
+        """Get the filtered distance without accessing the mailbox.
+
+        Returns
+        -------
+        float
+            The distance to the nearest obstacle in cm, or None when no
+            valid reading arrived recently.
+
+        """
+        return self.filter.distance
+
+    def window(self, num=None, seconds=None):
+        """Get the latest samples without accessing the mailbox.
+
+        Parameters
+        ----------
+        num : int
+            Maximum number of samples; all the buffered ones by default.
+        seconds : float
+            Only keep the samples taken at most this long before the
+            latest one.
+
+        Returns
+        -------
+        numpy.ndarray
+            The records in chronological order.
+
+        """
+        return self.buffer.window(num, seconds)
+
+    def _tick(self):
+        self.sample()
@@ -0,0 +1,301 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import collections
+import time
+import numpy as np
+from . import GESTURE_DICT
+from .arduino_codec import int2reg
+from .arduino_mailbox import set_backend
+from .arduino_simulator import SimulatedArduino
+from .arduino_telemetry import TelemetryReader
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+The telemetry channels the sensor commands are answered from. DISTANCE
+is answered from the running sum of the recorded odometry deltas.
+'''
+REPLAY_METHODS = ["get_axis", "get_eul", "get_qua", "read_lt_data",
+                  "get_distance", "read_gesture", "read_odometry_delta"]
+GESTURE_CODES = {name: code for code, name in GESTURE_DICT.items()}
+
+
+class ReplayBackend(object):
+    """This class replays a telemetry log in place of the Microblaze.
+
+    Once installed with `with ReplayBackend(path) as replay:` (or
+    `set_backend(replay.open)`), every driver created answers its sensor
+    reads from the log recorded by a `TelemetryRecorder`, so that a
+    controller can be run again on a workstation. Motor commands are not
+    executed but kept in `motor_log`.
+
+    With a `speed`, the log is replayed on the clock: each read returns
+    the last record at the replay time, which runs `speed` times as fast
+    as real time. Without a speed, the log is replayed as fast as
+    possible and deterministically: each read of a sensor returns its
+    next record and moves the replay time to it. The wheel counters
+    follow the replay time: a second read of a counter at the same time,
+    or a motor command once the counters were read, moves it to the
+    next odometry record, so that a controller driving on odometry alone
+    sees the car move.
+
+    Attributes
+    ----------
+    reader : TelemetryReader
+        The log being replayed.
+    speed : float
+        Replay speed relative to real time, or None.
+    commands : Counter
+        Number of commands executed, by command name.
+    motor_log : list
+        The motor commands received, as (replay time, command, args).
+
+    """
+    def __init__(self, log, speed=None, sources=None, clock=time.monotonic):
+        """Return a new instance of a replay backend object.
+
+        Parameters
+        ----------
+        log : str/TelemetryReader
+            The telemetry log to replay.
+        speed : float
+            Replay speed: 1.0 for real time, more to accelerate; None to
+            replay as fast as possible.
+        sources : dict
+            The channel to replay for some methods, e.g.
+            `{"get_qua": "RUN_IMU.get_qua"}`; by default, the first
+            channel recording the method.
+        clock : callable
+            The clock of the timed replay, in seconds.
+
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError("replay speed should be positive.")
+        if isinstance(log, str):
+            log = TelemetryReader(log)
+        self.reader = log
+        self.speed = speed
+        self.clock = clock
+        self.commands = collections.Counter()
+        self.motor_log = []
+        self._records = {}
+        sources = dict(sources) if sources else {}
+        for method in REPLAY_METHODS:
+            name = sources.get(method)
+            if name is None:
+                names = [n for n in log.channels
+                         if n.endswith("." + method)]
+                name = names[0] if names else None
+            if name is not None:
+                records = log.read(name)
+                if len(records):
+                    self._records[method] = records
+        if not self._records:
+            raise ValueError("the log has no sensor data to replay.")
+        self.start = min(r["timestamp"][0] for r in self._records.values())
+        self.end = max(r["timestamp"][-1] for r in self._records.values())
+        odometry = self._records.get("read_odometry_delta")
+        if odometry is not None:
+            self._ticks = np.cumsum(odometry["ticks"], axis=0)
+        self._cursors = collections.defaultdict(int)
+        self._offsets = [0, 0]
+        self._time = self.start
+        self._read_at = None
+        self._read = set()
+        self._started = None
+        self._previous_backend = None
+
+    def open(self, mb_info, program):
+        """Load a program on a replayed Microblaze.
+
+        This is the backend to pass to `set_backend`.
+
+        Parameters
+        ----------
+        mb_info : dict
+            Ignored; kept for the signature of `Arduino`.
+        program : str
+            The Microblaze program to emulate.
+
+        Returns
+        -------
+        ReplayArduino
+            The replayed Microblaze.
+
+        """
+        return ReplayArduino(self, program)
+
+    def __enter__(self):
+        self._previous_backend = set_backend(self.open)
+        return self
+
+    def __exit__(self, *args):
+        set_backend(self._previous_backend)
+
+    def now(self):
+        """Get the replay time, on the clock of the log.
+
+        Returns
+        -------
+        float
+            The timestamp of the log being replayed.
+
+        """
+        if self.speed is None:
+            return self._time
+        if self._started is None:
+            self._started = self.clock()
+        return self.start + (self.clock() - self._started) * self.speed
+
+    def command_latency(self, name):
+        """Commands take no time in a replay."""
+        return 0.0
+
+    def update(self):
+        pass
+
+    def set_wheels(self, left, right):
+        """Log the wheel power set by STOP or PWM_CONTROL."""
+        self.motor_log.append((self.now(), "WHEELS", (left, right)))
+        if self._read_at == self._time and self._read:
+            self._step()
+
+    def move(self, direction, speed):
+        """Log a MOVE command."""
+        self.motor_log.append((self.now(), "MOVE", (direction, speed)))
+        if self._read_at == self._time and self._read:
+            self._step()
+
+    def record(self, method):
+        """Get the record a sensor read is answered with.
+
+        Parameters
+        ----------
+        method : str
+            The driver method recorded, e.g. "get_qua".
+
+        Returns
+        -------
+        numpy.void
+            The record.
+
+        """
+        records = self._records.get(method)
+        if records is None:
+            raise ValueError("the log has no {} records.".format(method))
+        if self.speed is None:
+            index = self._cursors[method]
+            if index >= len(records):
+                raise EOFError("the log has no more {} records."
+                               .format(method))
+            self._cursors[method] = index + 1
+            self._time = max(self._time, records["timestamp"][index])
+            return records[index]
+        now = self.now()
+        if now > self.end:
+            raise EOFError("the end of the log was reached.")
+        index = np.searchsorted(records["timestamp"], now, "right") - 1
+        return records[max(index, 0)]
+
+    def ticks(self, which):
+        """Get the left (1) or right (2) tick counter at the replay time."""
+        if "read_odometry_delta" not in self._records:
+            raise ValueError("the log has no odometry records.")
+        if self.speed is None:
+            if self._read_at != self._time:
+                self._read_at, self._read = self._time, set()
+            if which in self._read:
+                if not self._step():
+                    raise EOFError("the log has no more odometry records.")
+                self._read_at, self._read = self._time, set()
+            self._read.add(which)
+        return self._total(which)
+
+    def clear_ticks(self, which):
+        """Clear the left (1) or right (2) tick counter."""
+        self._offsets[which - 1] += self._total(which)
+
+    def _total(self, which):
+        stamps = self._records["read_odometry_delta"]["timestamp"]
+        index = np.searchsorted(stamps, self.now(), "right") - 1
+        total = int(self._ticks[index, which - 1]) if index >= 0 else 0
+        return total - self._offsets[which - 1]
+
+    def _step(self):
+        odometry = self._records.get("read_odometry_delta")
+        if self.speed is not None or odometry is None:
+            return False
+        stamps = odometry["timestamp"]
+        index = np.searchsorted(stamps, self._time, "right")
+        if index >= len(stamps):
+            return False
+        self._time = float(stamps[index])
+        return True
+
+    def axis(self):
+        return self.record("get_axis")["axis"].tolist()
+
+    def eul(self):
+        return self.record("get_eul")["eul"].tolist()
+
+    def qua(self):
+        return self.record("get_qua")["qua"].tolist()
+
+    def line_tracker(self):
+        record = self.record("read_lt_data")
+        return record["digital"].tolist() + record["analog"].tolist()
+
+    def range(self):
+        return int(self.record("get_distance")["distance"])
+
+    def gesture(self):
+        return GESTURE_CODES.get(str(self.record("read_gesture")["gesture"]))
+
+
+class ReplayArduino(SimulatedArduino):
+    """This class answers the mailbox commands from a replayed log.
+
+    It has the command tables of `SimulatedArduino`; the data comes from
+    a `ReplayBackend` instead of the car physics.
+
+    """
+    def _distance(self):
+        opt, which = self._mailbox[0], self._mailbox[1]
+        sides = [which] if which in (1, 2) else [1, 2]
+        values = [self.simulator.ticks(side) for side in sides]
+        if opt == 1:
+            for side in sides:
+                self.simulator.clear_ticks(side)
+        self._result([int2reg(sum(values) // len(values))])
@@ -28,10 +28,19 @@
 #   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-import math
-from . import Arduino
 from . import MOTOR_DIRECTION
 from . import MOTOR_PINS
+from .arduino_codec import reg2float
+from .arduino_codec import reg2int
+from .arduino_mailbox import open_mailbox
+from .arduino_motor import MotorMixin
+from .arduino_calibration import MagnetometerCalibration
+from .arduino_calibration import collect_compass
+from .arduino_10DOF_IMU import _heading
+from .arduino_10DOF_IMU import _tilt_heading
+from .arduino_10DOF_IMU import _atm
+from .arduino_10DOF_IMU import _altitude
+from .arduino_10DOF_IMU import _read_snapshot
 
 
 __author__ = "Junhong Lin"
@@ -40,6 +49,8 @@ __copyright__ = "Copyright 2019, Xilinx"
 
 ARDUINO_RUN_IMU_PROGRAM = "arduino_run_IMU.bin"
 PAGE = 0xF
+IMU_PAGE = 0
+AUTOMOTO_PAGE = 1
 
 CONFIG_IOP_SWITCH = 0x1
 GET_AXIS_DATA = 0x3
@@ -52,61 +63,39 @@ STOP = 0x3
 MOVE = 0x5
 DISTANCE = 0x7
 
-def _reg2float(reg):
-    """Converts 32-bit register value to floats in Python.
-
-    Parameters
-    ----------
-    reg: int
-        A 32-bit register value read from the mailbox.
-
-    Returns
-    -------
-    float
-        A float number translated from the register value.
-
-    """
-    if reg == 0:
-        return 0.0
-    sign = (reg & 0x80000000) >> 31 & 0x01
-    exp = ((reg & 0x7f800000) >> 23) - 127
-    if exp == 0:
-        man = (reg & 0x007fffff) / pow(2, 23)
-    else:
-        man = 1 + (reg & 0x007fffff) / pow(2, 23)
-    result = pow(2, exp) * man * ((sign * -2) + 1)
-    return float("{0:.2f}".format(result))
-
-
-def _reg2int(reg):
-    """Converts 32-bit register value to signed integer in Python.
-
-    Parameters
-    ----------
-    reg: int
-        A 32-bit register value read from the mailbox.
-
-    Returns
-    -------
-    int
-        A signed integer translated from the register value.
-
-    """
-    result = -(reg >> 31 & 0x1) * (1 << 31)
-    for i in range(31):
-        result += (reg >> i & 0x1) * (1 << i)
-    return result
-
-
-class RUN_IMU(object):
+'''
+The IMU and the automoto share one Microblaze; PAGE selects which of the
+two devices the following commands are sent to. The page that each public
+method talks to is listed below so that requests can be grouped by page.
+'''
+METHOD_PAGES = {"get_axis": IMU_PAGE, "get_eul": IMU_PAGE,
+                "get_qua": IMU_PAGE, "get_heading": IMU_PAGE,
+                "get_tilt_heading": IMU_PAGE, "get_temperature": IMU_PAGE,
+                "get_pressure": IMU_PAGE, "get_atm": IMU_PAGE,
+                "get_altitude": IMU_PAGE, "snapshot": IMU_PAGE,
+                "stop": AUTOMOTO_PAGE,
+                "move": AUTOMOTO_PAGE, "distance": AUTOMOTO_PAGE,
+                "read_odometry_delta": AUTOMOTO_PAGE}
+
+
+class RUN_IMU(MotorMixin):
     """This class controls the 10DOF IIC IMU. 
     
     Attributes
     ----------
     microblaze : Arduino
         Microblaze processor instance used by this module.
+    mailbox : Mailbox
+        Serialized access to the mailbox of the Microblaze.
+    ndigits : int
+        Number of decimals the readings are rounded to; set it to `None`
+        to get the full single precision from the sensor.
+    mag_calibration : MagnetometerCalibration
+        The correction of the compass applied by the headings, or None.
         
     """
+    motor_page = AUTOMOTO_PAGE
+
     def __init__(self, mb_info, channel, pin = MOTOR_PINS):
         """Return a new instance of an 10DOF IMU object. 
         
@@ -118,12 +107,13 @@ class RUN_IMU(object):
 
         """
 
-        self.microblaze = Arduino(mb_info, ARDUINO_RUN_IMU_PROGRAM)
-        self.microblaze.write_mailbox(0, 0)
-        self.microblaze.write_blocking_command(PAGE) #Choose IMU device
-        self.microblaze.write_mailbox(0, channel)
-        self.microblaze.write_blocking_command(CONFIG_IOP_SWITCH)
-        data = self.microblaze.read_mailbox(0, 3)
+        self.ndigits = 2
+        self.mag_calibration = None
+        self.mailbox = open_mailbox(mb_info, ARDUINO_RUN_IMU_PROGRAM, PAGE,
+                                    name=type(self).__name__)
+        self.microblaze = self.mailbox.microblaze
+        data = self.mailbox.configure(CONFIG_IOP_SWITCH, channel, 3,
+                                      page=IMU_PAGE, valid=all)
         
         if not data[0]:
             raise ValueError("I2C Multiplexer failed.")
@@ -140,10 +130,74 @@ class RUN_IMU(object):
         
         if int(max(pin)) > 19 or int(min(pin)) < 0:
             raise ValueError("the value of pin should not be bigger than 19 or smaller than 0")
-        self.microblaze.write_mailbox(0, 1)
-        self.microblaze.write_blocking_command(PAGE) #Choose automoto device
-        self.microblaze.write_mailbox(0, pin)
-        self.microblaze.write_blocking_command(CONFIG_IOP_SWITCH)
+        self.mailbox.configure(CONFIG_IOP_SWITCH, pin, page=AUTOMOTO_PAGE)
+
+    @property
+    def page(self):
+        """The page currently selected on the Microblaze."""
+        return self.mailbox.page
+
+    def select_page(self, page):
+        """Select the device the following commands are sent to.
+
+        The PAGE command is only issued when the requested page differs
+        from the one currently selected on the Microblaze.
+
+        Parameters
+        ----------
+        page : int
+            IMU_PAGE (0) for the IMU, AUTOMOTO_PAGE (1) for the motors.
+
+        Returns
+        -------
+        None
+
+        """
+        self.mailbox.select_page(page)
+
+    def batch(self, requests):
+        """Run several IMU reads and motor commands with few page switches.
+
+        The requests run in the order submitted, in one transaction, so
+        that consecutive requests to the same device share one page
+        selection. They are not reordered: a read after a motor command
+        sees its effect. Put the requests to one device next to each
+        other to save page switches.
+
+        Parameters
+        ----------
+        requests : list
+            A list of tuples; each holds a method name followed by its
+            arguments, e.g. `[("get_qua",), ("distance", 0, 1)]`.
+
+        Returns
+        -------
+        list
+            The return values of the requests, in the order submitted.
+
+        """
+        for request in requests:
+            if request[0] not in METHOD_PAGES:
+                raise ValueError("{} cannot be batched.".format(request[0]))
+        with self.mailbox.transaction():
+            return [getattr(self, request[0])(*request[1:])
+                    for request in requests]
+
+    def snapshot(self):
+        """Read every sensor on the IMU in one go.
+
+        All the sensor words are read back-to-back and decoded as one
+        block; the heading, tilt heading, atm and altitude of the returned
+        sample are derived from it without any further mailbox access.
+
+        Returns
+        -------
+        IMUSample
+            The axis, euler, quaternion, temperature and pressure data.
+
+        """
+        return _read_snapshot(self.mailbox, self.ndigits, IMU_PAGE,
+                              self.mag_calibration)
         
     def get_axis(self):
         """Get the data from the accelerometer, gyroscope and magnetometer.
@@ -156,12 +210,8 @@ class RUN_IMU(object):
             A list of the compass data along X-axis, Y-axis, and Z-axis.
         
         """
-        self.microblaze.write_mailbox(0, 0)
-        self.microblaze.write_blocking_command(PAGE) #Choose IMU device
-        self.microblaze.write_blocking_command(GET_AXIS_DATA)
-        data = self.microblaze.read_mailbox(0, 9)
-        [ax, ay, az, gx, gy, gz, mx, my, mz] = [_reg2float(i) for i in data]
-        return [ax, ay, az, gx, gy, gz, mx, my, mz]
+        data = self.mailbox.transact(GET_AXIS_DATA, num_words=9, page=IMU_PAGE)
+        return reg2float(data, self.ndigits)
         """return [float("{0:.2f}".format(ax / 16384)),
                 float("{0:.2f}".format(ay / 16384)),
                 float("{0:.2f}".format(az / 16384))]
@@ -176,12 +226,8 @@ class RUN_IMU(object):
             A list of the euler angle data.
         
         """
-        self.microblaze.write_mailbox(0, 0)
-        self.microblaze.write_blocking_command(PAGE) #Choose IMU device
-        self.microblaze.write_blocking_command(GET_EUL_DATA)
-        data = self.microblaze.read_mailbox(0, 3)
-        [head, roll, pitch] = [_reg2float(i) for i in data]
-        return [head, roll, pitch]
+        data = self.mailbox.transact(GET_EUL_DATA, num_words=3, page=IMU_PAGE)
+        return reg2float(data, self.ndigits)
         """return [float("{0:.2f}".format(gx * 250 / 32768)),
                 float("{0:.2f}".format(gy * 250 / 32768)),
                 float("{0:.2f}".format(gz * 250 / 32768))]
@@ -196,17 +242,42 @@ class RUN_IMU(object):
             A list of the quaternion data.
         
         """
-        self.microblaze.write_mailbox(0, 0)
-        self.microblaze.write_blocking_command(PAGE) #Choose IMU device
-        self.microblaze.write_blocking_command(GET_QUA_DATA)
-        data = self.microblaze.read_mailbox(0, 4)
-        [w, x, y, z] = [_reg2float(i) for i in data]
-        return [w, x, y, z]
+        data = self.mailbox.transact(GET_QUA_DATA, num_words=4, page=IMU_PAGE)
+        return reg2float(data, self.ndigits)
         """return [float("{0:.2f}".format(mx * 1200 / 4096)),
                 float("{0:.2f}".format(my * 1200 / 4096)),
                 float("{0:.2f}".format(mz * 1200 / 4096))]
         """
 
+    def calibrate_magnetometer(self, duration=20.0, rate=50, speed=40,
+                               planar=True):
+        """Calibrate the compass with a rotation sweep.
+
+        The car spins in place during the sweep, so that by default only
+        the horizontal plane is fitted.
+
+        Parameters
+        ----------
+        duration : float
+            Time of the sweep in seconds.
+        rate : float
+            Sampling rate in Hz.
+        speed : int
+            The speed of the spin.
+        planar : bool
+            Whether to only fit the X and Y axes.
+
+        Returns
+        -------
+        MagnetometerCalibration
+            The fitted calibration, now used by the headings; it can be
+            saved and restored with `load`.
+
+        """
+        samples = collect_compass(self, duration, rate, self, speed)
+        self.mag_calibration = MagnetometerCalibration.fit(samples, planar)
+        return self.mag_calibration
+
     def get_heading(self):
         """Get the value of the heading.
         
@@ -216,11 +287,7 @@ class RUN_IMU(object):
             The angle deviated from the X-axis, toward the positive Y-axis.
         
         """
-        [_, _, _, _, _, _, mx, my, _] = self.get_axis()
-        heading = 180 * math.atan2(my, mx) / math.pi
-        if heading < 0:
-            heading += 360
-        return float("{0:.2f}".format(heading))
+        return _heading(self.get_axis(), self.mag_calibration)
 
     def get_tilt_heading(self):
         """Get the value of the tilt heading.
@@ -231,23 +298,7 @@ class RUN_IMU(object):
             The tilt heading value.
         
         """
-        [ax, ay, _, _, _, _, mx, my, mz] = self.get_axis()
-
-        try:
-            pitch = math.asin(-ax)
-            roll = math.asin(ay / math.cos(pitch))
-        except ZeroDivisionError:
-            raise RuntimeError("Value out of range or device not connected.")
-
-        xh = mx * math.cos(pitch) + mz * math.sin(pitch)
-        yh = mx * math.sin(roll) * math.sin(pitch) + \
-            my * math.cos(roll) - mz * math.sin(roll) * math.cos(pitch)
-        _ = -mx * math.cos(roll) * math.sin(pitch) + \
-            my * math.sin(roll) + mz * math.cos(roll) * math.cos(pitch)
-        tilt_heading = 180 * math.atan2(yh, xh) / math.pi
-        if yh < 0:
-            tilt_heading += 360
-        return float("{0:.2f}".format(tilt_heading))
+        return _tilt_heading(self.get_axis(), self.mag_calibration)
         
     def get_temperature(self):
         """Get the current temperature in degree C.
@@ -258,11 +309,8 @@ class RUN_IMU(object):
             The temperature value.
         
         """
-        self.microblaze.write_mailbox(0, 0)
-        self.microblaze.write_blocking_command(PAGE) #Choose IMU device
-        self.microblaze.write_blocking_command(GET_TEMPERATURE)
-        value = self.microblaze.read_mailbox(0)
-        return _reg2float(value)
+        value = self.mailbox.transact(GET_TEMPERATURE, num_words=1, page=IMU_PAGE)
+        return reg2float(value, self.ndigits)
         
     def get_pressure(self):
         """Get the current pressure in Pa.
@@ -273,11 +321,8 @@ class RUN_IMU(object):
             The pressure value.
         
         """
-        self.microblaze.write_mailbox(0, 0)
-        self.microblaze.write_blocking_command(PAGE) #Choose IMU device
-        self.microblaze.write_blocking_command(GET_PRESSURE)
-        value = self.microblaze.read_mailbox(0)
-        return _reg2int(value)
+        value = self.mailbox.transact(GET_PRESSURE, num_words=1, page=IMU_PAGE)
+        return reg2int(value)
         
     def get_atm(self):
         """Get the current pressure in relative atmosphere.
@@ -288,7 +333,7 @@ class RUN_IMU(object):
             The related atmosphere.
         
         """
-        return float("{0:.2f}".format(self.get_pressure() / 101325))
+        return _atm(self.get_pressure())
         
     def get_altitude(self):
         """Get the current altitude.
@@ -299,12 +344,7 @@ class RUN_IMU(object):
             The altitude value.
         
         """
-        pressure = self.get_pressure()
-        a = pressure / 101325
-        b = 1 / 5.255
-        c = 1 - pow(a, b)
-        altitude = 44300 * c
-        return float("{0:.2f}".format(altitude))
+        return _altitude(self.get_pressure())
 
     def stop(self):
         """stop the car
@@ -314,9 +354,7 @@ class RUN_IMU(object):
         None
 
         """
-        self.microblaze.write_mailbox(0, 1)
-        self.microblaze.write_blocking_command(PAGE) #Choose automoto device
-        self.microblaze.write_blocking_command(STOP)
+        self._stop_motors(STOP, page=AUTOMOTO_PAGE)
 
     def move(self, instruction, speed = 50):
         """control the car to move
@@ -330,8 +368,6 @@ class RUN_IMU(object):
         None
 
         """
-        self.microblaze.write_mailbox(0, 1)
-        self.microblaze.write_blocking_command(PAGE) #Choose automoto device
         data_in = []
         if instruction not in MOTOR_DIRECTION.keys():
             raise ValueError("please input valid direction!")
@@ -339,8 +375,7 @@ class RUN_IMU(object):
             raise ValueError("velocity should be in the range from 0 to 100")
         data_in.append(MOTOR_DIRECTION[instruction])
         data_in.append(speed)
-        self.microblaze.write_mailbox(0, data_in)
-        self.microblaze.write_blocking_command(MOVE)
+        self._motor_command(MOVE, data_in, page=AUTOMOTO_PAGE)
 
     def distance(self, opt = 0, which = 1):
         """
@@ -354,10 +389,5 @@ class RUN_IMU(object):
         -------
         distance of the whole car
         """
-        self.microblaze.write_mailbox(0, 1)
-        self.microblaze.write_blocking_command(PAGE) #Choose automoto device
-        self.microblaze.write_mailbox(0, [opt, which])
-        self.microblaze.write_blocking_command(DISTANCE)
-        value = _reg2int(self.microblaze.read_mailbox(0))
-        return value * (0.08*3.14159/2.0/1920.0)
+        return self._read_ticks(opt, which) * self.calibration.factor(which)
         
\ No newline at end of file
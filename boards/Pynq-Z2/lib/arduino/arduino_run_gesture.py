@@ -28,10 +28,12 @@
 #   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-from . import Arduino
 from . import MOTOR_DIRECTION
 from . import TIMER
 from . import MOTOR_PINS
+from .arduino_mailbox import open_mailbox
+from .arduino_motor import MotorMixin
+from .arduino_gesture_events import GestureEvents
 from . import GESTURE_DICT
 
 __author__ = "zou cong"
@@ -60,52 +62,8 @@ PINS[4:8] is to set the pin to control the direction of motor
 
 PINS[8:12] is to set the pins to record the velocity
 '''
-def _reg2float(reg):
-    """Converts 32-bit register value to floats in Python.
 
-    Parameters
-    ----------
-    reg: int
-        A 32-bit register value read from the mailbox.
-
-    Returns
-    -------
-    float
-        A float number translated from the register value.
-
-    """
-    if reg == 0:
-        return 0.0
-    sign = (reg & 0x80000000) >> 31 & 0x01
-    exp = ((reg & 0x7f800000) >> 23) - 127
-    if exp == 0:
-        man = (reg & 0x007fffff) / pow(2, 23)
-    else:
-        man = 1 + (reg & 0x007fffff) / pow(2, 23)
-    result = pow(2, exp) * man * ((sign * -2) + 1)
-    return float("{0:.2f}".format(result))
-
-
-def _reg2int(reg):
-    """Converts 32-bit register value to signed integer in Python.
-
-    Parameters
-    ----------
-    reg: int
-        A 32-bit register value read from the mailbox.
-
-    Returns
-    -------
-    int
-        A signed integer translated from the register value.
-
-    """
-    result = -(reg >> 31 & 0x1) * (1 << 31)
-    for i in range(31):
-        result += (reg >> i & 0x1) * (1 << i)
-    return result
-
-class Run_gesture(object):
+class Run_gesture(MotorMixin):
     """This class controls the Automoto. 
     
     Each automoto has five io control the power and direction of motor
@@ -115,6 +73,8 @@ class Run_gesture(object):
     ----------
     microblaze : Arduino
         Microblaze processor instance used by this module.
+    mailbox : Mailbox
+        Serialized access to the mailbox of the Microblaze.
         
     """
     def __init__(self, mb_info, channel, pin = MOTOR_PINS):
@@ -135,12 +95,11 @@ class Run_gesture(object):
         if int(max(pin)) > 21 or int(min(pin)) < 0:
             raise ValueError("the value of pin should not be bigger than 21 or smaller than 0")
 
-        self.microblaze = Arduino(mb_info, ARDUINO_RUN_GESTURE_PROGRAM)
-        self.microblaze.write_mailbox(0, pin)
-        self.microblaze.write_mailbox(48, channel)
-        self.microblaze.write_blocking_command(CONFIG_IOP_SWITCH)
-        
-        data = self.microblaze.read_mailbox(0, 2)
+        self.mailbox = open_mailbox(mb_info, ARDUINO_RUN_GESTURE_PROGRAM,
+                                    name=type(self).__name__)
+        self.microblaze = self.mailbox.microblaze
+        data = self.mailbox.configure(CONFIG_IOP_SWITCH, pin, 2,
+                                      registers={48: channel}, valid=all)
         
         if not data[0]:
             raise ValueError("chip initialization failed.")
@@ -157,7 +116,7 @@ class Run_gesture(object):
         None
 
         """
-        self.microblaze.write_blocking_command(STOP)
+        self._stop_motors(STOP)
 
     def move(self, instruction, speed = 50):
         """control the car to move
@@ -178,8 +137,7 @@ class Run_gesture(object):
             raise ValueError("velocity should be in the range from 0 to 100")
         data_in.append(MOTOR_DIRECTION[instruction])
         data_in.append(speed)
-        self.microblaze.write_mailbox(0, data_in)
-        self.microblaze.write_blocking_command(MOVE)
+        self._motor_command(MOVE, data_in)
 
     def distance(self, opt = 0, which = 1):
         """
@@ -193,10 +151,7 @@ class Run_gesture(object):
         -------
         distance of the whole car
         """
-        self.microblaze.write_mailbox(0, [opt, which])
-        self.microblaze.write_blocking_command(DISTANCE)
-        value = _reg2int(self.microblaze.read_mailbox(0))
-        return value * (0.08*3.14159/2.0/1920.0)
+        return self._read_ticks(opt, which) * self.calibration.factor(which)
 
 
     def read_gesture(self):
@@ -208,9 +163,27 @@ class Run_gesture(object):
             A list of the data read from gesture sensor.
         
         """
-        self.microblaze.write_blocking_command(READ_GESTURE)
-        data = self.microblaze.read_mailbox(0, 2)
+        data = self.mailbox.transact(READ_GESTURE, num_words=2)
         if data[0]:
             if data[1] in GESTURE_DICT.keys():
                 return GESTURE_DICT[data[1]]
 
+    def gesture_events(self, rate=20, debounce=0.3):
+        """Get the gestures as events instead of polling them.
+
+        Parameters
+        ----------
+        rate : float
+            Polling rate of the sensor in Hz.
+        debounce : float
+            Time in seconds during which a repeated gesture is dropped.
+
+        Returns
+        -------
+        GestureEvents
+            The event source, to be started with `start()` or a `with`
+            block.
+
+        """
+        return GestureEvents(self, rate, debounce)
+
@@ -27,11 +27,14 @@
 #   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
 #   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from . import Arduino
 from . import LT_PINS
 from . import MOTOR_DIRECTION
 from . import TIMER
 from . import MOTOR_PINS
+from .arduino_codec import reg2float
+from .arduino_codec import reg2int
+from .arduino_mailbox import open_mailbox
+from .arduino_motor import MotorMixin
 
 __author__ = "zou cong"
 __copyright__ = "Copyright 2019, Xilinx"
@@ -54,52 +57,7 @@ LT_PINS = {"CHANNEL_A0":0,"CHANNEL_A1":1,"CHANNEL_A2":2,
 
 '''
 
-def reg2float(reg):
-    """Converts 32-bit register value to floats in Python.
-
-    Parameters
-    ----------
-    reg: int
-        A 32-bit register value read from the mailbox.
-
-    Returns
-    -------
-    float
-        A float number translated from the register value.
-
-    """
-    if reg == 0:
-        return 0.0
-    sign = (reg & 0x80000000) >> 31 & 0x01
-    exp = ((reg & 0x7f800000) >> 23) - 127
-    if exp == 0:
-        man = (reg & 0x007fffff) / pow(2, 23)
-    else:
-        man = 1 + (reg & 0x007fffff) / pow(2, 23)
-    result = pow(2, exp) * man * ((sign * -2) + 1)
-    return float("{0:.2f}".format(result))
-
-
-def reg2int(reg):
-    """Converts 32-bit register value to signed integer in Python.
-
-    Parameters
-    ----------
-    reg: int
-        A 32-bit register value read from the mailbox.
-
-    Returns
-    -------
-    int
-        A signed integer translated from the register value.
-
-    """
-    result = -(reg >> 31 & 0x1) * (1 << 31)
-    for i in range(31):
-        result += (reg >> i & 0x1) * (1 << i)
-    return result
-
-class Run_LT(object):
+class Run_LT(MotorMixin):
     """This class controls the linetracker sensor. 
     Hardware version: v2.2.
     
@@ -107,6 +65,11 @@ class Run_LT(object):
     ----------
     microblaze : Arduino
         Microblaze processor instance used by this module.
+    mailbox : Mailbox
+        Serialized access to the mailbox of the Microblaze.
+    ndigits : int
+        Number of decimals the analog readings are rounded to; set it to
+        `None` to get the full single precision from the sensor.
         
     """
     def __init__(self, mb_info, left_pin = "CHANNEL_A3", right_pin = "CHANNEL_A4", pin = MOTOR_PINS):
@@ -133,14 +96,16 @@ class Run_LT(object):
             raise ValueError("the value of pin should not be bigger than 21 or smaller than 0")
 
 
-        data_in = pin
+        data_in = list(pin)
         data_in.append(LT_PINS[left_pin])
         data_in.append(LT_PINS[right_pin])
         print(data_in)
 
-        self.microblaze = Arduino(mb_info,ARDUINO_RUN_LINERTRACKER_PROGRAM)
-        self.microblaze.write_mailbox(0, data_in)
-        self.microblaze.write_blocking_command(CONFIG_IOP_SWITCH)
+        self.ndigits = 2
+        self.mailbox = open_mailbox(mb_info, ARDUINO_RUN_LINERTRACKER_PROGRAM,
+                                    name=type(self).__name__)
+        self.microblaze = self.mailbox.microblaze
+        self.mailbox.configure(CONFIG_IOP_SWITCH, data_in)
 
     def stop(self):
         """stop the car
@@ -150,7 +115,7 @@ class Run_LT(object):
         None
 
         """
-        self.microblaze.write_blocking_command(STOP)
+        self._stop_motors(STOP)
 
     def move(self, instruction, speed = 50):
         """control the car to move
@@ -171,8 +136,7 @@ class Run_LT(object):
             raise ValueError("velocity should be in the range from 0 to 100")
         data_in.append(MOTOR_DIRECTION[instruction])
         data_in.append(speed)
-        self.microblaze.write_mailbox(0, data_in)
-        self.microblaze.write_blocking_command(MOVE)
+        self._motor_command(MOVE, data_in)
 
     def distance(self, opt = 0, which = 1):
         """
@@ -186,10 +150,7 @@ class Run_LT(object):
         -------
         distance of the whole car
         """
-        self.microblaze.write_mailbox(0, [opt, which])
-        self.microblaze.write_blocking_command(DISTANCE)
-        value = _reg2int(self.microblaze.read_mailbox(0))
-        return value * (0.08*3.14159/2.0/1920.0)
+        return self._read_ticks(opt, which) * self.calibration.factor(which)
         
     def read_lt_data(self):
         """Get the data from the accelerometer.
@@ -200,11 +161,8 @@ class Run_LT(object):
             A list of the data read from linetracker sensor.
         
         """
-        self.microblaze.write_blocking_command(READ_LT_DATA)
-        data = self.microblaze.read_mailbox(0, 4)
-        digital_left = reg2int(data[0])
-        digital_right = reg2int(data[1])
-        analog_left = reg2float(data[2])
-        analog_right = reg2float(data[3])
+        data = self.mailbox.transact(READ_LT_DATA, num_words=4)
+        [digital_left, digital_right] = reg2int(data[:2])
+        [analog_left, analog_right] = reg2float(data[2:], self.ndigits)
         return [digital_left, digital_right, analog_left, analog_right]
         
@@ -28,10 +28,13 @@
 #   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-from . import Arduino
 from . import MOTOR_DIRECTION
 from . import TIMER
 from . import MOTOR_PINS
+from .arduino_mailbox import open_mailbox
+from .arduino_motor import MotorMixin
+from .arduino_range import RangeFilter
+from .arduino_range import RangeSampler
 
 
 __author__ = "zou cong"
@@ -62,7 +65,7 @@ PINS[4:8] is to set the pin to control the direction of motor
 PINS[8:12] is to set the pins to record the velocity
 '''
 
-class Run_usranger(object):
+class Run_usranger(MotorMixin):
     """This class controls the Automoto. 
     
     Each automoto has five io control the power and direction of motor
@@ -72,6 +75,12 @@ class Run_usranger(object):
     ----------
     microblaze : Arduino
         Microblaze processor instance used by this module.
+    mailbox : Mailbox
+        Serialized access to the mailbox of the Microblaze.
+    range_filter : RangeFilter
+        The filter of the ranger readings.
+    ranging : RangeSampler
+        The background sampling of the ranger, once started.
         
     """
     def __init__(self, mb_info, pin = MOTOR_PINS):
@@ -92,9 +101,12 @@ class Run_usranger(object):
         if int(max(pin)) > 21 or int(min(pin)) < 0:
             raise ValueError("the value of pin should not be bigger than 21 or smaller than 0")
 
-        self.microblaze = Arduino(mb_info, ARDUINO_RUN_USRANGER_PROGRAM)
-        self.microblaze.write_mailbox(0, pin)
-        self.microblaze.write_blocking_command(CONFIG_IOP_SWITCH)
+        self.mailbox = open_mailbox(mb_info, ARDUINO_RUN_USRANGER_PROGRAM,
+                                    name=type(self).__name__)
+        self.microblaze = self.mailbox.microblaze
+        self.mailbox.configure(CONFIG_IOP_SWITCH, pin)
+        self.range_filter = RangeFilter()
+        self.ranging = None
 
     def stop(self):
         """stop the car
@@ -104,7 +116,7 @@ class Run_usranger(object):
         None
 
         """
-        self.microblaze.write_blocking_command(STOP)
+        self._stop_motors(STOP)
 
     def move(self, instruction, speed = 50):
         """control the car to move
@@ -125,8 +137,7 @@ class Run_usranger(object):
             raise ValueError("velocity should be in the range from 0 to 100")
         data_in.append(MOTOR_DIRECTION[instruction])
         data_in.append(speed)
-        self.microblaze.write_mailbox(0, data_in)
-        self.microblaze.write_blocking_command(MOVE)
+        self._motor_command(MOVE, data_in)
 
     def distance(self, opt = 0, which = 1):
         """
@@ -140,10 +151,7 @@ class Run_usranger(object):
         -------
         distance of the whole car
         """
-        self.microblaze.write_mailbox(0, [opt, which])
-        self.microblaze.write_blocking_command(DISTANCE)
-        value = _reg2int(self.microblaze.read_mailbox(0))
-        return value * (0.08*3.14159/2.0/1920.0)
+        return self._read_ticks(opt, which) * self.calibration.factor(which)
 
     def get_distance(self):
         '''
@@ -157,6 +165,57 @@ class Run_usranger(object):
         -------
         None
         '''
-        self.microblaze.write_blocking_command(GET_DISTANCE)
-        distance = self.microblaze.read_mailbox(0)
+        distance = self.mailbox.transact(GET_DISTANCE, num_words=1)
         return distance
+
+    def start_ranging(self, rate=16):
+        """Sample and filter the ranger continuously in the background.
+
+        Parameters
+        ----------
+        rate : float
+            Sampling rate in Hz.
+
+        Returns
+        -------
+        RangeSampler
+            The sampler, which also keeps the latest readings.
+
+        """
+        if self.ranging is not None and self.ranging.running:
+            raise RuntimeError("Ranging is already running.")
+        self.range_filter.reset()
+        self.ranging = RangeSampler(self, rate, range_filter=self.range_filter)
+        self.ranging.start()
+        return self.ranging
+
+    def stop_ranging(self):
+        """Stop sampling the ranger in the background.
+
+        Returns
+        -------
+        None
+
+        """
+        if self.ranging is not None:
+            self.ranging.stop()
+
+    def nearest_obstacle(self):
+        """Get the filtered distance to the nearest obstacle.
+
+        When the ranger is sampled in the background, the distance is
+        returned from the filter without accessing the mailbox; otherwise
+        the ranger is read once and the reading filtered.
+
+        Returns
+        -------
+        float
+            The distance in cm, or None when the ranger gave no valid
+            reading recently, e.g. when it needs to be rebooted.
+
+        """
+        if self.ranging is not None and self.ranging.running:
+            return self.range_filter.distance
+        if self.ranging is not None and self.ranging.error is not None:
+            raise self.ranging.error
+        return self.range_filter.update(self.get_distance())
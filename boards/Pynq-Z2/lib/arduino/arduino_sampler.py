@@ -0,0 +1,360 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import threading
+import time
+import numpy as np
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+Number of values returned by each IMU getter that can be sampled.
+'''
+IMU_FIELDS = {"axis": 9, "eul": 3, "qua": 4}
+
+
+class RingBuffer(object):
+    """This class stores the latest records of a stream in a fixed array.
+
+    There must be a single writer. Readers never take a lock: the writer
+    fills a slot before publishing it by incrementing `count`, and readers
+    check after copying that none of the slots they copied has been
+    overwritten in the meantime, retrying if it has. One spare slot is
+    kept so that the slot being written is never one that can be read.
+
+    Attributes
+    ----------
+    size : int
+        Number of records the buffer holds.
+    dtype : numpy.dtype
+        The structured dtype of the records.
+
+    """
+    def __init__(self, dtype, size):
+        """Return a new instance of a ring buffer object.
+
+        Parameters
+        ----------
+        dtype : numpy.dtype
+            The structured dtype of the records.
+        size : int
+            Number of records the buffer holds.
+
+        """
+        if size < 1:
+            raise ValueError("size of the ring buffer should be at least 1.")
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self._buffer = np.zeros(size + 1, dtype=self.dtype)
+        self._count = 0
+
+    @property
+    def count(self):
+        """Number of records written since the buffer was created."""
+        return self._count
+
+    def append(self, record):
+        """Write a record into the buffer, replacing the oldest one.
+
+        Parameters
+        ----------
+        record : tuple
+            The values of the record, in the order of the dtype fields.
+
+        Returns
+        -------
+        None
+
+        """
+        self._buffer[self._count % len(self._buffer)] = record
+        self._count += 1
+
+    def latest(self):
+        """Get the most recent record.
+
+        Returns
+        -------
+        numpy.void
+            A copy of the latest record, or None when nothing was written.
+
+        """
+        window = self.window(1)
+        if len(window) == 0:
+            return None
+        return window[0]
+
+    def window(self, num=None, seconds=None, field="timestamp"):
+        """Get the most recent records in chronological order.
+
+        Parameters
+        ----------
+        num : int
+            Maximum number of records; all the buffered ones by default.
+        seconds : float
+            Only keep the records whose `field` is at most this far
+            behind the one of the latest record.
+        field : str
+            The timestamp field used by `seconds`.
+
+        Returns
+        -------
+        numpy.ndarray
+            A copy of the records.
+
+        """
+        if num is None:
+            num = self.size
+        while True:
+            end = self._count
+            start = end - min(num, end, self.size)
+            data = self._buffer[np.arange(start, end) % len(self._buffer)]
+            if self._count - start <= self.size:
+                break
+        if seconds is not None and len(data):
+            data = data[data[field] >= data[field][-1] - seconds]
+        return data
+
+
+class PeriodicWorker(object):
+    """This class runs a task periodically on a background thread.
+
+    The subclasses implement `_tick`, which does the work of one period.
+    The periods run on fixed deadlines, so the time spent in `_tick` does
+    not add up to the period; a deadline already passed is counted as an
+    overrun and the schedule restarts from the current time. `_tick`
+    returning False, or raising, ends the thread; the exception is kept
+    in `error` and the worker can be started again.
+
+    Attributes
+    ----------
+    period : float
+        Period in seconds; None when `_tick` waits on its own.
+    overruns : int
+        Number of periods missed because a tick took too long.
+    error : Exception
+        The exception that stopped the thread, if any.
+
+    """
+    def __init__(self, period):
+        """Return a new instance of a periodic worker object.
+
+        Parameters
+        ----------
+        period : float
+            Period in seconds; None when `_tick` waits on its own.
+
+        """
+        self.period = period
+        self.overruns = 0
+        self.error = None
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the thread.
+
+        Returns
+        -------
+        None
+
+        """
+        if self.running:
+            raise RuntimeError("{} is already running."
+                               .format(type(self).__name__))
+        self.error = None
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and wait for it to finish.
+
+        Returns
+        -------
+        None
+
+        """
+        self._running.clear()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+            if self._thread is thread:
+                self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def running(self):
+        """Whether the thread is running."""
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def _begin(self):
+        pass
+
+    def _tick(self):
+        raise NotImplementedError
+
+    def _end(self):
+        pass
+
+    def _loop(self):
+        self._begin()
+        deadline = time.monotonic()
+        try:
+            while self._running.is_set():
+                if self._tick() is False:
+                    break
+                if self.period is None:
+                    continue
+                deadline += self.period
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.overruns += 1
+                    deadline = time.monotonic()
+        finally:
+            self._running.clear()
+            self._end()
+
+    def _run(self):
+        try:
+            self._loop()
+        except Exception as e:
+            self.error = e
+        finally:
+            if self._thread is threading.current_thread():
+                self._thread = None
+
+
+class IMUSampler(PeriodicWorker):
+    """This class samples an IMU in the background at a fixed rate.
+
+    The readings are stored in a ring buffer of records holding a
+    `time.monotonic()` timestamp and the sampled fields, so that any number
+    of consumers can get the latest sample or a window of samples without
+    waiting for the mailbox.
+
+    Attributes
+    ----------
+    imu : TenDOF_IMU/RUN_IMU
+        The IMU driver being sampled.
+    period : float
+        Sampling period in seconds.
+    fields : list
+        The IMU getters sampled, among "axis", "eul" and "qua".
+    buffer : RingBuffer
+        The buffer the samples are written to.
+    overruns : int
+        Number of periods missed because sampling took too long.
+    error : Exception
+        The exception that stopped the sampling thread, if any.
+
+    """
+    def __init__(self, imu, rate=100, size=1024, fields=("axis", "qua")):
+        """Return a new instance of an IMU sampler object.
+
+        Parameters
+        ----------
+        imu : TenDOF_IMU/RUN_IMU
+            The IMU driver to sample.
+        rate : float
+            Sampling rate in Hz.
+        size : int
+            Number of samples kept in the ring buffer.
+        fields : list
+            The IMU getters to sample, among "axis", "eul" and "qua".
+
+        """
+        for field in fields:
+            if field not in IMU_FIELDS:
+                raise ValueError("{} cannot be sampled.".format(field))
+        if rate <= 0:
+            raise ValueError("sampling rate should be positive.")
+        PeriodicWorker.__init__(self, 1.0 / rate)
+        self.imu = imu
+        self.fields = list(fields)
+        dtype = [("timestamp", "f8")] + \
+            [(field, "f4", (IMU_FIELDS[field],)) for field in self.fields]
+        self.buffer = RingBuffer(dtype, size)
+        self._getters = [getattr(imu, "get_" + field) for field in self.fields]
+
+    def sample(self):
+        """Read the IMU once and append the sample to the buffer.
+
+        Returns
+        -------
+        None
+
+        """
+        values = [getter() for getter in self._getters]
+        self.buffer.append(tuple([time.monotonic()] + values))
+
+    def latest(self):
+        """Get the latest sample without accessing the mailbox.
+
+        Returns
+        -------
+        numpy.void
+            The latest record, or None when nothing was sampled yet.
+
+        """
+        return self.buffer.latest()
+
+    def window(self, num=None, seconds=None):
+        """Get the latest samples without accessing the mailbox.
+
+        Parameters
+        ----------
+        num : int
+            Maximum number of samples; all the buffered ones by default.
+        seconds : float
+            Only keep the samples taken at most this long before the
+            latest one.
+
+        Returns
+        -------
+        numpy.ndarray
+            The records in chronological order.
+
+        """
+        return self.buffer.window(num, seconds)
+
+    def _tick(self):
+        self.sample()
@@ -0,0 +1,311 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import math
+import threading
+import time
+from .arduino_sampler import PeriodicWorker
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+Default polling rates of the driver getters, in Hz. The ultrasonic ranger
+needs about 60 ms between two measurements; the temperature and the
+pressure change slowly.
+'''
+DEFAULT_RATES = {"read_lt_data": 200, "get_axis": 100, "get_eul": 100,
+                 "get_qua": 100, "snapshot": 50, "read_gesture": 20,
+                 "get_distance": 15, "read_odometry_delta": 50,
+                 "get_temperature": 1, "get_pressure": 1}
+
+
+class PollTask(object):
+    """This class holds a getter polled by a `PollScheduler`.
+
+    Attributes
+    ----------
+    name : str
+        The name the values are published under.
+    period : float
+        Polling period in seconds; the deadline of each poll is the next
+        release.
+    value : object
+        The latest value returned by the getter.
+    timestamp : float
+        When the latest value was read, in `time.monotonic()` seconds.
+    polls : int
+        Number of polls done.
+    misses : int
+        Number of polls completed after their deadline.
+    skipped : int
+        Number of releases dropped because the task was too late.
+    busy : float
+        Total time spent in the getter, in seconds.
+    worst : float
+        Longest time spent in the getter, in seconds.
+
+    """
+    def __init__(self, name, getter, period, args=(), callback=None):
+        self.name = name
+        self.getter = getter
+        self.period = period
+        self.args = tuple(args)
+        self.callback = callback
+        self.release = None
+        self.value = None
+        self.timestamp = None
+        self.polls = 0
+        self.misses = 0
+        self.skipped = 0
+        self.busy = 0.0
+        self.worst = 0.0
+
+    def stats(self):
+        """Get the statistics of the task.
+
+        Returns
+        -------
+        dict
+            The rate, number of polls, deadline misses, skipped releases,
+            mean and worst execution times in seconds, and utilization.
+
+        """
+        mean = self.busy / self.polls if self.polls else 0.0
+        return {"rate": 1.0 / self.period, "polls": self.polls,
+                "misses": self.misses, "skipped": self.skipped,
+                "mean": mean, "worst": self.worst,
+                "utilization": mean / self.period}
+
+
+class PollScheduler(PeriodicWorker):
+    """This class polls driver getters at their own rates on one thread.
+
+    The getters are scheduled rate-monotonically: whenever several of them
+    are due, the one with the shortest period is polled first. Polls are
+    not preempted, since the mailbox serves one command at a time, but a
+    faster getter released during a slow poll goes next. A poll completing
+    after its next release misses its deadline; releases that passed
+    entirely while a task was late are skipped rather than run in a burst.
+
+    The latest value of each getter is published and can be read at any
+    time with `latest` without accessing the mailbox. Motor commands keep
+    their priority on the mailbox over the polls.
+
+    Attributes
+    ----------
+    tasks : list
+        The PollTask objects, by increasing period.
+    error : Exception
+        The exception that stopped the scheduler thread, if any.
+
+    """
+    def __init__(self):
+        """Return a new instance of a poll scheduler object.
+
+        """
+        PeriodicWorker.__init__(self, None)
+        self.tasks = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def add(self, driver, method, rate=None, args=(), name=None,
+            callback=None):
+        """Poll a getter of a driver.
+
+        Parameters
+        ----------
+        driver : object
+            The driver, e.g. a Run_LT or a TenDOF_IMU instance.
+        method : str
+            The getter, e.g. "read_lt_data".
+        rate : float
+            Polling rate in Hz; DEFAULT_RATES by default.
+        args : tuple
+            The arguments of the getter.
+        name : str
+            The name the values are published under; the method name by
+            default.
+        callback : callable
+            Called on the scheduler thread with the name and the value
+            after each poll.
+
+        Returns
+        -------
+        PollTask
+            The task polling the getter.
+
+        """
+        if rate is None:
+            if method not in DEFAULT_RATES:
+                raise ValueError("no default rate for {}.".format(method))
+            rate = DEFAULT_RATES[method]
+        if rate <= 0:
+            raise ValueError("polling rate should be positive.")
+        name = method if name is None else name
+        task = PollTask(name, getattr(driver, method), 1.0 / rate, args,
+                        callback)
+        with self._lock:
+            if any(t.name == name for t in self.tasks):
+                raise ValueError("{} is already polled.".format(name))
+            if self.running:
+                task.release = time.monotonic()
+            self.tasks = sorted(self.tasks + [task],
+                                key=lambda t: t.period)
+        self._wake.set()
+        return task
+
+    def remove(self, name):
+        """Stop polling a getter.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._lock:
+            self.tasks = [t for t in self.tasks if t.name != name]
+
+    def task(self, name):
+        """Get the task publishing the values of a name."""
+        for task in self.tasks:
+            if task.name == name:
+                return task
+        raise KeyError(name)
+
+    def latest(self, name):
+        """Get the latest value of a getter without accessing the mailbox.
+
+        Parameters
+        ----------
+        name : str
+            The name the values are published under.
+
+        Returns
+        -------
+        object
+            The latest value, or None when it was not polled yet.
+
+        """
+        return self.task(name).value
+
+    def values(self):
+        """Get the latest value of every getter.
+
+        Returns
+        -------
+        dict
+            The latest values by name.
+
+        """
+        return {task.name: task.value for task in self.tasks}
+
+    def stats(self):
+        """Get the statistics of every getter.
+
+        The total utilization is the fraction of the time the mailbox is
+        busy polling; above 1 the getters cannot all meet their rates.
+
+        Returns
+        -------
+        dict
+            The statistics of each task by name, see `PollTask.stats`,
+            and the total "utilization".
+
+        """
+        result = {task.name: task.stats() for task in self.tasks}
+        result["utilization"] = sum(task["utilization"]
+                                    for task in result.values())
+        return result
+
+    def start(self):
+        """Start the scheduler thread.
+
+        Returns
+        -------
+        None
+
+        """
+        if self.running:
+            raise RuntimeError("PollScheduler is already running.")
+        now = time.monotonic()
+        for task in self.tasks:
+            task.release = now
+        PeriodicWorker.start(self)
+
+    def stop(self):
+        """Stop the scheduler thread and wait for it to finish.
+
+        Returns
+        -------
+        None
+
+        """
+        self._running.clear()
+        self._wake.set()
+        PeriodicWorker.stop(self)
+
+    def _next(self, now):
+        tasks = self.tasks
+        for task in tasks:
+            if task.release <= now:
+                return task, 0.0
+        if not tasks:
+            return None, None
+        return None, min(task.release for task in tasks) - now
+
+    def _tick(self):
+        now = time.monotonic()
+        task, delay = self._next(now)
+        if task is None:
+            self._wake.wait(delay)
+            self._wake.clear()
+            return
+        value = task.getter(*task.args)
+        finish = time.monotonic()
+        task.value = value
+        task.timestamp = finish
+        task.polls += 1
+        elapsed = finish - now
+        task.busy += elapsed
+        task.worst = max(task.worst, elapsed)
+        deadline = task.release + task.period
+        if finish > deadline:
+            task.misses += 1
+        task.release = deadline
+        if finish > deadline + task.period:
+            late = int(math.floor((finish - deadline) / task.period))
+            task.skipped += late
+            task.release += late * task.period
+        if task.callback is not None:
+            task.callback(task.name, value)
@@ -0,0 +1,394 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import collections
+import math
+import os
+import time
+import numpy as np
+from . import MAILBOX_SIZE
+from .arduino_calibration import WheelCalibration
+from .arduino_codec import float2reg
+from .arduino_codec import int2reg
+from .arduino_codec import reg2int
+from .arduino_mailbox import PAGE
+from .arduino_mailbox import PROGRAM_COMMANDS
+from .arduino_mailbox import set_backend
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+Left and right wheel power, as a fraction of the requested speed, for
+each MOTOR_DIRECTION code: forward, backward, steer left, steer right,
+rotate left and rotate right.
+'''
+MOTIONS = {0: (1.0, 1.0), 1: (-1.0, -1.0), 2: (0.5, 1.0), 3: (1.0, 0.5),
+           4: (-1.0, 1.0), 5: (1.0, -1.0)}
+
+
+class CarSimulator(object):
+    """This class simulates a PYNQ-Car and its sensors.
+
+    It stands in for the Microblaze, so that the drivers can run, and be
+    tested or benchmarked, without a board. Once installed with
+    `with CarSimulator() as sim:` (or `set_backend(sim.open)`), every driver
+    created loads its program on a `SimulatedArduino` sharing this car.
+
+    The car moves on a plane following the MOVE commands. The line to
+    track is `y = track(x)`, the ranger faces a wall at `x = wall`, and
+    gestures are played from a queue filled with `push_gesture`.
+
+    Attributes
+    ----------
+    x, y, yaw : float
+        The pose of the car in meters and radians.
+    ticks : list
+        The left and right encoder counters.
+    commands : Counter
+        Number of commands executed, by command name.
+
+    """
+    def __init__(self, latency=0.0, noise=0.0, seed=0, clock=time.monotonic,
+                 max_speed=0.5, wheels=None, track=None, wall=2.0,
+                 dropout=0.0):
+        """Return a new instance of a car simulator object.
+
+        Parameters
+        ----------
+        latency : float/dict
+            Time in seconds each command takes; a dictionary maps command
+            names (e.g. "GET_AXIS_DATA") to latencies, with an optional
+            "default" entry.
+        noise : float
+            Standard deviation of the noise added to the sensor readings.
+        seed : int
+            Seed of the noise generator.
+        clock : callable
+            The clock driving the physics, in seconds.
+        max_speed : float
+            Speed of a wheel at 100% power, in m/s.
+        wheels : WheelCalibration
+            The actual wheels and encoders of the simulated car.
+        track : callable
+            Returns the y coordinate of the line for a given x; the line
+            is y = 0 by default.
+        wall : float
+            The x coordinate of the wall in front of the ranger.
+        dropout : float
+            Probability of the ranger returning the 1000 sentinel.
+
+        """
+        if isinstance(latency, dict):
+            self.latency = dict(latency)
+        else:
+            self.latency = {"default": latency}
+        self.noise = noise
+        self.random = np.random.RandomState(seed)
+        self.clock = clock
+        self.max_speed = max_speed
+        self.wheels = wheels if wheels is not None else WheelCalibration()
+        self.track = track if track is not None else (lambda x: 0.0)
+        self.wall = wall
+        self.dropout = dropout
+        self.x = 0.0
+        self.y = 0.0
+        self.yaw = 0.0
+        self.ticks = [0.0, 0.0]
+        self.commands = collections.Counter()
+        self._speeds = (0.0, 0.0)
+        self._time = clock()
+        self._gestures = collections.deque()
+        self._previous_backend = None
+
+    def open(self, mb_info, program):
+        """Load a program on a simulated Microblaze of this car.
+
+        This is the backend to pass to `set_backend`.
+
+        Parameters
+        ----------
+        mb_info : dict
+            Ignored; kept for the signature of `Arduino`.
+        program : str
+            The Microblaze program to emulate.
+
+        Returns
+        -------
+        SimulatedArduino
+            The simulated Microblaze.
+
+        """
+        return SimulatedArduino(self, program)
+
+    def __enter__(self):
+        self._previous_backend = set_backend(self.open)
+        return self
+
+    def __exit__(self, *args):
+        set_backend(self._previous_backend)
+
+    def command_latency(self, name):
+        """Get the time in seconds a command takes."""
+        return self.latency.get(name, self.latency.get("default", 0.0))
+
+    def update(self):
+        """Move the car according to the time elapsed since the last call.
+
+        Returns
+        -------
+        None
+
+        """
+        now = self.clock()
+        dt = now - self._time
+        self._time = now
+        if dt <= 0:
+            return
+        left, right = self._speeds
+        v = (left + right) / 2
+        w = (right - left) / self.wheels.track_width
+        if abs(w) < 1e-9:
+            self.x += v * dt * math.cos(self.yaw)
+            self.y += v * dt * math.sin(self.yaw)
+        else:
+            yaw = self.yaw + w * dt
+            self.x += v / w * (math.sin(yaw) - math.sin(self.yaw))
+            self.y -= v / w * (math.cos(yaw) - math.cos(self.yaw))
+            self.yaw = yaw
+        self.ticks[0] += left * dt / self.wheels.left
+        self.ticks[1] += right * dt / self.wheels.right
+
+    def set_wheels(self, left, right):
+        """Set the left and right wheel power, from -100 to 100."""
+        self.update()
+        self._speeds = (left * self.max_speed / 100,
+                        right * self.max_speed / 100)
+
+    def move(self, direction, speed):
+        """Emulate the MOVE command."""
+        left, right = MOTIONS[direction]
+        self.set_wheels(left * speed, right * speed)
+
+    def push_gesture(self, code):
+        """Queue a gesture code, see GESTURE_DICT, for the gesture sensor."""
+        self._gestures.append(code)
+
+    def _noisy(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self.noise:
+            values = values + self.random.normal(0, self.noise, values.shape)
+        return values.tolist()
+
+    def axis(self):
+        """Accelerometer (g), gyroscope (deg/s) and compass (uT) data."""
+        self.update()
+        left, right = self._speeds
+        rate = math.degrees((right - left) / self.wheels.track_width)
+        return self._noisy([0.0, 0.0, 1.0, 0.0, 0.0, rate,
+                            40 * math.cos(self.yaw),
+                            -40 * math.sin(self.yaw), -30.0])
+
+    def eul(self):
+        """Heading, roll and pitch in degrees."""
+        self.update()
+        return self._noisy([-math.degrees(self.yaw) % 360, 0.0, 0.0])
+
+    def qua(self):
+        """Quaternion rotating the car frame into the world frame."""
+        self.update()
+        return [math.cos(self.yaw / 2), 0.0, 0.0, math.sin(self.yaw / 2)]
+
+    def line_tracker(self, offset=0.015, lookahead=0.1, width=0.015):
+        """Digital and analog readings of the left and right line trackers."""
+        self.update()
+        readings = []
+        for side in (1, -1):
+            px = self.x + lookahead * math.cos(self.yaw) - \
+                side * offset * math.sin(self.yaw)
+            py = self.y + lookahead * math.sin(self.yaw) + \
+                side * offset * math.cos(self.yaw)
+            lateral = py - self.track(px)
+            readings.append(0.1 + 0.8 * math.exp(-(lateral / width) ** 2))
+        analog = self._noisy(readings)
+        return [int(analog[0] > 0.5), int(analog[1] > 0.5)] + analog
+
+    def range(self):
+        """Distance to the wall in cm, or the 1000 sentinel."""
+        self.update()
+        if self.dropout and self.random.random_sample() < self.dropout:
+            return 1000
+        cos = math.cos(self.yaw)
+        if cos < 0.05:
+            return 400
+        distance = (self.wall - self.x) / cos * 100
+        return int(min(max(self._noisy([distance])[0], 2), 400))
+
+    def gesture(self):
+        """The next queued gesture code, or None."""
+        if self._gestures:
+            return self._gestures.popleft()
+        return None
+
+
+class SimulatedArduino(object):
+    """This class emulates a Microblaze running one of the car programs.
+
+    It has the mailbox interface of `Arduino`; commands are answered from
+    the `CarSimulator` it belongs to.
+
+    Attributes
+    ----------
+    simulator : CarSimulator
+        The simulated car.
+    mb_program : str
+        The name of the emulated program.
+    page : int
+        The page selected on paged programs.
+
+    """
+    def __init__(self, simulator, program):
+        """Return a new instance of a simulated Microblaze object.
+
+        Parameters
+        ----------
+        simulator : CarSimulator
+            The simulated car.
+        program : str
+            The Microblaze program to emulate.
+
+        """
+        name = os.path.basename(program)
+        if name not in PROGRAM_COMMANDS:
+            raise ValueError("{} cannot be simulated.".format(name))
+        self.simulator = simulator
+        self.mb_program = name
+        self.page = 0
+        self._pages = PROGRAM_COMMANDS[name]
+        self._mailbox = [0] * (MAILBOX_SIZE // 4)
+
+    def write_mailbox(self, data_offset, data):
+        """Write data into the mailbox; see `Arduino.write_mailbox`."""
+        if type(data) is int:
+            data = [data]
+        elif type(data) is not list:
+            raise ValueError('Type of write data has to be int or lists.')
+        for i, word in enumerate(data):
+            self._mailbox[data_offset // 4 + i] = word & 0xFFFFFFFF
+
+    def read_mailbox(self, data_offset, num_words=1):
+        """Read data from the mailbox; see `Arduino.read_mailbox`."""
+        start = data_offset // 4
+        if num_words == 1:
+            return self._mailbox[start]
+        return self._mailbox[start:start + num_words]
+
+    def write_blocking_command(self, command):
+        """Execute a command; see `Arduino.write_blocking_command`."""
+        if command == PAGE and len(self._pages) > 1:
+            name = "PAGE"
+        else:
+            name = self._pages[self.page].get(command)
+        if name is None:
+            raise ValueError("Command {} is not supported by {}."
+                             .format(command, self.mb_program))
+        self.simulator.commands[name] += 1
+        latency = self.simulator.command_latency(name)
+        if latency:
+            time.sleep(latency)
+        getattr(self, "_" + name.lower())()
+
+    def _result(self, words):
+        self._mailbox[:len(words)] = words
+
+    def _page(self):
+        if self._mailbox[0] not in self._pages:
+            raise ValueError("Page {} does not exist."
+                             .format(self._mailbox[0]))
+        self.page = self._mailbox[0]
+
+    def _config_iop_switch(self):
+        self._result([1, 1, 1])
+
+    def _reset(self):
+        pass
+
+    def _stop(self):
+        self.simulator.set_wheels(0, 0)
+
+    def _move(self):
+        self.simulator.move(self._mailbox[0], self._mailbox[1])
+
+    def _pwm_control(self):
+        a, b, c, d = reg2int(self._mailbox[:4])
+        self.simulator.set_wheels((c + d) / 2, (a + b) / 2)
+
+    def _distance(self):
+        opt, which = self._mailbox[0], self._mailbox[1]
+        sim = self.simulator
+        sim.update()
+        if which in (1, 2):
+            value = sim.ticks[which - 1]
+        else:
+            value = sum(sim.ticks) / 2
+        if opt == 1:
+            if which in (1, 2):
+                sim.ticks[which - 1] = 0.0
+            else:
+                sim.ticks = [0.0, 0.0]
+        self._result([int2reg(int(value))])
+
+    def _get_axis_data(self):
+        self._result(float2reg(self.simulator.axis()))
+
+    def _get_eul_data(self):
+        self._result(float2reg(self.simulator.eul()))
+
+    def _get_qua_data(self):
+        self._result(float2reg(self.simulator.qua()))
+
+    def _get_temperature(self):
+        self._result([float2reg(25.0)])
+
+    def _get_pressure(self):
+        self._result([int2reg(101325)])
+
+    def _read_lt_data(self):
+        data = self.simulator.line_tracker()
+        self._result(int2reg(data[:2]) + float2reg(data[2:]))
+
+    def _get_distance(self):
+        self._result([self.simulator.range()])
+
+    def _read_gesture(self):
+        code = self.simulator.gesture()
+        self._result([0, 0] if code is None else [1, code])
@@ -0,0 +1,471 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+import functools
+import json
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from .arduino_codec import reg2int
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+'''
+A telemetry log is an append-only sequence of chunks after an 8-byte
+magic. Each chunk starts with a 16-byte little-endian header: its kind,
+its channel, its number of records and the size of its payload.
+
+ * CHUNK_CHANNEL declares a channel; the payload is the JSON of its name
+   and of its NumPy record dtype.
+ * CHUNK_RECORDS holds fixed-width records of a channel, as laid out in
+   memory, so that they can be used straight from a memory map.
+ * CHUNK_ZLIB holds the same records compressed with zlib.
+
+A log cut short, e.g. by a crash, is read up to its last whole chunk,
+and cut back to it before being appended to. Chunks of records of an
+undeclared channel are skipped.
+'''
+MAGIC = b"PYNQTLM1"
+CHUNK_HEADER = struct.Struct("<HHIQ")
+CHUNK_CHANNEL = 0
+CHUNK_RECORDS = 1
+CHUNK_ZLIB = 2
+
+
+def _motor_record(command, data):
+    args = [0, 0, 0, 0]
+    if data is not None:
+        words = reg2int(list(data))
+        args[:len(words)] = words
+    return command, args
+
+
+'''
+The driver methods recorded by `TelemetryRecorder.attach`, with the
+fields of their records and the conversion of their return values.
+`_send_motor` is where the motor commands actually reach the mailbox.
+'''
+DRIVER_CHANNELS = {
+    "get_axis": ([("axis", "f4", (9,))], lambda d, r, a: (r,)),
+    "get_eul": ([("eul", "f4", (3,))], lambda d, r, a: (r,)),
+    "get_qua": ([("qua", "f4", (4,))], lambda d, r, a: (r,)),
+    "read_lt_data": ([("digital", "i1", (2,)), ("analog", "f4", (2,))],
+                     lambda d, r, a: (r[:2], r[2:])),
+    "get_distance": ([("distance", "i4")], lambda d, r, a: (r,)),
+    "read_gesture": ([("gesture", "U8")], lambda d, r, a: (r or "",)),
+    "read_odometry_delta": ([("ticks", "i4", (2,)), ("meters", "f8", (2,))],
+                            lambda d, r, a: (r[:2], r[2:])),
+    "_send_motor": ([("command", "u1"), ("args", "i4", (4,))],
+                    lambda d, r, a: _motor_record(a[0][0], a[1])),
+    "update": ([("position", "f8", (3,)), ("yaw", "f8")],
+               lambda d, r, a: (d.position, d.yaw))}
+
+
+class Channel(object):
+    """This class buffers the records of one telemetry channel.
+
+    Records are copied into a preallocated chunk; full chunks are handed
+    to the writer thread of the recorder, so that recording never waits
+    for the disk.
+
+    Attributes
+    ----------
+    name : str
+        The name of the channel, e.g. "RUN_IMU.get_qua".
+    dtype : numpy.dtype
+        The record dtype; its first field is the timestamp.
+    count : int
+        Number of records written to the channel.
+
+    """
+    def __init__(self, recorder, index, name, dtype):
+        self.name = name
+        self.dtype = dtype
+        self.count = 0
+        self._recorder = recorder
+        self._index = index
+        self._lock = threading.Lock()
+        self._chunk = np.empty(recorder.chunk_size, dtype)
+        self._used = 0
+
+    def record(self, *values, timestamp=None):
+        """Append a record to the channel.
+
+        Parameters
+        ----------
+        values : list
+            The values of the fields after the timestamp.
+        timestamp : float
+            The time of the record; `time.monotonic()` by default.
+
+        Returns
+        -------
+        None
+
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock:
+            self._chunk[self._used] = (timestamp,) + values
+            self._used += 1
+            self.count += 1
+            if self._used == len(self._chunk):
+                self._hand_over()
+
+    def flush(self):
+        """Hand the records buffered so far to the writer thread.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._lock:
+            if self._used:
+                self._hand_over()
+
+    def _hand_over(self):
+        self._recorder._queue.put((self._index, self._chunk[:self._used]))
+        self._chunk = np.empty(len(self._chunk), self.dtype)
+        self._used = 0
+
+
+class TelemetryRecorder(object):
+    """This class records timestamped telemetry to a binary log.
+
+    Channels are declared with `channel`, or created for the sensor reads
+    and motor commands of a driver with `attach`. A background thread
+    writes the full chunks, so the control loop only pays for copying a
+    record into memory.
+
+    Attributes
+    ----------
+    path : str
+        The log file.
+    chunk_size : int
+        Number of records per chunk.
+    compress : bool
+        Whether the chunks are compressed with zlib.
+    channels : dict
+        The channels, by name.
+    error : Exception
+        The exception that stopped the writer thread, if any.
+
+    """
+    def __init__(self, path, chunk_size=1024, compress=False):
+        """Return a new instance of a telemetry recorder object.
+
+        A new log is created at `path`; an existing log is appended to,
+        after dropping a partial chunk at its end.
+
+        Parameters
+        ----------
+        path : str
+            The log file.
+        chunk_size : int
+            Number of records per chunk.
+        compress : bool
+            Whether to compress the chunks with zlib.
+
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk size should be at least 1.")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.channels = {}
+        self.error = None
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._declared = {}
+        else:
+            reader = TelemetryReader(path)
+            self._declared, end = reader.declared, reader.end
+            del reader
+            self._file.truncate(end)
+        self._next_index = len(self._declared)
+        self._attached = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def channel(self, name, fields):
+        """Declare a channel, or get it when it exists.
+
+        Parameters
+        ----------
+        name : str
+            The name of the channel.
+        fields : list
+            The NumPy fields of the records after the timestamp, e.g.
+            `[("qua", "f4", (4,))]`.
+
+        Returns
+        -------
+        Channel
+            The channel to record to.
+
+        """
+        if name in self.channels:
+            return self.channels[name]
+        dtype = np.dtype([("timestamp", "f8")] + list(fields))
+        if name in self._declared:
+            index, declared = self._declared[name]
+            if declared != dtype:
+                raise ValueError("channel {} is already declared with "
+                                 "other fields.".format(name))
+        else:
+            index = self._next_index
+            self._next_index += 1
+            declaration = json.dumps({"name": name, "dtype": dtype.descr})
+            self._queue.put((index, declaration.encode()))
+        channel = Channel(self, index, name, dtype)
+        self.channels[name] = channel
+        return channel
+
+    def attach(self, driver, methods=None):
+        """Record the results of the methods of a driver.
+
+        Each method is wrapped on the driver instance, so that every call
+        records its result to the channel "<driver class>.<method>".
+        Motor commands are recorded when they are sent to the mailbox,
+        after coalescing. An Odometry records its pose on each update.
+
+        Parameters
+        ----------
+        driver : object
+            The driver, e.g. RUN_IMU, Run_LT or Odometry.
+        methods : list
+            The methods to record; all those of `DRIVER_CHANNELS` the
+            driver has by default.
+
+        Returns
+        -------
+        None
+
+        """
+        if methods is None:
+            methods = [m for m in DRIVER_CHANNELS if hasattr(driver, m)]
+        for method in methods:
+            fields, convert = DRIVER_CHANNELS[method]
+            name = "{}.{}".format(type(driver).__name__, method)
+            wrapper = self._wrap(driver, getattr(driver, method), convert,
+                                 self.channel(name, fields))
+            setattr(driver, method, wrapper)
+            self._attached.append((driver, method))
+
+    def detach(self):
+        """Stop recording the methods of the attached drivers.
+
+        Returns
+        -------
+        None
+
+        """
+        for driver, method in self._attached:
+            delattr(driver, method)
+        self._attached = []
+
+    @staticmethod
+    def _wrap(driver, function, convert, channel):
+        @functools.wraps(function)
+        def method(*args, **kwargs):
+            result = function(*args, **kwargs)
+            channel.record(*convert(driver, result, args))
+            return result
+        return method
+
+    def flush(self):
+        """Write all the records buffered so far.
+
+        Returns
+        -------
+        None
+
+        """
+        for channel in list(self.channels.values()):
+            channel.flush()
+        self._queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """Write the buffered records, detach and close the log.
+
+        Returns
+        -------
+        None
+
+        """
+        self.detach()
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    self._write(*item)
+            except Exception as e:
+                self.error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, index, data):
+        if isinstance(data, bytes):
+            kind, count, payload = CHUNK_CHANNEL, 0, data
+        else:
+            count, payload = len(data), data.tobytes()
+            kind = CHUNK_RECORDS
+            if self.compress:
+                kind, payload = CHUNK_ZLIB, zlib.compress(payload)
+        self._file.write(CHUNK_HEADER.pack(kind, index, count, len(payload)))
+        self._file.write(payload)
+        self._file.flush()
+
+
+class TelemetryReader(object):
+    """This class reads a telemetry log.
+
+    The log is memory mapped: uncompressed records are returned as views
+    of the file, without copying them.
+
+    Attributes
+    ----------
+    path : str
+        The log file.
+    channels : dict
+        The record dtype of each channel, by name.
+    declared : dict
+        The index and the record dtype of each channel, by name.
+    end : int
+        The offset of the end of the last whole chunk.
+
+    """
+    def __init__(self, path):
+        """Return a new instance of a telemetry reader object.
+
+        Parameters
+        ----------
+        path : str
+            The log file.
+
+        """
+        self.path = path
+        self.channels = {}
+        self.declared = {}
+        self._names = {}
+        self._chunks = {}
+        self._map = np.memmap(path, np.uint8, "r")
+        if bytes(self._map[:len(MAGIC)]) != MAGIC:
+            raise ValueError("{} is not a telemetry log.".format(path))
+        offset = len(MAGIC)
+        while offset + CHUNK_HEADER.size <= len(self._map):
+            kind, index, count, size = CHUNK_HEADER.unpack(
+                bytes(self._map[offset:offset + CHUNK_HEADER.size]))
+            start = offset + CHUNK_HEADER.size
+            if start + size > len(self._map):
+                break
+            if kind == CHUNK_CHANNEL:
+                info = json.loads(bytes(self._map[start:start + size]))
+                dtype = np.dtype([tuple(field) for field in info["dtype"]])
+                self.channels[info["name"]] = dtype
+                self.declared[info["name"]] = (index, dtype)
+                self._names[index] = info["name"]
+                self._chunks[info["name"]] = []
+            elif index in self._names:
+                name = self._names[index]
+                self._chunks[name].append((kind, start, size, count))
+            offset = start + size
+        self.end = offset
+
+    def chunks(self, name):
+        """Iterate over the chunks of records of a channel.
+
+        Parameters
+        ----------
+        name : str
+            The name of the channel.
+
+        Returns
+        -------
+        generator
+            The record arrays, memory mapped when not compressed.
+
+        """
+        dtype = self.channels[name]
+        for kind, start, size, count in self._chunks[name]:
+            payload = self._map[start:start + size]
+            if kind == CHUNK_ZLIB:
+                yield np.frombuffer(zlib.decompress(bytes(payload)), dtype)
+            else:
+                yield payload.view(dtype)
+
+    def read(self, name):
+        """Read all the records of a channel.
+
+        Parameters
+        ----------
+        name : str
+            The name of the channel.
+
+        Returns
+        -------
+        numpy.ndarray
+            The records in the order they were written.
+
+        """
+        chunks = list(self.chunks(name))
+        if len(chunks) == 1:
+            return chunks[0]
+        if not chunks:
+            return np.empty(0, self.channels[name])
+        return np.concatenate(chunks)
@@ -0,0 +1,54 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import pytest
+from pynq.lib.arduino import Automoto
+
+
+__author__ = "zou cong"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+def test_odometry_shared_by_drivers(sim, clock):
+    first = Automoto({})
+    second = Automoto({})
+    assert first.mailbox is not second.mailbox
+    first.move("FORWARD", 40)
+    clock.advance(0.5)
+    assert second.read_odometry_delta()[2] == pytest.approx(0.1, abs=1e-3)
+    clock.advance(0.5)
+    first.distance(1, 1)
+    first.distance(1, 2)
+    clock.advance(0.25)
+    left, right, left_m, right_m = second.read_odometry_delta()
+    assert left == int(sim.ticks[0]) and right == int(sim.ticks[1])
+    assert left_m == pytest.approx(0.05, abs=1e-3)
+    assert right_m == pytest.approx(0.05, abs=1e-3)
+    assert first.read_odometry_delta()[:2] == [0, 0]
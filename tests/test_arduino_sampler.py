@@ -0,0 +1,68 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import time
+from pynq.lib.arduino import IMUSampler
+from pynq.lib.arduino import TenDOF_IMU
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+def wait_stopped(worker, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while worker.running and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return not worker.running
+
+
+class FlakyIMU(TenDOF_IMU):
+    failing = True
+
+    def get_qua(self):
+        if self.failing:
+            raise IOError("IMU read failed.")
+        return TenDOF_IMU.get_qua(self)
+
+
+def test_sampler_restarts_after_error(sim):
+    imu = FlakyIMU({}, 1)
+    sampler = IMUSampler(imu, rate=1000, fields=("qua",))
+    sampler.start()
+    assert wait_stopped(sampler)
+    assert isinstance(sampler.error, IOError)
+    imu.failing = False
+    with sampler:
+        while sampler.buffer.count < 3:
+            time.sleep(0.001)
+    assert sampler.error is None
+    assert not sampler.running
+    assert sampler.latest()["qua"].tolist() == [1.0, 0.0, 0.0, 0.0]
@@ -0,0 +1,136 @@
+#   Copyright (c) 2019, Xilinx, Inc.
+#   All rights reserved.
+#
+#   Redistribution and use in source and binary forms, with or without
+#   modification, are permitted provided that the following conditions are met:
+#
+#   1.  Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#   2.  Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#   3.  Neither the name of the copyright holder nor the names of its
+#       contributors may be used to endorse or promote products derived from
+#       this software without specific prior written permission.
+#
+#   THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#   AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+#   THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+#   PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+#   CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+#   EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+#   PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+#   OR BUSINESS INTERRUPTION). HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#   WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+#   OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+#   ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import pytest
+from pynq.lib.arduino import Automoto
+from pynq.lib.arduino import Gesture_sen
+from pynq.lib.arduino import LT_sen
+from pynq.lib.arduino import Run_gesture
+from pynq.lib.arduino import Run_LT
+from pynq.lib.arduino import Run_usranger
+from pynq.lib.arduino import RUN_IMU
+from pynq.lib.arduino import TenDOF_IMU
+
+
+__author__ = "Junhong Lin"
+__copyright__ = "Copyright 2019, Xilinx"
+
+
+MOTOR_DRIVERS = [lambda: Automoto({}), lambda: Run_LT({}),
+                 lambda: Run_usranger({}), lambda: Run_gesture({}, 1),
+                 lambda: RUN_IMU({}, 1)]
+
+
+@pytest.mark.parametrize("driver", MOTOR_DRIVERS)
+def test_move_stop(sim, clock, driver):
+    car = driver()
+    assert sim.commands["CONFIG_IOP_SWITCH"] == len(car.mailbox.config)
+    car.move("FORWARD", 50)
+    clock.advance(1.0)
+    car.stop()
+    assert sim.commands["MOVE"] == 1
+    assert sim.commands["STOP"] == 1
+    assert sim.x == pytest.approx(0.25)
+    assert sim.y == pytest.approx(0.0)
+    clock.advance(1.0)
+    sim.update()
+    assert sim.x == pytest.approx(0.25)
+
+
+@pytest.mark.parametrize("driver", MOTOR_DRIVERS)
+def test_odometry(sim, clock, driver):
+    car = driver()
+    car.move("FORWARD", 40)
+    clock.advance(0.5)
+    left, right, left_m, right_m = car.read_odometry_delta()
+    assert left == int(sim.ticks[0]) and right == int(sim.ticks[1])
+    assert left_m == pytest.approx(0.1, abs=1e-3)
+    assert right_m == pytest.approx(0.1, abs=1e-3)
+    assert car.read_odometry_delta()[:2] == [0, 0]
+    assert car.distance(1, 1) == pytest.approx(0.1, abs=1e-3)
+    assert sim.ticks[0] == 0.0
+    assert car.read_odometry_delta()[:2] == [0, 0]
+    assert sim.commands["DISTANCE"] == 7
+
+
+def test_shared_program_is_configured_once(sim):
+    first = Automoto({})
+    second = Automoto({})
+    assert first.mailbox.microblaze is second.mailbox.microblaze
+    assert sim.commands["CONFIG_IOP_SWITCH"] == 1
+
+
+def test_line_tracker(sim):
+    for tracker in (Run_LT({}), LT_sen({})):
+        assert tracker.read_lt_data() == [0, 0, 0.39, 0.39]
+    sim.track = lambda x: 0.015
+    assert Run_LT({}).read_lt_data()[0] == 1
+    assert sim.commands["READ_LT_DATA"] == 3
+
+
+def test_ranger(sim, clock):
+    ranger = Run_usranger({})
+    assert ranger.get_distance() == 200
+    ranger.move("FORWARD", 100)
+    clock.advance(1.0)
+    assert ranger.get_distance() == 150
+    assert sim.commands["GET_DISTANCE"] == 2
+
+
+def test_gesture(sim):
+    for sensor in (Run_gesture({}, 1), Gesture_sen({}, 1)):
+        assert sensor.read_gesture() is None
+        sim.push_gesture(3)
+        assert sensor.read_gesture() == "UP"
+    assert sim.commands["READ_GESTURE"] == 4
+
+
+@pytest.mark.parametrize("driver", [lambda: TenDOF_IMU({}, 1),
+                                    lambda: RUN_IMU({}, 1)])
+def test_imu(sim, driver):
+    imu = driver()
+    assert imu.get_axis() == [0.0, 0.0, 1.0, 0.0, 0.0, 0.0,
+                              40.0, 0.0, -30.0]
+    assert imu.get_eul() == [0.0, 0.0, 0.0]
+    assert imu.get_qua() == [1.0, 0.0, 0.0, 0.0]
+    assert imu.get_temperature() == 25.0
+    assert imu.get_pressure() == 101325
+    assert sim.commands["GET_AXIS_DATA"] == 1
+    assert sim.commands["GET_QUA_DATA"] == 1
+
+
+def test_run_imu_pages(sim, clock):
+    car = RUN_IMU({}, 1)
+    pages = sim.commands["PAGE"]
+    car.move("LEFT_R", 50)
+    clock.advance(1.0)
+    assert car.get_qua()[3] > 0
+    car.stop()
+    assert sim.commands["PAGE"] - pages == 2